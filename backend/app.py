@@ -52,8 +52,8 @@ def create_app() -> Flask:
         resources={r"/api/*": {"origins": cors_origin}},
         supports_credentials=False,  # flip to True only if you use browser cookies
         methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-        allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-        expose_headers=["Content-Type", "Authorization"],
+        allow_headers=["Content-Type", "Authorization", "X-Requested-With", "If-None-Match"],
+        expose_headers=["Content-Type", "Authorization", "ETag"],
         max_age=600,
     )
 
@@ -64,6 +64,10 @@ def create_app() -> Flask:
             # Flask-CORS will add the appropriate headers
             return app.make_default_options_response()
 
+    # -------- Response compression (Accept-Encoding) --------
+    from . import compression
+    compression.init_app(app)
+
     # -------- DB init (won't crash the app if it fails) --------
     try:
         from .database import init_db
@@ -84,6 +88,7 @@ def create_app() -> Flask:
     from .routes.goals import goals_bp
     from .routes.settings import settings_bp
     from .routes.notifications import notifications_bp
+    from .routes.admin import admin_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(tx_bp)
@@ -92,6 +97,7 @@ def create_app() -> Flask:
     app.register_blueprint(goals_bp)
     app.register_blueprint(settings_bp)
     app.register_blueprint(notifications_bp)
+    app.register_blueprint(admin_bp)
 
     # -------- Health & root --------
     @app.get("/api/health")
@@ -114,10 +120,29 @@ def create_app() -> Flask:
     def not_found(e):
         return jsonify({"ok": False, "error": "Not found"}), 404
 
+    import sqlite3
+    from .database import PoolTimeout, DatabaseBusy, is_query_timeout
+
+    @app.errorhandler(PoolTimeout)
+    @app.errorhandler(DatabaseBusy)
+    def db_pool_exhausted(e):
+        resp = jsonify({"ok": False, "error": "Server busy, please retry"})
+        resp.headers["Retry-After"] = "1"
+        return resp, 503
+
     @app.errorhandler(500)
     def server_error(e):
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
+    @app.errorhandler(sqlite3.OperationalError)
+    def db_operational_error(e):
+        if not is_query_timeout(e):
+            app.logger.exception("Database error")
+            return server_error(e)
+        resp = jsonify({"ok": False, "error": "Request took too long, please retry"})
+        resp.headers["Retry-After"] = "5"
+        return resp, 504
+
     # Helpful log on startup
     print("\n[CORS] Allowed origins:", sorted(list(allowed)), "\n")
     return app
@@ -0,0 +1,294 @@
+# backend/archive.py
+"""
+Hot/cold tiering for transactions.
+
+Transactions older than ARCHIVE_AFTER_DAYS can be moved out of a database
+file into a separate SQLite file (`<db>-archive.db`, next to it or in
+MONEYMATE_ARCHIVE_DIR), so the hot file and its per-user indexes only
+carry recent history:
+
+    python -m backend.archive [--days N]
+
+The rollup tables stay in the hot database and keep counting archived rows
+(the move re-adds what the delete triggers subtract), so totals, summaries
+and time series never touch the archive. Raw-row readers call `source()`
+(or `tiers()`), which ATTACH the archive and add it only when the requested
+range starts before `archive_state.archived_before`. Archived rows are read-only
+in place: update/delete `restore()` them into the hot table first, in the
+same write transaction, and a delete then `forget()`s the archive copy.
+Nothing in the request path writes the cold file - readers skip archive
+rows that have a hot copy or a tombstone, and the next archive run drops
+them - so a failed request or a crash never leaves a row in neither tier
+or visible twice.
+"""
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+from .utils.dates import days_ago_ts
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+MIN_ARCHIVE_DAYS = 62  # insights (30 days) and budgets (this month) read only the hot tier
+SCHEMA = "archive"
+
+COLS = "id, user_id, type, amount_cents, category_id, description, created_at, ts, month"
+
+# Cold copy of `transactions`: no foreign keys (they can't cross files) and no
+# AUTOINCREMENT (ids are assigned by the hot table). Same indexes, so the
+# archive side of a union plans like the hot side.
+ARCHIVE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.transactions (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        description TEXT,
+        created_at TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        month INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_tx_user_ts ON transactions(user_id, ts);
+    CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_tx_user_type ON transactions(user_id, type);
+    CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_tx_user_cat_ts ON transactions(user_id, category_id, ts);
+    CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_tx_user_amount ON transactions(user_id, amount_cents);
+"""
+
+# The archive as readers see it: bounded by the watermark read in the same
+# statement, so a reader never sees rows an unfinished run copied, and
+# without rows restored to the hot table or deleted since (primary-key
+# probes into main). The watermark is a filter, not an index bound (+ts):
+# it only trims leftovers, and as a range it would outbid the index that
+# gives a page its order.
+VISIBLE = f"""(
+    SELECT {COLS} FROM {SCHEMA}.transactions a
+    WHERE +ts < (SELECT archived_before FROM main.archive_state WHERE id = 1)
+      AND NOT EXISTS (SELECT 1 FROM main.transactions h WHERE h.id = a.id)
+      AND NOT EXISTS (SELECT 1 FROM main.archive_deleted d WHERE d.id = a.id)
+)"""
+
+# Both tiers as one relation
+UNION = f"""(
+    SELECT {COLS} FROM main.transactions
+    UNION ALL
+    SELECT * FROM {VISIBLE}
+)"""
+
+# Run before deleting moved rows: the delete triggers then take back exactly
+# this, leaving the rollups counting archived rows.
+READD_ROLLUPS = [
+    """
+    INSERT INTO tx_monthly_rollup(user_id, month, type, category_id, total_cents, count)
+    SELECT user_id, month, type, category_id, SUM(amount_cents), COUNT(*)
+    FROM transactions WHERE ts < ?
+    GROUP BY user_id, month, type, category_id
+    ON CONFLICT(user_id, month, type, category_id)
+    DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + excluded.count
+    """,
+    """
+    INSERT INTO tx_daily_rollup(user_id, day, type, total_cents, count)
+    SELECT user_id, ts / 86400, type, SUM(amount_cents), COUNT(*)
+    FROM transactions WHERE ts < ?
+    GROUP BY user_id, ts / 86400, type
+    ON CONFLICT(user_id, day, type)
+    DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + excluded.count
+    """,
+]
+
+# Run after re-inserting a restored row: the insert triggers counted it again.
+UNROLL = [
+    """
+    UPDATE tx_monthly_rollup SET total_cents = total_cents - :amount_cents, count = count - 1
+    WHERE user_id = :user_id AND month = :month AND type = :type AND category_id = :category_id
+    """,
+    """
+    UPDATE tx_daily_rollup SET total_cents = total_cents - :amount_cents, count = count - 1
+    WHERE user_id = :user_id AND day = :ts / 86400 AND type = :type
+    """,
+]
+
+
+def _main_path(db) -> Path:
+    for _, name, file in db.execute("PRAGMA database_list").fetchall():
+        if name == "main":
+            return Path(file)
+    raise RuntimeError("connection has no main database")
+
+
+def archive_file(main: Path) -> Path:
+    """The cold file paired with database file `main` (each shard has its own)."""
+    main = Path(main)
+    folder = Path(os.getenv("MONEYMATE_ARCHIVE_DIR") or main.parent)
+    return folder / f"{main.stem}-archive{main.suffix}"
+
+
+def archive_path(db) -> Path:
+    """The cold file paired with db's main database."""
+    return archive_file(_main_path(db))
+
+
+def archived_before(db) -> int:
+    """Watermark: every archived row has ts < this (0 = nothing archived)."""
+    row = db.execute("SELECT archived_before FROM archive_state WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def attach(db) -> bool:
+    """
+    ATTACH the archive to db (read-only for read-only connections) unless
+    it already is. Must run outside a transaction. False if there is no
+    archive file.
+    """
+    if any(r[1] == SCHEMA for r in db.execute("PRAGMA database_list").fetchall()):
+        return True
+    path = archive_path(db)
+    if not path.exists():
+        return False
+    if db.execute("PRAGMA query_only").fetchone()[0]:
+        db.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (f"{path.resolve().as_uri()}?mode=ro",))
+    else:
+        db.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (str(path),))
+    return True
+
+
+def source(db, start_ts=None) -> str:
+    """
+    FROM-clause text for raw transaction reads from start_ts on (None = all
+    history): the hot table alone, or both tiers when the range reaches the
+    archive. Use it like a table name: f"FROM {source(db, lo)} t". Attaches
+    the archive on demand, so call it before opening a write transaction.
+    """
+    wm = archived_before(db)
+    if not wm or (start_ts is not None and start_ts >= wm) or not attach(db):
+        return "transactions"
+    return UNION
+
+
+def tiers(db, start_ts=None) -> list:
+    """
+    Like source(), but one relation per tier, for ORDER BY ... LIMIT reads:
+    SQLite sorts the whole of a UNION, while running the query once per tier
+    and merging keeps each side an index-ordered range scan.
+    """
+    if source(db, start_ts) == "transactions":
+        return ["transactions"]
+    return ["main.transactions", VISIBLE]
+
+
+def cold(db):
+    """Connection straight to db's archive file (caller closes), or None if there is none."""
+    path = archive_path(db)
+    if not path.exists():
+        return None
+    from .database import BUSY_TIMEOUT_MS
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def restore(db, user_id, txn_id) -> bool:
+    """
+    Copy one archived transaction back into the hot table so it can be
+    updated or deleted like any other; True if it was copied. db is in the
+    caller's write transaction (a run_write fn), so the copy commits or
+    rolls back with the change that needed it. The archive copy stays,
+    hidden by VISIBLE, until the next archive run.
+    """
+    wm = archived_before(db)
+    if not wm or db.execute(
+        "SELECT 1 FROM transactions WHERE id = ? AND user_id = ?", (txn_id, user_id)
+    ).fetchone():
+        return False
+    c = cold(db)
+    if c is None:
+        return False
+    with closing(c):
+        row = c.execute(
+            f"SELECT {COLS} FROM transactions WHERE id = ? AND user_id = ? AND ts < ?",
+            (txn_id, user_id, wm),
+        ).fetchone()
+    if row is None or db.execute("SELECT 1 FROM archive_deleted WHERE id = ?", (txn_id,)).fetchone():
+        return False
+    db.execute(f"INSERT INTO transactions ({COLS}) VALUES ({', '.join('?' * len(row.keys()))})", tuple(row))
+    for sql in UNROLL:
+        db.execute(sql, dict(row))
+    return True
+
+
+def forget(db, txn_id):
+    """After deleting a restored row (same transaction): hide its archive copy for good."""
+    db.execute("INSERT OR IGNORE INTO archive_deleted(id) VALUES (?)", (txn_id,))
+
+
+def archive_old(path=None, days=ARCHIVE_AFTER_DAYS) -> dict:
+    """
+    Move transactions older than `days` (at least MIN_ARCHIVE_DAYS) into the
+    archive file and advance the watermark.
+
+    SQLite only commits multi-file transactions atomically in rollback-journal
+    mode, and the hot file is WAL, so this runs as two transactions: `hot`
+    holds the hot write lock throughout (no request can change the rows
+    being moved), `mover` copies them into the archive and commits, then
+    `hot` deletes them and advances the watermark. Readers ignore archive
+    rows at or above the watermark, so a crash between the two commits
+    leaves invisible copies that the next run discards.
+    """
+    from .database import DB_PATH, _connect
+
+    path = Path(path or DB_PATH)
+    cutoff = days_ago_ts(max(days, MIN_ARCHIVE_DAYS))
+    with closing(_connect(path)) as hot, closing(_connect(path)) as mover:
+        hot.isolation_level = mover.isolation_level = None
+        mover.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (str(archive_path(mover)),))
+        for stmt in ARCHIVE_DDL.split(";"):
+            if stmt.strip():
+                mover.execute(stmt)
+
+        hot.execute("BEGIN IMMEDIATE")
+        try:
+            wm = archived_before(hot)
+            cutoff = max(cutoff, wm)
+            mover.execute("BEGIN")  # deferred: its first write locks only the archive
+            try:
+                # leftovers of an interrupted run, copies of rows restore() moved back,
+                # and rows deleted since the last run
+                mover.execute(f"DELETE FROM {SCHEMA}.transactions WHERE ts >= ?", (wm,))
+                mover.execute(f"DELETE FROM {SCHEMA}.transactions WHERE id IN "
+                              f"(SELECT id FROM main.transactions)")
+                mover.execute(f"DELETE FROM {SCHEMA}.transactions WHERE id IN "
+                              f"(SELECT id FROM main.archive_deleted)")
+                moved = mover.execute(
+                    f"INSERT INTO {SCHEMA}.transactions ({COLS}) "
+                    f"SELECT {COLS} FROM main.transactions WHERE ts < ?", (cutoff,)
+                ).rowcount
+                mover.execute("COMMIT")
+            except Exception:
+                mover.execute("ROLLBACK")
+                raise
+
+            for sql in READD_ROLLUPS:
+                hot.execute(sql, (cutoff,))
+            hot.execute("DELETE FROM transactions WHERE ts < ?", (cutoff,))
+            hot.execute("DELETE FROM archive_deleted")  # their archive rows are gone now
+            hot.execute("UPDATE archive_state SET archived_before = ? WHERE id = 1", (cutoff,))
+            hot.execute("COMMIT")
+        except Exception:
+            if hot.in_transaction:
+                hot.execute("ROLLBACK")
+            raise
+    return {"moved": moved, "archived_before": cutoff}
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import migrate_all, shard_paths
+
+    ap = argparse.ArgumentParser(description="Move old MoneyMate transactions into the archive file.")
+    ap.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                    help=f"archive rows older than this many days (min {MIN_ARCHIVE_DAYS})")
+    args = ap.parse_args()
+
+    migrate_all()
+    for path in shard_paths():
+        print(f"[DB] Archived {path.name}: {archive_old(path, days=args.days)}")
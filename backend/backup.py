@@ -0,0 +1,171 @@
+# backend/backup.py
+"""
+Online backups of the live database files.
+
+Copying moneymate.db (or a shard) by hand is unsafe under WAL. This uses
+SQLite's backup API instead: the source connection pins one read snapshot
+for the whole copy - a WAL reader never blocks writers, and with the
+snapshot pinned the copy never restarts because of them - and pages are
+copied DB_BACKUP_PAGES at a time with a DB_BACKUP_SLEEP_MS pause between
+steps, so a backup only trickles I/O next to user traffic.
+
+Every run writes one folder, `<out>/<UTC timestamp>/`, holding a copy of
+every database file (global, shards, archives), gzipped on request:
+
+    python -m backend.backup [--out DIR] [--gzip]
+    POST /api/admin/backup   (into DB_BACKUP_DIR; GET it for progress)
+
+Each file is a consistent snapshot of itself; files are copied one after
+another, not as one cross-file snapshot.
+"""
+import gzip
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import archive, database
+from .database import _connect, _env_int, shard_paths
+
+BACKUP_DIR = os.getenv("DB_BACKUP_DIR", "")                 # default: <db dir>/backups
+BACKUP_PAGES = _env_int("DB_BACKUP_PAGES", 256)             # pages copied per step
+BACKUP_SLEEP_MS = _env_int("DB_BACKUP_SLEEP_MS", 10)        # pause between steps
+GZIP_CHUNK = 1 << 20
+
+
+def backup_dir() -> Path:
+    return Path(BACKUP_DIR or Path(database.DB_PATH).parent / "backups")
+
+
+def backup_files() -> list:
+    """Every existing database file: global/shard files, each followed by its archive."""
+    files = []
+    for p in shard_paths():
+        files += [f for f in (p, archive.archive_file(p)) if f.exists()]
+    return files
+
+
+def backup_file(src, dest, compress=False, pages=BACKUP_PAGES, sleep_ms=BACKUP_SLEEP_MS, progress=None) -> dict:
+    """
+    Copy database file `src` to `dest` (+ ".gz" if compress) from one read
+    snapshot. progress(done_pages, total_pages) is called after every step.
+    """
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    started = time.monotonic()
+    with closing(_connect(src, readonly=True)) as source, closing(sqlite3.connect(part)) as target:
+        source.isolation_level = None
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # pins the snapshot
+        page_size = source.execute("PRAGMA page_size").fetchone()[0]
+
+        def step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            if remaining and sleep_ms:
+                time.sleep(sleep_ms / 1000)  # let user traffic have the disk
+
+        source.backup(target, pages=max(1, pages), progress=step)
+        total = target.execute("PRAGMA page_count").fetchone()[0]
+        source.execute("COMMIT")
+    copied = time.monotonic() - started
+
+    if compress:
+        dest = dest.with_name(dest.name + ".gz")
+        with open(part, "rb") as fin, gzip.open(dest, "wb", compresslevel=6) as fout:
+            while chunk := fin.read(GZIP_CHUNK):
+                fout.write(chunk)
+                if sleep_ms:
+                    time.sleep(sleep_ms / 1000)
+        part.unlink()
+    else:
+        os.replace(part, dest)
+    elapsed = time.monotonic() - started
+
+    size = total * page_size
+    return {
+        "source": str(src),
+        "path": str(dest),
+        "pages": total,
+        "bytes": size,
+        "written_bytes": dest.stat().st_size,
+        "seconds": round(elapsed, 3),
+        "copy_mb_per_s": round(size / 1e6 / copied, 2) if copied else None,
+    }
+
+
+def backup_all(out_dir=None, compress=False, progress=None) -> list:
+    """Back up every database file into a fresh timestamped folder under out_dir."""
+    folder = Path(out_dir or backup_dir()) / datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    results = []
+    for path in backup_files():
+        cb = (lambda done, total, name=path.name: progress(name, done, total)) if progress else None
+        results.append(backup_file(path, folder / path.name, compress=compress, progress=cb))
+    return results
+
+
+# ---------- background job (admin endpoint) ----------
+_lock = threading.Lock()
+_job = {}
+
+
+def _run_job(compress):
+    def progress(name, done, total):
+        with _lock:
+            _job.update(file=name, pages_done=done, pages_total=total)
+
+    try:
+        results = backup_all(compress=compress, progress=progress)
+        with _lock:
+            _job.update(state="done", files=results)
+    except Exception as e:
+        with _lock:
+            _job.update(state="failed", error=repr(e))
+    finally:
+        with _lock:
+            _job["finished_at"] = time.time()
+
+
+def start(compress=False):
+    """Start a backup in this process's background; -> its status, or None if one is running."""
+    with _lock:
+        if _job.get("state") == "running":
+            return None
+        _job.clear()
+        _job.update(state="running", compress=compress, started_at=time.time(),
+                    file=None, pages_done=0, pages_total=0)
+    threading.Thread(target=_run_job, args=(compress,), name="db-backup", daemon=True).start()
+    return status()
+
+
+def status() -> dict:
+    """The latest backup started by this process (empty if none)."""
+    with _lock:
+        job = dict(_job)
+    if job:
+        job["elapsed_s"] = round((job.get("finished_at") or time.time()) - job["started_at"], 3)
+    return job
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Online backup of every MoneyMate database file.")
+    ap.add_argument("--out", default=None, help=f"target folder (default {backup_dir()})")
+    ap.add_argument("--gzip", action="store_true", help="gzip each copy")
+    args = ap.parse_args()
+
+    last = {}
+
+    def report(name, done, total):
+        if done == total or time.monotonic() - last.get(name, 0) > 1:
+            last[name] = time.monotonic()
+            print(f"[DB] {name}: {done}/{total} pages", flush=True)
+
+    for r in backup_all(args.out, compress=args.gzip, progress=report):
+        print(f"[DB] Backed up {r['source']} -> {r['path']} "
+              f"({r['bytes']} bytes in {r['seconds']}s, {r['copy_mb_per_s']} MB/s)")
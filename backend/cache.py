@@ -0,0 +1,261 @@
+# backend/cache.py
+"""
+Per-worker response cache for the dashboard's polled read endpoints.
+
+Triggers bump the user's data_versions row on every write to their rows
+(migration 13). A cached response is keyed by (endpoint, user, URL and
+query params, response format, data version, UTC date), so a write makes
+the user's older entries unreachable - they just age out of the LRU - and
+the date retires "this month"/"last 30 days" answers at midnight.
+
+The version itself is memoized per worker and re-read only when PRAGMA
+data_version says the file has seen a commit since (see coherence.py), so
+a hit on unchanged data runs no query at all, and a write by any worker is
+still noticed on the next request.
+
+With RESPONSE_CACHE_SHARED=1 a miss also looks in a small SQLite file next
+to DB_PATH before computing, and stores there too, so workers reuse each
+other's responses. Entries carry the version in their key, so a shared one
+is never stale either. Best effort: any error there is a miss.
+
+    RESPONSE_CACHE_SIZE         entries kept per worker (0 turns the cache off)
+    RESPONSE_CACHE_TTL_S        longest an entry is served, in seconds
+    RESPONSE_CACHE_SHARED       1 = also use the shared file tier
+    RESPONSE_CACHE_SHARED_SIZE  entries kept in the shared file
+
+`conditional` gives a view a strong ETag built from the same key, so a
+client revalidating with If-None-Match gets a 304 before the view runs.
+
+Hit/miss counters are in /api/admin/metrics.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+
+from flask import Response, g, make_response, request
+
+from . import coherence, database, repository
+from .database import READ_METHODS, _env_float, _env_int, get_db, request_path
+from .utils import jsonfmt
+from .utils.dates import today_utc
+
+SIZE = _env_int("RESPONSE_CACHE_SIZE", 2048)
+TTL_S = _env_float("RESPONSE_CACHE_TTL_S", 300.0)
+SHARED = os.getenv("RESPONSE_CACHE_SHARED", "0").lower() in ("1", "true", "yes", "on") and not database.MEMORY
+SHARED_SIZE = _env_int("RESPONSE_CACHE_SHARED_SIZE", 20000)
+SHARED_PRUNE_EVERY = 256  # stores between prunes of the shared file
+
+_cache = OrderedDict()     # key -> (expires, body, status, headers); LRU
+_versions = OrderedDict()  # (path, user_id) -> (generation, data version); LRU
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0,
+          "version_reads": 0, "version_memo_hits": 0,
+          "shared_hits": 0, "shared_errors": 0}
+
+
+def _count(key, n=1):
+    with _lock:
+        _stats[key] += n
+
+
+def _get(key):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del _cache[key]
+            _stats["expired"] += 1
+            entry = None
+        if entry is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+        return entry
+
+
+def _put(key, body, status, headers, ttl=None):
+    with _lock:
+        _cache[key] = (time.monotonic() + (TTL_S if ttl is None else ttl), body, status, headers)
+        _cache.move_to_end(key)
+        _stats["stores"] += 1
+        while len(_cache) > SIZE:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def _key(user_id):
+    """What a cached response or its ETag depends on, for the current request."""
+    return (
+        request.endpoint, user_id, request.path, tuple(sorted(request.args.items(multi=True))),
+        jsonfmt.columnar_requested(), user_version(user_id), today_utc(),
+    )
+
+
+def user_version(user_id) -> int:
+    """The user's data version, re-read only after a commit to their file (see coherence.py)."""
+    path = request_path()
+    generation = coherence.check(path)
+    with _lock:
+        memo = _versions.get((path, user_id))
+        if memo is not None and memo[0] == generation:
+            _versions.move_to_end((path, user_id))
+            _stats["version_memo_hits"] += 1
+            return memo[1]
+    version = repository.data_version(get_db(), user_id)
+    with _lock:
+        _stats["version_reads"] += 1
+        _versions[(path, user_id)] = (generation, version)
+        _versions.move_to_end((path, user_id))
+        while len(_versions) > max(SIZE, 1):
+            _versions.popitem(last=False)
+    return version
+
+
+# ---------- shared tier (RESPONSE_CACHE_SHARED) ----------
+_shared = {"conn": None, "pid": None, "stores": 0}
+_shared_lock = threading.Lock()
+
+
+def shared_path() -> Path:
+    return Path(database.DB_PATH).with_name("response-cache.db")
+
+
+def _shared_conn():
+    if _shared["pid"] != os.getpid():
+        _shared.update(conn=None, pid=os.getpid())  # don't share handles across fork
+    if _shared["conn"] is None:
+        conn = sqlite3.connect(shared_path(), timeout=0.05, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")  # a lost entry is just a miss
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                expires REAL NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses(expires)")
+        _shared["conn"] = conn
+    return _shared["conn"]
+
+
+def _digest(key) -> str:
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def _shared_get(key):
+    try:
+        with _shared_lock:
+            row = _shared_conn().execute(
+                "SELECT expires, body, status, headers FROM responses WHERE key=? AND expires > ?",
+                (_digest(key), time.time()),
+            ).fetchone()
+    except sqlite3.Error:
+        _count("shared_errors")
+        return None
+    if row is None:
+        return None
+    _count("shared_hits")
+    return row[0] - time.time(), row[1], row[2], [tuple(h) for h in json.loads(row[3])]
+
+
+def _shared_put(key, body, status, headers):
+    try:
+        with _shared_lock:
+            conn = _shared_conn()
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO responses(key, expires, status, headers, body) VALUES (?,?,?,?,?)",
+                         (_digest(key), now + TTL_S, status, json.dumps(headers), body))
+            _shared["stores"] += 1
+            if _shared["stores"] % SHARED_PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+                conn.execute("""
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY expires DESC LIMIT -1 OFFSET ?
+                    )
+                """, (SHARED_SIZE,))
+    except sqlite3.Error:
+        _count("shared_errors")
+
+
+# ---------- API ----------
+def clear():
+    with _lock:
+        _cache.clear()
+        _versions.clear()
+
+
+def stats() -> dict:
+    with _lock:
+        s = dict(_stats, entries=len(_cache), size=SIZE, ttl_s=TTL_S, shared=SHARED)
+    lookups = s["hits"] + s["misses"]
+    s["hit_ratio"] = round(s["hits"] / lookups, 4) if lookups else None
+    s["coherence"] = coherence.stats()
+    return s
+
+
+def cached(view):
+    """
+    Serve repeat GETs of `view` from the cache while the signed-in user's
+    data version is unchanged. Only 200 responses are stored; goes under
+    @login_required.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        uid = g.get("user_id")
+        if SIZE <= 0 or TTL_S <= 0 or not uid or request.method not in READ_METHODS:
+            return view(*args, **kwargs)
+        key = _key(uid)
+        hit = _get(key)
+        if hit is None and SHARED:
+            hit = _shared_get(key)
+            if hit is not None:
+                _put(key, *hit[1:], ttl=hit[0])
+        if hit is not None:
+            _, body, status, headers = hit
+            return Response(body, status=status, headers=headers)
+        _count("misses")
+        resp = make_response(view(*args, **kwargs))
+        if resp.status_code == 200 and not resp.is_streamed:
+            headers = [(k, v) for k, v in resp.headers.items() if k.lower() != "content-length"]
+            _put(key, resp.get_data(), resp.status_code, headers)
+            if SHARED:
+                _shared_put(key, resp.get_data(), resp.status_code, headers)
+        return resp
+    return wrapper
+
+
+def conditional(view):
+    """
+    Strong ETag + If-None-Match for `view`: the tag is derived from the
+    user's data version and the request, so a matching revalidation is
+    answered 304 without running the view. Goes under @login_required,
+    above @cached.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        uid = g.get("user_id")
+        if not uid or request.method not in READ_METHODS:
+            return view(*args, **kwargs)
+        etag = _digest(_key(uid))[:32]
+        inm = request.if_none_match
+        match = etag if inm.star_tag else next(
+            (t for t in inm.as_set(include_weak=True) if t.partition("-")[0] == etag), None,
+        )  # "<etag>-gzip" etc., see compression.py
+        if match:
+            resp = Response(status=304)
+            resp.set_etag(match)
+        else:
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+            resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"  # browser may keep it, must revalidate
+        return resp
+    return wrapper
@@ -0,0 +1,84 @@
+# backend/categories.py
+"""
+Per-user category dimension.
+
+Transactions, budgets, goals and tx_monthly_rollup store an integer
+`category_id` (migration 8); names live once in `categories`. Rows are
+append-only - a name is never renamed or deleted in place, and ids are
+AUTOINCREMENT so they are never reused - which makes id <-> name pairs
+immutable and safe to cache per process without invalidation. An id the
+cache hasn't seen yet (created by another worker) simply triggers a reload
+of that user's map.
+"""
+import threading
+from collections import OrderedDict
+
+from .database import _env_int, returning
+
+UNCATEGORIZED = "Uncategorized"
+CACHE_USERS = _env_int("CATEGORY_CACHE_USERS", 1024)  # users whose maps are kept
+
+_cache = OrderedDict()  # user_id -> ({name: id}, {id: name}); LRU by user
+_cache_lock = threading.Lock()
+
+
+def _load(db, user_id) -> tuple:
+    rows = db.execute("SELECT id, name FROM categories WHERE user_id=?", (user_id,)).fetchall()
+    maps = ({r["name"]: r["id"] for r in rows}, {r["id"]: r["name"] for r in rows})
+    # Only cache committed state: an insert from an open transaction may still roll back.
+    if not db.in_transaction:
+        with _cache_lock:
+            _cache[user_id] = maps
+            _cache.move_to_end(user_id)
+            while len(_cache) > CACHE_USERS:
+                _cache.popitem(last=False)
+    return maps
+
+
+def _cached(user_id):
+    with _cache_lock:
+        maps = _cache.get(user_id)
+        if maps is not None:
+            _cache.move_to_end(user_id)
+        return maps
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def lookup(db, user_id, name):
+    """Existing category id for `name`, or None. Never writes."""
+    name = (name or "").strip()
+    if not name:
+        return None
+    maps = _cached(user_id)
+    if maps is None or name not in maps[0]:
+        maps = _load(db, user_id)
+    return maps[0].get(name)
+
+
+def intern(db, user_id, name) -> int:
+    """Category id for `name` (blank -> Uncategorized), creating it if needed. Caller commits."""
+    name = (name or "").strip() or UNCATEGORIZED
+    cid = lookup(db, user_id, name)
+    if cid is None:
+        row = returning(
+            db,
+            "INSERT INTO categories(user_id, name) VALUES (?, ?) "
+            "ON CONFLICT(user_id, name) DO NOTHING RETURNING id",
+            (user_id, name),
+        ) or db.execute(  # lost a race with another writer
+            "SELECT id FROM categories WHERE user_id=? AND name=?", (user_id, name)
+        ).fetchone()
+        cid = row["id"]
+    return cid
+
+
+def names(db, user_id, ids=()) -> dict:
+    """{id: name} for the user; reloads once if any of `ids` is unknown."""
+    maps = _cached(user_id)
+    if maps is None or any(i is not None and i not in maps[1] for i in ids):
+        maps = _load(db, user_id)
+    return maps[1]
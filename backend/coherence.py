@@ -0,0 +1,70 @@
+# backend/coherence.py
+"""
+Cross-worker coherence for process-local caches.
+
+Each worker keeps one watcher connection per database file and asks it for
+PRAGMA data_version, which changes whenever any *other* connection has
+committed to the file - another gunicorn worker, a CLI job, the replica
+applier, or this worker's own pooled connections. That is a read of the
+WAL index header, no table access, so it is cheap enough to run on every
+request that consults a cache.
+
+`check(path)` runs it at most once per file per request and returns the
+file's generation: a per-process counter that moves on every commit seen.
+Caches tag what they memoize with the generation it was read under and
+treat anything tagged with an older one as gone. Tagging (rather than
+clearing on change) also covers a reader that memoizes after another
+request has already seen the next commit.
+
+Categories (categories.py) are append-only and need none of this.
+"""
+import os
+import threading
+from pathlib import Path
+
+from flask import g, has_request_context
+
+from .database import _connect
+
+_lock = threading.Lock()
+_watchers = {}  # path -> [conn, data_version, generation, lock]
+_pid = None
+_stats = {"checks": 0, "changes": 0}
+
+
+def _watcher(path):
+    global _pid
+    with _lock:
+        if _pid != os.getpid():  # SQLite handles don't survive fork
+            _pid = os.getpid()
+            _watchers.clear()
+        w = _watchers.get(path)
+        if w is None:
+            conn = _connect(path, readonly=True)
+            w = _watchers[path] = [conn, conn.execute("PRAGMA data_version").fetchone()[0], 0, threading.Lock()]
+        return w
+
+
+def check(path) -> int:
+    """The generation of `path` as of now (at most one data_version read per file per request)."""
+    path = Path(path)
+    seen = g.setdefault("coherence", {}) if has_request_context() else {}
+    if path in seen:
+        return seen[path]
+    w = _watcher(path)
+    changed = False
+    with w[3]:
+        version = w[0].execute("PRAGMA data_version").fetchone()[0]
+        if version != w[1]:
+            w[1], w[2], changed = version, w[2] + 1, True
+        generation = w[2]
+    with _lock:
+        _stats["checks"] += 1
+        _stats["changes"] += changed
+    seen[path] = generation
+    return generation
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats, files=len(_watchers))
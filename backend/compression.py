@@ -0,0 +1,101 @@
+# backend/compression.py
+"""
+Negotiated response compression (br when the brotli package is installed,
+then gzip, then deflate), applied in an after_request hook so every
+blueprint gets it.
+
+Only text-like bodies (JSON and +json types, CSV, text/*) of at least
+COMPRESS_MIN_SIZE bytes are compressed. Streamed responses are compressed
+chunk by chunk, each chunk flushed so the client still sees data as it is
+produced.
+
+A compressed response is a different representation, so a strong ETag
+gets the coding appended ("<tag>-gzip"); cache.conditional matches on the
+part before the dash and answers 304 with the tag the client sent.
+
+    COMPRESS_MIN_SIZE    smallest body compressed, in bytes
+    COMPRESS_LEVEL       gzip/deflate level 1-9 (0 turns compression off)
+    COMPRESS_BR_QUALITY  brotli quality 0-11
+"""
+import zlib
+
+from flask import request
+
+from .database import _env_int
+
+try:
+    import brotli
+except ImportError:  # optional; gzip/deflate cover every client
+    brotli = None
+
+MIN_SIZE = _env_int("COMPRESS_MIN_SIZE", 1024)
+LEVEL = _env_int("COMPRESS_LEVEL", 6)
+BR_QUALITY = _env_int("COMPRESS_BR_QUALITY", 5)
+
+CODINGS = (("br",) if brotli else ()) + ("gzip", "deflate")
+MIMETYPES = {"application/json", "text/csv", "application/javascript", "application/xml"}
+_WBITS = {"gzip": 31, "deflate": 15}  # gzip container / zlib stream, as HTTP names them
+
+
+class _Brotli:
+    """The slice of the zlib compressobj interface we use, over brotli.Compressor."""
+
+    def __init__(self):
+        self._c = brotli.Compressor(quality=BR_QUALITY)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self, mode=zlib.Z_FINISH):
+        return self._c.finish() if mode == zlib.Z_FINISH else self._c.flush()
+
+
+def _compressor(coding):
+    if coding == "br":
+        return _Brotli()
+    return zlib.compressobj(LEVEL, zlib.DEFLATED, _WBITS[coding])
+
+
+def _compressible(resp) -> bool:
+    m = resp.mimetype
+    return m in MIMETYPES or m.startswith("text/") or m.endswith("+json")
+
+
+def _stream(chunks, coding, close):
+    c = _compressor(coding)
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield c.compress(chunk) + c.flush(zlib.Z_SYNC_FLUSH)
+        yield c.flush(zlib.Z_FINISH)
+    finally:
+        if close:
+            close()
+
+
+def compress_response(resp):
+    if LEVEL <= 0 or not _compressible(resp) or "Content-Encoding" in resp.headers:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    coding = request.accept_encodings.best_match(CODINGS)
+    if not coding or resp.direct_passthrough or request.method == "HEAD" or resp.status_code in (204, 304):
+        return resp
+    if resp.is_streamed:
+        close = getattr(resp.response, "close", None)  # Response.close() now reaches _stream
+        resp.response = _stream(resp.iter_encoded(), coding, close)
+        resp.headers.pop("Content-Length", None)
+    else:
+        body = resp.get_data()
+        if len(body) < MIN_SIZE:
+            return resp
+        c = _compressor(coding)
+        resp.set_data(c.compress(body) + c.flush())
+    resp.headers["Content-Encoding"] = coding
+    tag, weak = resp.get_etag()
+    if tag and not weak:
+        resp.set_etag(f"{tag}-{coding}")
+    return resp
+
+
+def init_app(app):
+    app.after_request(compress_response)
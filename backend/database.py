@@ -1,43 +1,17 @@
 # backend/database.py
+import os
+import queue
+import random
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from functools import wraps
 from pathlib import Path
-from flask import g, current_app
+from flask import g, current_app, request, has_request_context
 
 DB_PATH = Path(__file__).resolve().parent / "moneymate.db"
 
-SCHEMA_SQL = """
-PRAGMA foreign_keys = ON;
-
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL,
-    email TEXT NOT NULL UNIQUE,
-    password_hash TEXT NOT NULL,
-    created_at TEXT NOT NULL DEFAULT (datetime('now'))
-);
-
-CREATE TABLE IF NOT EXISTS transactions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    type TEXT CHECK(type IN ('income','expense')) NOT NULL,
-    amount REAL NOT NULL,
-    category TEXT,
-    description TEXT,
-    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-    FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-
-CREATE TABLE IF NOT EXISTS password_resets (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    token TEXT NOT NULL UNIQUE,
-    expires_at TEXT NOT NULL,
-    used INTEGER NOT NULL DEFAULT 0,
-    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-    FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-"""
-
 PRAGMAS = [
     ("journal_mode", "WAL"),
     ("synchronous", "NORMAL"),
@@ -45,42 +19,725 @@ PRAGMAS = [
     ("foreign_keys", "ON"),
 ]
 
-def _connect():
-    db = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
+# Read-only connections: opened with URI mode=ro, and query_only makes any
+# stray write fail loudly instead of silently taking the write lock.
+READ_PRAGMAS = [
+    ("query_only", "ON"),
+    ("temp_store", "MEMORY"),
+]
+READ_METHODS = {"GET", "HEAD"}  # requests served from the read-only pool
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except Exception:
+        return default
+
+# -------- Pool config (per worker process) --------
+POOL_SIZE = _env_int("DB_POOL_SIZE", 8)              # max open connections
+POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 5.0)    # seconds to wait for a free one
+STATEMENT_CACHE = _env_int("DB_STATEMENT_CACHE", 256)  # prepared statements kept per connection
+READ_POOL_SIZE = _env_int("DB_READ_POOL_SIZE", POOL_SIZE)  # max open read-only connections
+
+# -------- Lock contention --------
+BUSY_TIMEOUT_MS = _env_int("DB_BUSY_TIMEOUT_MS", 5000)         # SQLite waits this long for a lock
+WRITE_RETRIES = _env_int("DB_WRITE_RETRIES", 3)                # extra attempts after SQLITE_BUSY
+WRITE_RETRY_BACKOFF_MS = _env_float("DB_WRITE_RETRY_BACKOFF_MS", 25.0)  # doubles per attempt, jittered
+LOCK_WAIT_BUCKETS_MS = (1, 5, 25, 100, 500, 1000, 5000)
+
+# -------- Query time budgets --------
+QUERY_BUDGET_MS = _env_int("DB_QUERY_BUDGET_MS", 10000)  # default per-request SQL budget (0 = none)
+PROGRESS_OPS = _env_int("DB_PROGRESS_OPS", 2000)         # VM instructions between deadline checks
+
+# -------- Sharding --------
+# Per-user tables (transactions, categories, budgets, goals, contributions,
+# settings, rollups) live in one of DB_SHARDS files chosen by user_id; users
+# and auth stay in the global DB_PATH, which doubles as shard 0. Change the
+# count only through `python -m backend.shards rebalance`.
+SHARDS = max(1, _env_int("DB_SHARDS", 1))
+SHARD_ID_SPAN = 1 << 40  # shard i hands out AUTOINCREMENT ids from i * SHARD_ID_SPAN
+
+# -------- Read replicas (see replication.py) --------
+# DB_ROLE=replica serves GET/HEAD from local copies shipped by the primary.
+REPLICA = os.getenv("DB_ROLE", "primary").lower() == "replica"
+# A shipping primary tails each -wal file, so its shipper must be the only
+# checkpointer: no automatic checkpoints, and a reset WAL is cut back.
+SHIPS_WAL = bool(os.getenv("DB_REPLICA_DIR")) and os.getenv("DB_ROLE", "primary").lower() == "primary"
+if SHIPS_WAL:
+    PRAGMAS += [("wal_autocheckpoint", "0"), ("journal_size_limit", str(64 << 20))]
+
+# -------- Storage engine --------
+# "sqlite": the database files on disk. "memory": each of those files is
+# stood in for by an in-memory database of the same name (SQLite's memdb
+# VFS), with the same schema, migrations and triggers - for tests and
+# benchmarks. Nothing touches the disk and it is all gone when the process
+# exits, so it is one process only (no replicas, archive or maintenance).
+ENGINE = os.getenv("DB_ENGINE", "sqlite").lower()
+if ENGINE not in ("sqlite", "memory"):
+    raise ValueError(f"DB_ENGINE must be 'sqlite' or 'memory', not {ENGINE!r}")
+MEMORY = ENGINE == "memory"
+
+# -------- Group commit (optional) --------
+GROUP_COMMIT = os.getenv("DB_GROUP_COMMIT", "0").lower() in ("1", "true", "yes", "on")
+GROUP_COMMIT_WINDOW_MS = _env_float("DB_GROUP_COMMIT_WINDOW_MS", 2.0)  # how long a batch stays open
+GROUP_COMMIT_MAX_BATCH = _env_int("DB_GROUP_COMMIT_MAX_BATCH", 64)     # writes per transaction
+
+
+class PoolTimeout(RuntimeError):
+    """No pooled connection became free within POOL_TIMEOUT."""
+
+
+class DatabaseBusy(RuntimeError):
+    """The write lock stayed busy through every retry."""
+
+
+def _is_busy(e) -> bool:
+    code = getattr(e, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(e) or "busy" in str(e)
+
+
+def _backoff(attempt: int) -> float:
+    return WRITE_RETRY_BACKOFF_MS * (2 ** attempt) * random.uniform(0.5, 1.5) / 1000
+
+
+class LockMetrics:
+    """
+    Process-wide write-lock contention: how long BEGIN IMMEDIATE waited for
+    the lock (histogram, ms), how often SQLITE_BUSY forced a retry, and how
+    often retries ran out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = [0] * (len(LOCK_WAIT_BUCKETS_MS) + 1)
+        self._c = {"transactions": 0, "busy": 0, "retries": 0, "gave_up": 0,
+                   "wait_total": 0.0, "wait_max": 0.0}
+
+    def observe_wait(self, seconds: float):
+        ms = seconds * 1000
+        i = next((i for i, b in enumerate(LOCK_WAIT_BUCKETS_MS) if ms <= b), len(LOCK_WAIT_BUCKETS_MS))
+        with self._lock:
+            self._buckets[i] += 1
+            self._c["transactions"] += 1
+            self._c["wait_total"] += seconds
+            self._c["wait_max"] = max(self._c["wait_max"], seconds)
+
+    def count(self, key: str):
+        with self._lock:
+            self._c[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            c, buckets = dict(self._c), list(self._buckets)
+        labels = [f"<={b}" for b in LOCK_WAIT_BUCKETS_MS] + [f">{LOCK_WAIT_BUCKETS_MS[-1]}"]
+        return {
+            "busy_timeout_ms": BUSY_TIMEOUT_MS,
+            "write_transactions": c["transactions"],
+            "busy_errors": c["busy"],
+            "retries": c["retries"],
+            "gave_up": c["gave_up"],
+            "lock_wait_ms_avg": round(1000 * c["wait_total"] / (c["transactions"] or 1), 3),
+            "lock_wait_ms_max": round(1000 * c["wait_max"], 3),
+            "lock_wait_ms": dict(zip(labels, buckets)),
+        }
+
+
+lock_metrics = LockMetrics()
+
+
+def is_query_timeout(e) -> bool:
+    """True if e is SQLite cancelling a statement whose query budget ran out."""
+    code = getattr(e, "sqlite_errorcode", None)
+    if code is not None:
+        return code == sqlite3.SQLITE_INTERRUPT
+    return "interrupted" in str(e)
+
+
+def _arm(conn, deadline):
+    """Have SQLite abort conn's statements (SQLITE_INTERRUPT) once `deadline` passes."""
+    if deadline is None:
+        conn.set_progress_handler(None, 0)
+    else:
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_OPS)
+
+
+def _start_budget():
+    g.query_deadline = time.monotonic() + QUERY_BUDGET_MS / 1000 if QUERY_BUDGET_MS > 0 else None
+
+
+def query_budget(ms):
+    """
+    Route decorator overriding DB_QUERY_BUDGET_MS: the view's SQL may run
+    for `ms` milliseconds from the moment it is entered. Past that, SQLite
+    cancels the running statement and the request fails with 504.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.query_deadline = time.monotonic() + ms / 1000
+            for conn, _ in g.get("db_held", {}).values():
+                _arm(conn, g.query_deadline)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _begin_immediate(conn):
+    """Take the write lock up front (so SQLite's busy handler applies) and time the wait."""
+    started = time.monotonic()
+    conn.execute("BEGIN IMMEDIATE")
+    lock_metrics.observe_wait(time.monotonic() - started)
+
+
+def _with_retry(attempt_fn):
+    """Call attempt_fn(), retrying with jittered exponential backoff on SQLITE_BUSY."""
+    attempt = 0
+    while True:
+        try:
+            return attempt_fn()
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e):
+                raise
+            lock_metrics.count("busy")
+            if attempt >= WRITE_RETRIES:
+                lock_metrics.count("gave_up")
+                raise DatabaseBusy("Database is busy, please retry") from e
+            lock_metrics.count("retries")
+            time.sleep(_backoff(attempt))
+            attempt += 1
+
+
+_memory_anchors = {}
+_memory_lock = threading.Lock()
+
+def _open(path, readonly=False, **kwargs):
+    """
+    sqlite3.connect() to database file `path` (URI mode=ro if readonly), or
+    under DB_ENGINE=memory to its in-memory stand-in. A memdb database lives
+    as long as some connection to it is open, so the first open also parks
+    an anchor connection for the life of the process.
+    """
+    path = Path(path).resolve()
+    if MEMORY:
+        uri = f"{path.as_uri()}?vfs=memdb"
+        with _memory_lock:
+            if uri not in _memory_anchors:
+                _memory_anchors[uri] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return sqlite3.connect(f"{uri}&mode=ro" if readonly else uri, uri=True, **kwargs)
+    if readonly:
+        return sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True, **kwargs)
+    return sqlite3.connect(path, **kwargs)
+
+def _connect(path=None, readonly=False):
+    db = _open(
+        path or DB_PATH,
+        readonly=readonly,
+        timeout=BUSY_TIMEOUT_MS / 1000,  # sqlite3_busy_timeout
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,  # pooled: used by one request thread at a time
+        cached_statements=STATEMENT_CACHE,
+    )
     db.row_factory = sqlite3.Row
     cur = db.cursor()
-    for k, v in PRAGMAS:
+    for k, v in (READ_PRAGMAS if readonly else PRAGMAS):
         cur.execute(f"PRAGMA {k}={v};")
     cur.close()
     return db
 
-def get_db():
-    if "db" not in g:
-        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-        g.db = _connect()
-    return g.db
+
+class ConnectionPool:
+    """
+    Thread-safe pool of warm connections to one SQLite file.
+
+    PRAGMAs run once when a connection is opened; afterwards the connection
+    (and its prepared-statement cache) is reused across requests. Idle
+    connections are handed out LIFO so the warmest one is reused first, and
+    each is health-checked on checkout. The pool is per process: after a
+    fork (gunicorn --preload) inherited connections are dropped, not reused.
+    A readonly pool opens its connections with mode=ro + query_only.
+    """
+
+    def __init__(self, path, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT, readonly=False):
+        self.path = Path(path)
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.readonly = readonly
+        self._idle = []
+        self._open = 0
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            "checkouts": 0, "reused": 0, "created": 0, "discarded": 0,
+            "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0,
+        }
+
+    def _after_fork(self):
+        # Never share SQLite handles across processes; forget them instead.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._open = 0
+
+    @staticmethod
+    def _healthy(conn) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        conn = None
+        with self._cond:
+            self._after_fork()
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1  # reserve a slot; open outside the lock
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection free after {self.timeout:.1f}s")
+                self._cond.wait(remaining)
+
+        reused = conn is not None
+        if reused and not self._healthy(conn):
+            self._close(conn)
+            conn, reused = None, False
+            with self._cond:
+                self._stats["discarded"] += 1
+        if conn is None:
+            try:
+                if not self.readonly:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                conn = _connect(self.path, self.readonly)
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            s = self._stats
+            s["checkouts"] += 1
+            s["reused" if reused else "created"] += 1
+            s["wait_total"] += waited
+            s["wait_max"] = max(s["wait_max"], waited)
+        return conn
+
+    def release(self, conn):
+        healthy = True
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                healthy = False
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if healthy:
+                self._idle.append(conn)
+            else:
+                self._open -= 1
+                self._stats["discarded"] += 1
+                self._close(conn)
+            self._cond.notify()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> dict:
+        with self._cond:
+            s = dict(self._stats)
+            idle, open_ = len(self._idle), self._open
+        checkouts = s["checkouts"] or 1
+        return {
+            "path": str(self.path),
+            "readonly": self.readonly,
+            "size": self.size,
+            "open": open_,
+            "idle": idle,
+            "in_use": open_ - idle,
+            "checkouts": s["checkouts"],
+            "reused": s["reused"],
+            "created": s["created"],
+            "discarded": s["discarded"],
+            "timeouts": s["timeouts"],
+            "reuse_ratio": round(s["reused"] / checkouts, 4),
+            "wait_ms_avg": round(1000 * s["wait_total"] / checkouts, 3),
+            "wait_ms_max": round(1000 * s["wait_max"], 3),
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=None, readonly=False) -> ConnectionPool:
+    path = Path(path or DB_PATH)
+    with _pools_lock:
+        pool = _pools.get((path, readonly))
+        if pool is None:
+            size = READ_POOL_SIZE if readonly else POOL_SIZE
+            pool = _pools[(path, readonly)] = ConnectionPool(path, size, readonly=readonly)
+        return pool
+
+def pool_stats() -> list:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [p.stats() for p in pools]
+
+def shard_of(user_id: int, shards: int = None) -> int:
+    """
+    Jump consistent hash (Lamping & Veach) of user_id onto [0, shards).
+    Growing the count from n to m only moves users onto the new shards
+    n..m-1, never between existing ones.
+    """
+    shards = shards or SHARDS
+    key, b, j = int(user_id) & 0xFFFFFFFFFFFFFFFF, -1, 0
+    while j < shards:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+def shard_path(i: int) -> Path:
+    path = Path(DB_PATH)
+    return path if i == 0 else path.with_name(f"{path.stem}-shard{i}{path.suffix}")
+
+def shard_paths(shards: int = None) -> list:
+    return [shard_path(i) for i in range(shards or SHARDS)]
+
+def user_db_path(user_id) -> Path:
+    """The file holding user_id's per-user tables."""
+    return shard_path(shard_of(user_id))
+
+def _route_path() -> Path:
+    """Where this request's queries go: the signed-in user's shard, else the global file."""
+    uid = g.get("user_id") if has_request_context() else None
+    return user_db_path(uid) if uid else Path(DB_PATH)
+
+def _request_conn(path, readonly):
+    held = g.setdefault("db_held", {})
+    key = (Path(path), readonly)
+    if key not in held:
+        pool = get_pool(path, readonly=readonly)
+        conn = pool.acquire()
+        _arm(conn, g.get("query_deadline"))
+        held[key] = (conn, pool)
+    return held[key][0]
+
+def get_db(path=None):
+    """
+    The request's connection to `path` (default: the signed-in user's
+    shard, or the global file before login): read-only for GET/HEAD
+    requests, read-write otherwise (and outside a request). Handlers that
+    must write while serving a GET ask for get_write_db() explicitly. On a
+    replica node GET/HEAD read the local copy of `path` when it is fresh.
+    """
+    if has_request_context() and request.method in READ_METHODS:
+        return _request_conn(request_path(path), readonly=True)
+    return get_write_db(path)
+
+def request_path(path=None) -> Path:
+    """The file get_db(path) reads from in this request (see get_db)."""
+    path = path or _route_path()
+    if REPLICA and has_request_context() and request.method in READ_METHODS:
+        from .replication import read_path
+        path = read_path(path)
+    return Path(path)
+
+def get_write_db(path=None):
+    return _request_conn(path or _route_path(), readonly=False)
+
+def get_global_db():
+    """The request's connection to the global file (users, password resets)."""
+    return get_db(Path(DB_PATH))
 
 def close_db(e=None):
-    db = g.pop("db", None)
-    if db is not None:
-        db.close()
+    for conn, pool in g.pop("db_held", {}).values():
+        _arm(conn, None)
+        pool.release(conn)
+
+def returning(db, sql, params=()):
+    """
+    Execute one INSERT/UPDATE/DELETE ... RETURNING statement and return its
+    first row, or None if it touched nothing. The cursor is drained so the
+    statement has fully run before the caller commits.
+    """
+    rows = db.execute(sql, params).fetchall()
+    return rows[0] if rows else None
+
+class _Evicted(Exception):
+    """A batch member whose error rolled back the coordinator's whole transaction."""
+
+    def __init__(self, fut, error):
+        super().__init__(str(error))
+        self.fut, self.error = fut, error
+
+
+class WriteCoordinator:
+    """
+    Group commit for one SQLite file. Request threads submit write callables;
+    a single background thread runs everything that arrives within `window`
+    seconds (up to `max_batch`) inside one BEGIN IMMEDIATE ... COMMIT, so a
+    burst of small writes shares one WAL sync and one trip through the write
+    lock. Each callable runs in its own SAVEPOINT: if it raises, only its
+    statements are rolled back and the exception is re-raised in its caller.
+    If the lock stays busy the whole batch is retried with backoff; if
+    BEGIN/COMMIT still fails, every caller in the batch gets that error.
+    """
+
+    def __init__(self, path, window_ms: float = GROUP_COMMIT_WINDOW_MS,
+                 max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.path = Path(path)
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._stats = {"batches": 0, "writes": 0, "failed": 0, "max_batch": 0, "commit_total": 0.0}
+
+    def _ensure_started(self):
+        with self._lock:
+            # threads don't survive fork: each worker process starts its own
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name="db-group-commit", daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def submit(self, fn, deadline=None):
+        """
+        Run fn(conn) in the next batch; returns its result or raises its error.
+        `deadline` (time.monotonic()) is the caller's query budget.
+        """
+        fut = Future()
+        self._ensure_started().put((fn, fut, deadline))
+        return fut.result()
+
+    def _run(self, q):
+        conn = _connect(self.path)
+        conn.isolation_level = None  # transactions are managed explicitly below
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(conn, batch)
+
+    def _commit(self, conn, batch):
+        started = time.monotonic()
+        pending, results = list(batch), []
+        while pending:
+            try:
+                results += _with_retry(lambda: self._attempt(conn, pending))
+                pending = []
+            except _Evicted as ev:
+                # an interrupted statement takes the whole transaction with it:
+                # fail that caller and replay the rest of the batch without it
+                results.append((ev.fut, None, ev.error))
+                pending = [item for item in pending if item[1] is not ev.fut]
+            except Exception as e:
+                results += [(fut, None, e) for _, fut, _ in pending]
+                pending = []
+
+        with self._lock:
+            s = self._stats
+            s["batches"] += 1
+            s["writes"] += len(batch)
+            s["failed"] += sum(1 for _, _, err in results if err is not None)
+            s["max_batch"] = max(s["max_batch"], len(batch))
+            s["commit_total"] += time.monotonic() - started
+        for fut, result, err in results:
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(result)
+
+    def _attempt(self, conn, batch):
+        """One try at the whole batch; rolls everything back before re-raising."""
+        results = []
+        try:
+            _begin_immediate(conn)
+            for fn, fut, deadline in batch:
+                conn.execute("SAVEPOINT group_write")
+                _arm(conn, deadline)
+                try:
+                    result = fn(conn)
+                except Exception as e:
+                    _arm(conn, None)
+                    if not conn.in_transaction:
+                        raise _Evicted(fut, e)
+                    conn.execute("ROLLBACK TO group_write")
+                    conn.execute("RELEASE group_write")
+                    results.append((fut, None, e))
+                else:
+                    _arm(conn, None)
+                    conn.execute("RELEASE group_write")
+                    results.append((fut, result, None))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+            raise
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        batches = s["batches"] or 1
+        return {
+            "path": str(self.path),
+            "window_ms": round(self.window * 1000, 3),
+            "max_batch": self.max_batch,
+            "batches": s["batches"],
+            "writes": s["writes"],
+            "failed": s["failed"],
+            "largest_batch": s["max_batch"],
+            "avg_batch": round(s["writes"] / batches, 2),
+            "batch_ms_avg": round(1000 * s["commit_total"] / batches, 3),
+        }
+
+
+_coordinators = {}
+
+def get_coordinator(path=None) -> WriteCoordinator:
+    path = Path(path or DB_PATH)
+    with _pools_lock:
+        coord = _coordinators.get(path)
+        if coord is None:
+            coord = _coordinators[path] = WriteCoordinator(path)
+        return coord
+
+def coordinator_stats() -> list:
+    with _pools_lock:
+        coords = list(_coordinators.values())
+    return [c.stats() for c in coords]
+
+def run_write(fn, path=None):
+    """
+    Run fn(db) as one atomic write on `path` (default: the request's shard,
+    see get_db) and return its result. With
+    DB_GROUP_COMMIT on, fn is batched with concurrent writers on the
+    coordinator's thread; otherwise it runs in a BEGIN IMMEDIATE transaction
+    on the request's write connection. On SQLITE_BUSY the transaction is
+    rolled back and fn re-run (DB_WRITE_RETRIES times, with backoff) before
+    DatabaseBusy is raised. So fn must be safe to re-run, must not commit,
+    and must not touch `request`/`g` (capture what it needs in a closure).
+    """
+    path = path or _route_path()
+    if GROUP_COMMIT:
+        return get_coordinator(path).submit(fn, g.get("query_deadline") if has_request_context() else None)
+    db = get_write_db(path)
+
+    def attempt():
+        if db.in_transaction:
+            db.rollback()
+        _begin_immediate(db)
+        with db:
+            return fn(db)
+
+    return _with_retry(attempt)
+
+def write_returning(sql, params=(), path=None):
+    """
+    A single ... RETURNING statement as one write (see run_write).
+    Replaces the write -> commit -> SELECT-by-id round trips in the routes.
+    """
+    return run_write(lambda db: returning(db, sql, params), path)
+
+AUTOINCREMENT_TABLES = ("users", "transactions", "password_resets", "budgets",
+                        "goals", "goal_contributions", "categories")
 
-def _ensure_schema():
-    db = _connect()
+def _seed_ids(db, shard: int):
+    """
+    Start shard i's AUTOINCREMENT counters at i * SHARD_ID_SPAN, so ids are
+    unique across shards and rows keep them when a rebalance moves a user.
+    """
+    base = shard * SHARD_ID_SPAN
+    db.execute("BEGIN IMMEDIATE")
+    for table in AUTOINCREMENT_TABLES:
+        if not db.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (base, table)).rowcount:
+            db.execute("INSERT INTO sqlite_sequence(name, seq) VALUES (?, ?)", (table, base))
+    db.execute("COMMIT")
+
+def migrate(path=None, shard=0) -> list:
+    """
+    Apply pending schema migrations (see migrations.py) to one database file.
+    Every file gets the full schema; shard files just leave the global
+    tables empty (apart from stub users rows, see shards.py). Uses its own
+    autocommit connection with foreign keys off, so migrations may rebuild
+    tables without cascading deletes.
+    """
+    from .migrations import run_migrations
+    path = Path(path or DB_PATH)
+    if not MEMORY:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    db = _open(path, timeout=30, isolation_level=None)
     try:
-        db.executescript(SCHEMA_SQL)
-        db.commit()
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL;")  # only takes on a new, empty file
+        db.execute("PRAGMA journal_mode=WAL;")
+        db.execute("PRAGMA foreign_keys=OFF;")
+        applied = run_migrations(db)
+        if shard:
+            _seed_ids(db, shard)
+        return applied
     finally:
         db.close()
 
+def migrate_all(shards: int = None) -> dict:
+    """migrate() the global file and every shard; -> {path: applied versions}."""
+    return {str(p): migrate(p, shard=i) for i, p in enumerate(shard_paths(shards))}
+
 def init_db(app):
     """
-    Flask 3: no before_first_request. Ensure schema eagerly at startup,
-    then register teardown for per-request connection cleanup.
+    Flask 3: no before_first_request. Apply schema migrations once at startup,
+    then register the per-request query budget and the teardown that returns
+    the request's pooled connection, and start replication and the
+    maintenance scheduler if configured.
+    Requests themselves never run DDL.
     """
+    from . import maintenance, replication
+
     with app.app_context():
-        _ensure_schema()
+        applied = migrate_all()
         if current_app:
-            current_app.logger.info("DB schema ensured at startup.")
+            current_app.logger.info("DB migrations applied at startup: %s", applied or "none")
 
+    if replication.enabled():
+        replication.ensure_running()
+        app.before_request(replication.ensure_running)
+    if maintenance.ENABLED:
+        maintenance.ensure_running()
+        app.before_request(maintenance.ensure_running)
+    app.before_request(_start_budget)
     app.teardown_appcontext(close_db)
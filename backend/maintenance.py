@@ -0,0 +1,234 @@
+# backend/maintenance.py
+"""
+Scheduled database maintenance.
+
+    checkpoint  PRAGMA wal_checkpoint(TRUNCATE), so the -wal file doesn't grow forever
+                (skipped on a shipping primary, where replication.py checkpoints)
+    optimize    ANALYZE (bounded by analysis_limit) + PRAGMA optimize, keeping planner stats fresh
+    vacuum      PRAGMA incremental_vacuum, returning free pages to the OS
+    purge       delete expired/used password_resets and old maintenance_log rows
+
+Each task runs over every database file (purge: the global file only) on
+its own interval, jittered so workers and restarts don't line up. Every
+worker runs the scheduler thread, but only the one holding an flock next
+to DB_PATH does the work. Runs are timed and recorded in maintenance_log
+(see /api/admin/metrics). Set DB_MAINTENANCE=0 to run it from cron instead:
+
+    python -m backend.maintenance run [TASK ...]
+    python -m backend.maintenance status
+
+Incremental vacuum needs auto_vacuum=INCREMENTAL, which new files get at
+creation; existing files switch with a one-off full VACUUM:
+
+    python -m backend.maintenance convert
+"""
+import fcntl
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+from . import database
+from .database import _begin_immediate, _connect, _env_float, _env_int, _with_retry, shard_path, shard_paths
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("DB_MAINTENANCE", "1").lower() in ("1", "true", "yes", "on")
+INTERVALS = {  # seconds between runs of each task
+    "checkpoint": _env_int("DB_MAINT_CHECKPOINT_S", 300),
+    "optimize": _env_int("DB_MAINT_OPTIMIZE_S", 6 * 3600),
+    "vacuum": _env_int("DB_MAINT_VACUUM_S", 3600),
+    "purge": _env_int("DB_MAINT_PURGE_S", 3600),
+}
+JITTER = _env_float("DB_MAINT_JITTER", 0.2)                   # +-fraction of each interval
+CHECKPOINT_WAIT_MS = _env_int("DB_MAINT_CHECKPOINT_WAIT_MS", 100)  # writers stall while TRUNCATE waits
+ANALYSIS_LIMIT = _env_int("DB_MAINT_ANALYSIS_LIMIT", 1000)     # rows ANALYZE samples per index
+VACUUM_PAGES = _env_int("DB_MAINT_VACUUM_PAGES", 2000)        # free pages released per file per run
+LOG_KEEP_DAYS = _env_int("DB_MAINT_LOG_KEEP_DAYS", 30)
+
+
+# ---------- tasks ----------
+def checkpoint(db) -> dict:
+    if database.SHIPS_WAL:
+        return {"skipped": "the replication shipper checkpoints"}
+    # a short busy timeout: while TRUNCATE waits for readers, writers wait on it
+    db.execute(f"PRAGMA busy_timeout={CHECKPOINT_WAIT_MS}")
+    busy, frames, done = db.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    return {"busy": busy, "wal_frames": frames, "checkpointed": done}
+
+
+def optimize(db) -> dict:
+    db.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+    # a fresh connection has run no queries, so on its own PRAGMA optimize
+    # (before SQLite 3.46) would consider no table worth analyzing
+    db.execute("ANALYZE")
+    db.execute("PRAGMA optimize")
+    return {"analyzed": True}
+
+
+def vacuum(db) -> dict:
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return {"skipped": "auto_vacuum is not INCREMENTAL"}
+    free = db.execute("PRAGMA freelist_count").fetchone()[0]
+    if free:
+        _with_retry(lambda: _in_write(
+            db, lambda conn: conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()))
+    return {"free_pages": free, "released": min(free, VACUUM_PAGES)}
+
+
+def purge(db) -> dict:
+    now = datetime.utcnow().isoformat()  # same format as auth.py writes expires_at
+
+    def delete(conn):
+        resets = conn.execute("DELETE FROM password_resets WHERE used = 1 OR expires_at < ?", (now,)).rowcount
+        logs = conn.execute("DELETE FROM maintenance_log WHERE started_at < datetime('now', ?)",
+                            (f"-{LOG_KEEP_DAYS} days",)).rowcount
+        return {"password_resets": resets, "maintenance_log": logs}
+
+    return _with_retry(lambda: _in_write(db, delete))
+
+
+def _in_write(db, fn):
+    _begin_immediate(db)
+    try:
+        result = fn(db)
+        db.execute("COMMIT")
+        return result
+    except Exception:
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+
+
+TASKS = {"checkpoint": checkpoint, "optimize": optimize, "vacuum": vacuum, "purge": purge}
+GLOBAL_ONLY = {"purge"}
+
+
+def run_task(name) -> dict:
+    """Run one task over its files now, record the timing; -> {file: result}."""
+    paths = [shard_path(0)] if name in GLOBAL_ONLY else shard_paths()
+    started, results, ok = time.monotonic(), {}, True
+    for path in paths:
+        try:
+            with closing(_connect(path)) as db:
+                db.isolation_level = None
+                results[Path(path).name] = TASKS[name](db)
+        except sqlite3.Error as e:
+            ok = False
+            results[Path(path).name] = {"error": repr(e)}
+    _record(name, (time.monotonic() - started) * 1000, ok, results)
+    return results
+
+
+def _record(task, duration_ms, ok, detail):
+    with closing(_connect(shard_path(0))) as db:
+        db.isolation_level = None
+        _with_retry(lambda: _in_write(db, lambda conn: conn.execute(
+            "INSERT INTO maintenance_log(task, duration_ms, ok, detail) VALUES (?, ?, ?, ?)",
+            (task, round(duration_ms, 3), int(ok), repr(detail)[:2000]),
+        )))
+
+
+def history(db) -> dict:
+    """Latest run and average/max duration per task (db: the global file)."""
+    rows = db.execute("""
+        SELECT task, COUNT(*) AS runs, SUM(1 - ok) AS failed,
+               ROUND(AVG(duration_ms), 3) AS ms_avg, MAX(duration_ms) AS ms_max,
+               MAX(started_at) AS last_run
+        FROM maintenance_log GROUP BY task
+    """).fetchall()
+    return {r["task"]: {k: r[k] for k in r.keys() if k != "task"} for r in rows}
+
+
+# ---------- scheduler ----------
+_lock = threading.Lock()
+_thread = None
+_pid = None
+_leader_fd = None
+
+
+def _is_leader() -> bool:
+    """flock-based election: the first worker to lock the file runs maintenance, for good."""
+    global _leader_fd
+    if _leader_fd is None:
+        path = Path(database.DB_PATH).with_name(".maintenance.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        _leader_fd = fd
+    return True
+
+
+def _next(interval, now) -> float:
+    return now + interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def _run():
+    now = time.monotonic()
+    due = {name: _next(every, now) for name, every in INTERVALS.items() if every > 0}
+    while True:
+        name = min(due, key=due.get)
+        time.sleep(max(0.0, due[name] - time.monotonic()))
+        try:
+            if _is_leader():
+                run_task(name)
+        except Exception:  # keep the schedule going; the failure is logged
+            log.exception("maintenance task %s failed", name)
+        due[name] = _next(INTERVALS[name], time.monotonic())
+
+
+def ensure_running():
+    """Start this process's scheduler thread (threads don't survive fork)."""
+    global _thread, _pid
+    if not ENABLED or database.REPLICA or database.MEMORY or not any(every > 0 for every in INTERVALS.values()):
+        return  # replicas leave the primary's files to the primary; memory has no files
+    with _lock:
+        if _pid != os.getpid() or not _thread.is_alive():
+            _pid = os.getpid()
+            _thread = threading.Thread(target=_run, name="db-maintenance", daemon=True)
+            _thread.start()
+
+
+def convert(path) -> str:
+    """Switch one file to auto_vacuum=INCREMENTAL (rewrites it: run it in a quiet period)."""
+    with closing(_connect(path)) as db:
+        db.isolation_level = None
+        if db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return "already incremental"
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute("VACUUM")
+        return "converted"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="MoneyMate database maintenance.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rn = sub.add_parser("run", help="run tasks now (default: all)")
+    rn.add_argument("tasks", nargs="*", help=f"any of: {', '.join(TASKS)}")
+    sub.add_parser("status", help="recorded timings per task")
+    sub.add_parser("convert", help="switch existing files to incremental auto-vacuum")
+    args = ap.parse_args()
+
+    database.migrate_all()
+    if args.cmd == "run":
+        unknown = set(args.tasks) - set(TASKS)
+        if unknown:
+            ap.error(f"unknown task(s): {', '.join(sorted(unknown))}")
+        for task in args.tasks or TASKS:
+            print(f"[DB] {task}: {run_task(task)}")
+    elif args.cmd == "convert":
+        for path in shard_paths():
+            print(f"[DB] {path.name}: {convert(path)}")
+    else:
+        with closing(_connect(shard_path(0))) as db:
+            print(f"[DB] Maintenance: {history(db)}")
@@ -0,0 +1,811 @@
+# backend/migrations.py
+"""
+Versioned, run-once schema migrations.
+
+Every migration is registered with a unique, increasing version number and is
+applied at most once per database file; applied versions are recorded in the
+`schema_version` table. `database.init_db` runs pending migrations at startup
+(or run them at deploy time with `python -m backend.migrations`), so request
+handlers never issue DDL. Every database file - the global one and each
+shard - gets the same migrations.
+"""
+import sqlite3
+
+MIGRATIONS = []  # [(version, name, fn(db))], kept sorted by version
+
+
+def migration(version: int, name: str):
+    """Register `fn(db)` as schema migration `version`."""
+    def register(fn):
+        if any(v == version for v, _, _ in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def run_script(db, sql: str):
+    """
+    Execute a multi-statement script inside the caller's transaction.
+    (`executescript` would COMMIT first, which defeats per-migration atomicity.)
+    Statements are split with `sqlite3.complete_statement`, so trigger bodies
+    containing `;` stay intact.
+    """
+    buf = ""
+    for piece in sql.split(";"):
+        buf += piece + ";"
+        if sqlite3.complete_statement(buf):
+            stmt = buf.strip()
+            if stmt != ";":
+                db.execute(stmt)
+            buf = ""
+    if buf.strip(" \n\t;"):
+        raise ValueError(f"Incomplete SQL statement in migration: {buf[:80]!r}")
+
+
+def _columns(db, table: str) -> set:
+    return {r[1] for r in db.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+# ---------- migrations ----------
+@migration(1, "baseline schema")
+def _baseline(db):
+    run_script(db, """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT CHECK(type IN ('income','expense')) NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT,
+            description TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_tx_user ON transactions(user_id);
+        CREATE INDEX IF NOT EXISTS idx_tx_user_date ON transactions(user_id, datetime(created_at));
+        CREATE INDEX IF NOT EXISTS idx_tx_user_type ON transactions(user_id, type);
+        CREATE INDEX IF NOT EXISTS idx_tx_user_cat ON transactions(user_id, category);
+
+        CREATE TABLE IF NOT EXISTS password_resets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token TEXT NOT NULL UNIQUE,
+            expires_at TEXT NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS budgets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            monthly_limit REAL NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            UNIQUE(user_id, category) ON CONFLICT REPLACE,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            category TEXT,
+            target_amount REAL NOT NULL,
+            saved_amount REAL NOT NULL DEFAULT 0,
+            target_date TEXT,
+            status TEXT NOT NULL DEFAULT 'active',
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+
+        CREATE TABLE IF NOT EXISTS goal_contributions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            goal_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            note TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(goal_id) REFERENCES goals(id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            currency_symbol TEXT NOT NULL DEFAULT '$',
+            warn_threshold REAL NOT NULL DEFAULT 0.8,
+            critical_threshold REAL NOT NULL DEFAULT 1.0,
+            week_starts_monday INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+
+
+@migration(2, "legacy goals/user_settings columns")
+def _legacy_columns(db):
+    """Bring tables created by older app versions up to the baseline columns."""
+    cols = _columns(db, "goals")
+    if "category" not in cols:
+        db.execute("ALTER TABLE goals ADD COLUMN category TEXT")
+    if "saved_amount" not in cols:
+        db.execute("ALTER TABLE goals ADD COLUMN saved_amount REAL NOT NULL DEFAULT 0")
+    if "target_date" not in cols:
+        db.execute("ALTER TABLE goals ADD COLUMN target_date TEXT")
+    if "status" not in cols:
+        db.execute("ALTER TABLE goals ADD COLUMN status TEXT NOT NULL DEFAULT 'active'")
+    if "created_at" not in cols:
+        # SQLite ALTER ADD can't set function default; add then backfill.
+        db.execute("ALTER TABLE goals ADD COLUMN created_at TEXT")
+        db.execute("""
+            UPDATE goals
+            SET created_at = COALESCE(created_at, datetime('now'))
+            WHERE created_at IS NULL OR created_at = ''
+        """)
+
+    # notify.py used to create a narrower user_settings table
+    if "week_starts_monday" not in _columns(db, "user_settings"):
+        db.execute("ALTER TABLE user_settings ADD COLUMN week_starts_monday INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(3, "transactions canonical ts/month columns")
+def _tx_ts(db):
+    """
+    Epoch-seconds `ts` and yyyymm `month`, filled on write (utils/dates.py)
+    and backfilled here, replace date(created_at)/strftime() filters that
+    could not use an index. Rows whose created_at never parsed get ts=0.
+    """
+    cols = _columns(db, "transactions")
+    if "ts" not in cols:
+        db.execute("ALTER TABLE transactions ADD COLUMN ts INTEGER NOT NULL DEFAULT 0")
+    if "month" not in cols:
+        db.execute("ALTER TABLE transactions ADD COLUMN month INTEGER NOT NULL DEFAULT 0")
+    run_script(db, """
+        UPDATE transactions
+        SET ts = COALESCE(CAST(strftime('%s', created_at) AS INTEGER), 0);
+        UPDATE transactions
+        SET month = CAST(strftime('%Y%m', ts, 'unixepoch') AS INTEGER);
+
+        DROP INDEX IF EXISTS idx_tx_user_date;
+        DROP INDEX IF EXISTS idx_tx_user;
+        CREATE INDEX IF NOT EXISTS idx_tx_user_ts ON transactions(user_id, ts);
+    """)
+
+
+@migration(4, "transactions keyset sort indexes")
+def _tx_sort_indexes(db):
+    """
+    Indexes backing GET /api/transactions keyset pages: one per sort key,
+    with the implicit rowid as tie-breaker. (user_id, category, ts) also
+    serves category filters sorted by date and budget month-to-date sums.
+    """
+    run_script(db, """
+        DROP INDEX IF EXISTS idx_tx_user_cat;
+        CREATE INDEX IF NOT EXISTS idx_tx_user_cat_ts ON transactions(user_id, category, ts);
+        CREATE INDEX IF NOT EXISTS idx_tx_user_amount ON transactions(user_id, amount);
+        CREATE INDEX IF NOT EXISTS idx_tx_user_catsort ON transactions(user_id, IFNULL(category,''));
+    """)
+
+
+@migration(5, "tx_monthly_rollup table and triggers")
+def _monthly_rollup(db):
+    """
+    Per (user, month, type, category) totals kept current by triggers on
+    every transactions write, so budget spent-to-date is a primary-key
+    lookup instead of a SUM over raw rows. NULL categories roll up as
+    'Uncategorized'. `python -m backend.rollups` rebuilds from raw rows.
+    """
+    run_script(db, """
+        CREATE TABLE IF NOT EXISTS tx_monthly_rollup (
+            user_id INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, type, category)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_tx_rollup_ins AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO tx_monthly_rollup(user_id, month, type, category, total, count)
+            VALUES (NEW.user_id, NEW.month, NEW.type, IFNULL(NEW.category,'Uncategorized'), NEW.amount, 1)
+            ON CONFLICT(user_id, month, type, category)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_tx_rollup_del AFTER DELETE ON transactions
+        BEGIN
+            UPDATE tx_monthly_rollup SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category = IFNULL(OLD.category,'Uncategorized');
+            DELETE FROM tx_monthly_rollup
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category = IFNULL(OLD.category,'Uncategorized') AND count <= 0;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_tx_rollup_upd
+        AFTER UPDATE OF user_id, month, type, category, amount ON transactions
+        BEGIN
+            UPDATE tx_monthly_rollup SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category = IFNULL(OLD.category,'Uncategorized');
+            DELETE FROM tx_monthly_rollup
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category = IFNULL(OLD.category,'Uncategorized') AND count <= 0;
+            INSERT INTO tx_monthly_rollup(user_id, month, type, category, total, count)
+            VALUES (NEW.user_id, NEW.month, NEW.type, IFNULL(NEW.category,'Uncategorized'), NEW.amount, 1)
+            ON CONFLICT(user_id, month, type, category)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END;
+
+        DELETE FROM tx_monthly_rollup;
+        INSERT INTO tx_monthly_rollup(user_id, month, type, category, total, count)
+        SELECT user_id, month, type, IFNULL(category,'Uncategorized'), SUM(amount), COUNT(*)
+        FROM transactions
+        GROUP BY user_id, month, type, IFNULL(category,'Uncategorized');
+    """)
+
+
+@migration(6, "tx_daily_rollup table and triggers")
+def _daily_rollup(db):
+    """
+    Per (user, UTC day, type) totals, trigger-maintained like the monthly
+    rollup. `day` is ts / 86400 (days since the epoch). Backs the summary
+    and time-series endpoints.
+    """
+    run_script(db, """
+        CREATE TABLE IF NOT EXISTS tx_daily_rollup (
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, type)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_tx_daily_ins AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO tx_daily_rollup(user_id, day, type, total, count)
+            VALUES (NEW.user_id, NEW.ts / 86400, NEW.type, NEW.amount, 1)
+            ON CONFLICT(user_id, day, type)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_tx_daily_del AFTER DELETE ON transactions
+        BEGIN
+            UPDATE tx_daily_rollup SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type;
+            DELETE FROM tx_daily_rollup
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type AND count <= 0;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_tx_daily_upd
+        AFTER UPDATE OF user_id, ts, type, amount ON transactions
+        BEGIN
+            UPDATE tx_daily_rollup SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type;
+            DELETE FROM tx_daily_rollup
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type AND count <= 0;
+            INSERT INTO tx_daily_rollup(user_id, day, type, total, count)
+            VALUES (NEW.user_id, NEW.ts / 86400, NEW.type, NEW.amount, 1)
+            ON CONFLICT(user_id, day, type)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END;
+
+        DELETE FROM tx_daily_rollup;
+        INSERT INTO tx_daily_rollup(user_id, day, type, total, count)
+        SELECT user_id, ts / 86400, type, SUM(amount), COUNT(*)
+        FROM transactions
+        GROUP BY user_id, ts / 86400, type;
+    """)
+
+
+@migration(7, "integer cents money columns")
+def _money_cents(db):
+    """
+    Rebuild every money-bearing table with INTEGER cents columns
+    (amount -> amount_cents, monthly_limit -> monthly_limit_cents,
+    target/saved_amount -> *_cents) and the rollups with total_cents.
+    Follows SQLite's create-copy-drop-rename recipe; the migration
+    connection runs with foreign keys off so the drops don't cascade.
+    """
+    run_script(db, """
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT CHECK(type IN ('income','expense')) NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            category TEXT,
+            description TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            ts INTEGER NOT NULL DEFAULT 0,
+            month INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+        INSERT INTO transactions_new (id, user_id, type, amount_cents, category, description, created_at, ts, month)
+        SELECT id, user_id, type, CAST(ROUND(amount * 100) AS INTEGER), category, description, created_at, ts, month
+        FROM transactions;
+        DROP TABLE transactions;
+        ALTER TABLE transactions_new RENAME TO transactions;
+
+        CREATE INDEX idx_tx_user_ts ON transactions(user_id, ts);
+        CREATE INDEX idx_tx_user_type ON transactions(user_id, type);
+        CREATE INDEX idx_tx_user_cat_ts ON transactions(user_id, category, ts);
+        CREATE INDEX idx_tx_user_amount ON transactions(user_id, amount_cents);
+        CREATE INDEX idx_tx_user_catsort ON transactions(user_id, IFNULL(category,''));
+
+        CREATE TABLE budgets_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            monthly_limit_cents INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            UNIQUE(user_id, category) ON CONFLICT REPLACE,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        );
+        INSERT INTO budgets_new (id, user_id, category, monthly_limit_cents, created_at)
+        SELECT id, user_id, category, CAST(ROUND(monthly_limit * 100) AS INTEGER), created_at
+        FROM budgets;
+        DROP TABLE budgets;
+        ALTER TABLE budgets_new RENAME TO budgets;
+
+        CREATE TABLE goals_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            category TEXT,
+            target_amount_cents INTEGER NOT NULL,
+            saved_amount_cents INTEGER NOT NULL DEFAULT 0,
+            target_date TEXT,
+            status TEXT NOT NULL DEFAULT 'active',
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+        INSERT INTO goals_new (id, user_id, name, category, target_amount_cents, saved_amount_cents,
+                               target_date, status, created_at)
+        SELECT id, user_id, name, category, CAST(ROUND(target_amount * 100) AS INTEGER),
+               CAST(ROUND(IFNULL(saved_amount, 0) * 100) AS INTEGER), target_date,
+               IFNULL(status, 'active'), IFNULL(created_at, datetime('now'))
+        FROM goals;
+        DROP TABLE goals;
+        ALTER TABLE goals_new RENAME TO goals;
+
+        CREATE TABLE goal_contributions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            goal_id INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            note TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(goal_id) REFERENCES goals(id) ON DELETE CASCADE
+        );
+        INSERT INTO goal_contributions_new (id, user_id, goal_id, amount_cents, note, created_at)
+        SELECT id, user_id, goal_id, CAST(ROUND(amount * 100) AS INTEGER), note, created_at
+        FROM goal_contributions;
+        DROP TABLE goal_contributions;
+        ALTER TABLE goal_contributions_new RENAME TO goal_contributions;
+
+        DROP TABLE tx_monthly_rollup;
+        CREATE TABLE tx_monthly_rollup (
+            user_id INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, type, category)
+        ) WITHOUT ROWID;
+        INSERT INTO tx_monthly_rollup(user_id, month, type, category, total_cents, count)
+        SELECT user_id, month, type, IFNULL(category,'Uncategorized'), SUM(amount_cents), COUNT(*)
+        FROM transactions
+        GROUP BY user_id, month, type, IFNULL(category,'Uncategorized');
+
+        DROP TABLE tx_daily_rollup;
+        CREATE TABLE tx_daily_rollup (
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, type)
+        ) WITHOUT ROWID;
+        INSERT INTO tx_daily_rollup(user_id, day, type, total_cents, count)
+        SELECT user_id, ts / 86400, type, SUM(amount_cents), COUNT(*)
+        FROM transactions
+        GROUP BY user_id, ts / 86400, type;
+
+        CREATE TRIGGER trg_tx_rollup_ins AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO tx_monthly_rollup(user_id, month, type, category, total_cents, count)
+            VALUES (NEW.user_id, NEW.month, NEW.type, IFNULL(NEW.category,'Uncategorized'), NEW.amount_cents, 1)
+            ON CONFLICT(user_id, month, type, category)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END;
+
+        CREATE TRIGGER trg_tx_rollup_del AFTER DELETE ON transactions
+        BEGIN
+            UPDATE tx_monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category = IFNULL(OLD.category,'Uncategorized');
+            DELETE FROM tx_monthly_rollup
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category = IFNULL(OLD.category,'Uncategorized') AND count <= 0;
+        END;
+
+        CREATE TRIGGER trg_tx_rollup_upd
+        AFTER UPDATE OF user_id, month, type, category, amount_cents ON transactions
+        BEGIN
+            UPDATE tx_monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category = IFNULL(OLD.category,'Uncategorized');
+            DELETE FROM tx_monthly_rollup
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category = IFNULL(OLD.category,'Uncategorized') AND count <= 0;
+            INSERT INTO tx_monthly_rollup(user_id, month, type, category, total_cents, count)
+            VALUES (NEW.user_id, NEW.month, NEW.type, IFNULL(NEW.category,'Uncategorized'), NEW.amount_cents, 1)
+            ON CONFLICT(user_id, month, type, category)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END;
+
+        CREATE TRIGGER trg_tx_daily_ins AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO tx_daily_rollup(user_id, day, type, total_cents, count)
+            VALUES (NEW.user_id, NEW.ts / 86400, NEW.type, NEW.amount_cents, 1)
+            ON CONFLICT(user_id, day, type)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END;
+
+        CREATE TRIGGER trg_tx_daily_del AFTER DELETE ON transactions
+        BEGIN
+            UPDATE tx_daily_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type;
+            DELETE FROM tx_daily_rollup
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type AND count <= 0;
+        END;
+
+        CREATE TRIGGER trg_tx_daily_upd
+        AFTER UPDATE OF user_id, ts, type, amount_cents ON transactions
+        BEGIN
+            UPDATE tx_daily_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type;
+            DELETE FROM tx_daily_rollup
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type AND count <= 0;
+            INSERT INTO tx_daily_rollup(user_id, day, type, total_cents, count)
+            VALUES (NEW.user_id, NEW.ts / 86400, NEW.type, NEW.amount_cents, 1)
+            ON CONFLICT(user_id, day, type)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END;
+    """)
+
+
+@migration(8, "category dimension table")
+def _category_ids(db):
+    """
+    Intern free-text categories into a per-user `categories` table and
+    replace the `category` TEXT columns of transactions, budgets, goals and
+    tx_monthly_rollup with integer `category_id`. NULL/blank transaction
+    categories become the user's "Uncategorized" category, which is what the
+    rollups already grouped them under. AUTOINCREMENT keeps ids from ever
+    being reused, so cached id -> name maps stay valid.
+    """
+    run_script(db, """
+        CREATE TABLE categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE(user_id, name),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+        INSERT OR IGNORE INTO categories(user_id, name)
+        SELECT user_id, IFNULL(NULLIF(TRIM(category), ''), 'Uncategorized') FROM transactions
+        UNION SELECT user_id, category FROM budgets
+        UNION SELECT user_id, TRIM(category) FROM goals WHERE NULLIF(TRIM(category), '') IS NOT NULL
+        ORDER BY 1, 2;
+
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT CHECK(type IN ('income','expense')) NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            description TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            ts INTEGER NOT NULL DEFAULT 0,
+            month INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(category_id) REFERENCES categories(id)
+        );
+        INSERT INTO transactions_new (id, user_id, type, amount_cents, category_id, description, created_at, ts, month)
+        SELECT t.id, t.user_id, t.type, t.amount_cents, c.id, t.description, t.created_at, t.ts, t.month
+        FROM transactions t
+        JOIN categories c
+          ON c.user_id = t.user_id AND c.name = IFNULL(NULLIF(TRIM(t.category), ''), 'Uncategorized');
+        DROP TABLE transactions;
+        ALTER TABLE transactions_new RENAME TO transactions;
+
+        CREATE INDEX idx_tx_user_ts ON transactions(user_id, ts);
+        CREATE INDEX idx_tx_user_type ON transactions(user_id, type);
+        CREATE INDEX idx_tx_user_cat_ts ON transactions(user_id, category_id, ts);
+        CREATE INDEX idx_tx_user_amount ON transactions(user_id, amount_cents);
+
+        CREATE TABLE budgets_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            monthly_limit_cents INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            UNIQUE(user_id, category_id) ON CONFLICT REPLACE,
+            FOREIGN KEY(user_id) REFERENCES users(id),
+            FOREIGN KEY(category_id) REFERENCES categories(id)
+        );
+        INSERT INTO budgets_new (id, user_id, category_id, monthly_limit_cents, created_at)
+        SELECT b.id, b.user_id, c.id, b.monthly_limit_cents, b.created_at
+        FROM budgets b
+        JOIN categories c ON c.user_id = b.user_id AND c.name = b.category;
+        DROP TABLE budgets;
+        ALTER TABLE budgets_new RENAME TO budgets;
+
+        CREATE TABLE goals_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            category_id INTEGER,
+            target_amount_cents INTEGER NOT NULL,
+            saved_amount_cents INTEGER NOT NULL DEFAULT 0,
+            target_date TEXT,
+            status TEXT NOT NULL DEFAULT 'active',
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(category_id) REFERENCES categories(id)
+        );
+        INSERT INTO goals_new (id, user_id, name, category_id, target_amount_cents, saved_amount_cents,
+                               target_date, status, created_at)
+        SELECT g.id, g.user_id, g.name, c.id, g.target_amount_cents, g.saved_amount_cents,
+               g.target_date, g.status, g.created_at
+        FROM goals g
+        LEFT JOIN categories c ON c.user_id = g.user_id AND c.name = TRIM(g.category);
+        DROP TABLE goals;
+        ALTER TABLE goals_new RENAME TO goals;
+
+        DROP TABLE tx_monthly_rollup;
+        CREATE TABLE tx_monthly_rollup (
+            user_id INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, type, category_id)
+        ) WITHOUT ROWID;
+        INSERT INTO tx_monthly_rollup(user_id, month, type, category_id, total_cents, count)
+        SELECT user_id, month, type, category_id, SUM(amount_cents), COUNT(*)
+        FROM transactions
+        GROUP BY user_id, month, type, category_id;
+
+        CREATE TRIGGER trg_tx_rollup_ins AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO tx_monthly_rollup(user_id, month, type, category_id, total_cents, count)
+            VALUES (NEW.user_id, NEW.month, NEW.type, NEW.category_id, NEW.amount_cents, 1)
+            ON CONFLICT(user_id, month, type, category_id)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END;
+
+        CREATE TRIGGER trg_tx_rollup_del AFTER DELETE ON transactions
+        BEGIN
+            UPDATE tx_monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category_id = OLD.category_id;
+            DELETE FROM tx_monthly_rollup
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category_id = OLD.category_id AND count <= 0;
+        END;
+
+        CREATE TRIGGER trg_tx_rollup_upd
+        AFTER UPDATE OF user_id, month, type, category_id, amount_cents ON transactions
+        BEGIN
+            UPDATE tx_monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category_id = OLD.category_id;
+            DELETE FROM tx_monthly_rollup
+            WHERE user_id = OLD.user_id AND month = OLD.month AND type = OLD.type
+              AND category_id = OLD.category_id AND count <= 0;
+            INSERT INTO tx_monthly_rollup(user_id, month, type, category_id, total_cents, count)
+            VALUES (NEW.user_id, NEW.month, NEW.type, NEW.category_id, NEW.amount_cents, 1)
+            ON CONFLICT(user_id, month, type, category_id)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END;
+
+        CREATE TRIGGER trg_tx_daily_ins AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO tx_daily_rollup(user_id, day, type, total_cents, count)
+            VALUES (NEW.user_id, NEW.ts / 86400, NEW.type, NEW.amount_cents, 1)
+            ON CONFLICT(user_id, day, type)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END;
+
+        CREATE TRIGGER trg_tx_daily_del AFTER DELETE ON transactions
+        BEGIN
+            UPDATE tx_daily_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type;
+            DELETE FROM tx_daily_rollup
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type AND count <= 0;
+        END;
+
+        CREATE TRIGGER trg_tx_daily_upd
+        AFTER UPDATE OF user_id, ts, type, amount_cents ON transactions
+        BEGIN
+            UPDATE tx_daily_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type;
+            DELETE FROM tx_daily_rollup
+            WHERE user_id = OLD.user_id AND day = OLD.ts / 86400 AND type = OLD.type AND count <= 0;
+            INSERT INTO tx_daily_rollup(user_id, day, type, total_cents, count)
+            VALUES (NEW.user_id, NEW.ts / 86400, NEW.type, NEW.amount_cents, 1)
+            ON CONFLICT(user_id, day, type)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END;
+    """)
+
+
+@migration(9, "archive watermark")
+def _archive_state(db):
+    """
+    Single-row table holding the cutoff of the newest archive run: every row
+    in the cold archive file has ts < archived_before (0 = nothing archived).
+    See backend/archive.py.
+    """
+    run_script(db, """
+        CREATE TABLE archive_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            archived_before INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT INTO archive_state(id, archived_before) VALUES (1, 0);
+    """)
+
+
+@migration(10, "shard rebalance journal")
+def _shard_moves(db):
+    """
+    Progress of `python -m backend.shards rebalance` (global file only), so
+    an interrupted run resumes instead of copying a user twice.
+    """
+    run_script(db, """
+        CREATE TABLE shard_moves (
+            user_id INTEGER PRIMARY KEY,
+            from_shards INTEGER NOT NULL,
+            to_shards INTEGER NOT NULL,
+            state TEXT NOT NULL CHECK (state IN ('copied', 'done')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+    """)
+
+
+@migration(11, "maintenance log")
+def _maintenance_log(db):
+    """
+    One row per run of a scheduled maintenance task (global file only), so
+    any worker can report timings, not just the one that ran it. See
+    backend/maintenance.py.
+    """
+    run_script(db, """
+        CREATE TABLE maintenance_log (
+            id INTEGER PRIMARY KEY,
+            task TEXT NOT NULL,
+            started_at TEXT NOT NULL DEFAULT (datetime('now')),
+            duration_ms REAL NOT NULL,
+            ok INTEGER NOT NULL,
+            detail TEXT
+        );
+        CREATE INDEX idx_maintenance_log_task ON maintenance_log(task, id);
+    """)
+
+
+@migration(12, "budget/goal/contribution/reset indexes")
+def _lookup_indexes(db):
+    """
+    Secondary indexes for the per-user tables that only had their unique
+    constraints (see `python -m backend.plancheck`): goals listed by user in
+    (status, created_at) order, contributions by goal in datetime(created_at)
+    order (goal_id first, which also serves the ON DELETE CASCADE lookup),
+    and password_resets / maintenance_log rows purged by age or use.
+    budgets is covered by UNIQUE(user_id, category_id).
+    """
+    run_script(db, """
+        CREATE INDEX idx_goals_user_status ON goals(user_id, status, created_at);
+        CREATE INDEX idx_goal_contrib_goal ON goal_contributions(goal_id, user_id, datetime(created_at));
+        CREATE INDEX idx_password_resets_expires ON password_resets(expires_at);
+        CREATE INDEX idx_password_resets_used ON password_resets(used) WHERE used = 1;
+        CREATE INDEX idx_maintenance_log_started ON maintenance_log(started_at);
+    """)
+
+
+VERSIONED_TABLES = ("transactions", "budgets", "goals", "goal_contributions", "user_settings")
+
+
+@migration(13, "per-user data version")
+def _data_versions(db):
+    """
+    data_versions.version counts the writes to each user's rows. Triggers
+    bump it on every insert/update/delete of a per-user table, so every
+    write path - routes, CSV import, goal contributions, archive moves and
+    restores, rebalance copies - moves it without extra code. Read caches
+    key on it (see cache.py).
+    """
+    run_script(db, """
+        CREATE TABLE data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """ + "".join(f"""
+        CREATE TRIGGER trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+        BEGIN
+            INSERT INTO data_versions(user_id, version) VALUES ({row}.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+        END;
+    """ for table in VERSIONED_TABLES for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))))
+
+
+@migration(14, "archive tombstones")
+def _archive_deleted(db):
+    """
+    ids of archived transactions deleted since the last archive run. The
+    delete commits here, in the hot file, and readers skip archive rows
+    listed here (archive.VISIBLE) until the next run drops both.
+    """
+    run_script(db, """
+        CREATE TABLE archive_deleted (
+            id INTEGER PRIMARY KEY
+        );
+    """)
+
+
+# ---------- runner ----------
+def current_version(db) -> int:
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    row = db.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(db) -> list:
+    """
+    Apply pending migrations, each in its own IMMEDIATE transaction.
+    `db` must be in autocommit mode (isolation_level=None). Safe to call from
+    several workers at once: the write lock serializes them and the version
+    is re-read after the lock is taken.
+    Returns the list of versions applied by this call.
+    """
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= current_version(db):
+                db.execute("COMMIT")
+                continue
+            fn(db)
+            db.execute(
+                "INSERT INTO schema_version(version, name) VALUES(?, ?)",
+                (version, name),
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    # Deploy-time entry point: python -m backend.migrations
+    from .database import migrate_all
+    for path, done in migrate_all().items():
+        print(f"[DB] Applied migrations to {path}: {done or 'none (up to date)'}")
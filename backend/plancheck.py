@@ -0,0 +1,283 @@
+# backend/plancheck.py
+"""
+Query-plan regression check.
+
+Seeds a throwaway in-memory database (full schema, a few thousand rows per
+table, the oldest of them moved to an attached in-memory archive, ANALYZEd
+like maintenance.optimize leaves production), runs every
+registered query - each repository function, plus the rollup, category and
+archive reads the routes make - through a connection that records
+EXPLAIN QUERY PLAN for each statement it executes, and fails on:
+
+    SCAN <table>                  a full table (or full index) scan
+    USE TEMP B-TREE FOR ORDER BY  a sort the index order should have given
+
+GROUP BY/DISTINCT b-trees over an index range are fine and not reported,
+and so are the child-table lookups an INSERT into a foreign-key parent
+shows: SQLite only runs them while deferred FK violations are outstanding.
+Known, reviewed exceptions are listed in ALLOW with the reason. Every public
+function in repository.py must have a QUERIES entry, so a new query can't
+skip the check. tests/test_query_plans.py runs it under pytest, so a
+regression fails the build; to see every plan:
+
+    python -m backend.plancheck [-v]      # exit status 1 on any regression
+"""
+import random
+import re
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+from . import archive, categories, maintenance, repository, rollups
+from .migrations import run_migrations
+
+SEED = 20240601
+ARCHIVED_BEFORE = int(datetime(2023, 7, 1, tzinfo=timezone.utc).timestamp())  # seeded archive watermark
+USERS = 40
+TX_PER_USER = 400
+CATEGORIES = ("Groceries", "Transport", "Rent", "Dining", "Shopping", "Health", "Salary", "Savings")
+
+PLANNED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+BAD = [
+    (re.compile(r"^SCAN (?!\(|CONSTANT ROW)"), "full scan"),
+    (re.compile(r"^USE TEMP B-TREE FOR (.* )?ORDER BY"), "sort"),
+]
+ALLOW = {  # query name -> why its flagged plan is expected
+    "all_users": "cron fan-out over every user, by design",
+    "rollups.totals_by_category": "orders a handful of per-category sums by their total",
+}
+
+
+class Explainer:
+    """Connection stand-in that EXPLAIN QUERY PLANs every statement before running it."""
+
+    def __init__(self, db):
+        self._db = db
+        self.plans = []  # [(sql, [detail, ...])]
+
+    def execute(self, sql, params=()):
+        if sql.lstrip().split(None, 1)[0].upper() in PLANNED:
+            plan = self._db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            self.plans.append((sql, [r["detail"] for r in plan]))
+        return self._db.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+# ---------- seeded database ----------
+def seed() -> sqlite3.Connection:
+    db = sqlite3.connect(":memory:", isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA foreign_keys=ON")
+    run_migrations(db)
+    db.execute(f"ATTACH DATABASE ':memory:' AS {archive.SCHEMA}")  # archive.attach() then finds it
+    for stmt in archive.ARCHIVE_DDL.split(";"):
+        if stmt.strip():
+            db.execute(stmt)
+    rnd = random.Random(SEED)
+    start = int(datetime(2023, 1, 1, tzinfo=timezone.utc).timestamp())
+    now = int(datetime.now(timezone.utc).timestamp())
+    db.execute("BEGIN")
+    for uid in range(1, USERS + 1):
+        db.execute("INSERT INTO users(id, name, email, password_hash) VALUES (?, ?, ?, 'x')",
+                   (uid, f"user{uid}", f"user{uid}@example.com"))
+        db.execute("INSERT INTO user_settings(user_id) VALUES (?)", (uid,))
+        cids = [db.execute("INSERT INTO categories(user_id, name) VALUES (?, ?) RETURNING id",
+                           (uid, c)).fetchone()[0] for c in CATEGORIES]
+        rows = []
+        for _ in range(TX_PER_USER):
+            ts = rnd.randrange(start, now)
+            d = datetime.fromtimestamp(ts, timezone.utc)
+            rows.append((uid, rnd.choice(("income", "expense", "expense")), rnd.randrange(100, 50000),
+                         rnd.choice(cids), rnd.choice(("coffee", "uber", "rent", None)),
+                         d.strftime("%Y-%m-%d %H:%M:%S"), ts, d.year * 100 + d.month))
+        db.executemany("""
+            INSERT INTO transactions (user_id, type, amount_cents, category_id, description, created_at, ts, month)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        for cid in cids[:4]:
+            db.execute("INSERT INTO budgets(user_id, category_id, monthly_limit_cents) VALUES (?, ?, ?)",
+                       (uid, cid, rnd.randrange(10000, 100000)))
+        for n in range(5):
+            gid = db.execute("""
+                INSERT INTO goals(user_id, name, category_id, target_amount_cents, target_date, status)
+                VALUES (?, ?, ?, ?, ?, ?) RETURNING id
+            """, (uid, f"goal {n}", cids[-1], 100000, "2030-01-01",
+                  rnd.choice(("active", "achieved", "archived")))).fetchone()[0]
+            for _ in range(20):
+                db.execute("INSERT INTO goal_contributions(user_id, goal_id, amount_cents, created_at) "
+                           "VALUES (?, ?, ?, datetime(?, 'unixepoch'))", (uid, gid, 500, rnd.randrange(start, now)))
+        for n in range(5):  # what an hourly purge leaves: live tokens, a few just used
+            db.execute("INSERT INTO password_resets(user_id, token, expires_at, used) VALUES (?, ?, ?, ?)",
+                       (uid, f"tok-{uid}-{n}", datetime.utcfromtimestamp(now + rnd.randrange(7200)).isoformat(),
+                        int(rnd.random() < 0.1)))
+    db.executemany("INSERT INTO maintenance_log(task, started_at, duration_ms, ok) "
+                   "VALUES (?, datetime(?, 'unixepoch'), 1.0, 1)",
+                   [(rnd.choice(list(maintenance.TASKS)), now - rnd.randrange(30 * 86400)) for _ in range(2000)])
+    # the cold tier as archive_old leaves it, plus rows deleted since the run
+    db.execute(f"INSERT INTO {archive.SCHEMA}.transactions ({archive.COLS}) "
+               f"SELECT {archive.COLS} FROM main.transactions WHERE ts < ?", (ARCHIVED_BEFORE,))
+    db.execute("DELETE FROM main.transactions WHERE ts < ?", (ARCHIVED_BEFORE,))
+    db.execute("UPDATE archive_state SET archived_before = ? WHERE id = 1", (ARCHIVED_BEFORE,))
+    db.execute(f"INSERT INTO archive_deleted(id) SELECT id FROM {archive.SCHEMA}.transactions WHERE id % 50 = 0")
+    db.execute("COMMIT")
+    db.execute("ANALYZE")
+    return db
+
+
+# ---------- registered queries ----------
+UID = 7
+TODAY = date.today()
+LO = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())  # hot tier only
+HI = LO + 90 * 86400
+OLD_LO = int(datetime(2023, 3, 1, tzinfo=timezone.utc).timestamp())  # reaches into the archive
+
+
+def _cid(db):
+    return db.execute("SELECT id FROM categories WHERE user_id=? AND name='Dining'", (UID,)).fetchone()[0]
+
+
+def _goal(db):
+    return db.execute("SELECT id FROM goals WHERE user_id=? LIMIT 1", (UID,)).fetchone()[0]
+
+
+def _txn(db):
+    return db.execute("SELECT id FROM transactions WHERE user_id=? LIMIT 1", (UID,)).fetchone()[0]
+
+
+# name -> fn(db); each runs in a transaction that is rolled back afterwards
+QUERIES = {
+    # users / password resets
+    "insert_user": lambda db: repository.insert_user(db, "new", "new@example.com", "x"),
+    "user_by_email": lambda db: repository.user_by_email(db, "user7@example.com"),
+    "user_by_id": lambda db: repository.user_by_id(db, UID),
+    "all_users": lambda db: repository.all_users(db),
+    "password_hash": lambda db: repository.password_hash(db, UID),
+    "set_password_hash": lambda db: repository.set_password_hash(db, UID, "y"),
+    "insert_password_reset": lambda db: repository.insert_password_reset(db, "user7@example.com", "tok-new",
+                                                                          "2030-01-01T00:00:00"),
+    "password_reset": lambda db: repository.password_reset(db, "tok-7-1"),
+    "claim_password_reset": lambda db: repository.claim_password_reset(db, 1),
+    "maintenance.purge": lambda db: maintenance.purge(db),
+    "data_version": lambda db: repository.data_version(db, UID),
+    # settings
+    "get_settings": lambda db: repository.get_settings(db, UID),
+    "settings_or_defaults": lambda db: repository.settings_or_defaults(db, UID),
+    "save_settings": lambda db: repository.save_settings(db, UID, "$", 0.8, 1.0, 1),
+    # transactions
+    "insert_transaction": lambda db: repository.insert_transaction(
+        db, UID, "expense", 1234, _cid(db), "pizza", "2024-02-01 10:00:00", LO + 86400 * 31, 202402),
+    "transactions_page": lambda db: repository.transactions_page(db, UID, "ts", "desc", 101),
+    "transactions_page[after]": lambda db: repository.transactions_page(db, UID, "ts", "desc", 101, (HI, 10**9)),
+    "transactions_page[amount]": lambda db: repository.transactions_page(
+        db, UID, "amount_cents", "asc", 101, (5000, 10**9)),
+    "transactions_page[filters]": lambda db: repository.transactions_page(
+        db, UID, "ts", "asc", 101, tx_type="expense", lo=LO, hi=HI),
+    "transactions_page[category]": lambda db: repository.transactions_page(
+        db, UID, "ts", "desc", 101, category_id=_cid(db)),
+    "transactions_page_by_category": lambda db: repository.transactions_page_by_category(db, UID, "asc", 101),
+    "transactions_page_by_category[after]": lambda db: repository.transactions_page_by_category(
+        db, UID, "asc", 101, ((_cid(db), LO), 10**9), "Dining", lo=LO),
+    "transactions_page[archive]": lambda db: repository.transactions_page(db, UID, "ts", "desc", 101, lo=OLD_LO),
+    "transactions_page[archive, amount]": lambda db: repository.transactions_page(
+        db, UID, "amount_cents", "asc", 101, (5000, 10**9), lo=OLD_LO),
+    "transactions_page[archive, category]": lambda db: repository.transactions_page(
+        db, UID, "ts", "asc", 101, category_id=_cid(db), lo=OLD_LO),
+    "transactions_page_by_category[archive]": lambda db: repository.transactions_page_by_category(
+        db, UID, "asc", 101, lo=OLD_LO),
+    "transactions_page_by_category[archive, after]": lambda db: repository.transactions_page_by_category(
+        db, UID, "asc", 101, ((_cid(db), OLD_LO), 10**9), "Dining", lo=OLD_LO),
+    "export_transactions": lambda db: repository.export_transactions(db, UID, LO, HI),
+    "export_transactions[archive]": lambda db: repository.export_transactions(db, UID, OLD_LO, HI),
+    "transaction_type": lambda db: repository.transaction_type(db, UID, _txn(db)),
+    "update_transaction": lambda db: repository.update_transaction(
+        db, UID, _txn(db), {"amount_cents": 999, "category_id": _cid(db)}),
+    "delete_transaction": lambda db: repository.delete_transaction(db, UID, _txn(db)),
+    "has_duplicate": lambda db: repository.has_duplicate(db, UID, "expense", 1234, "pizza", LO),
+    "totals_since": lambda db: repository.totals_since(db, UID, HI),
+    # budgets
+    "insert_budget": lambda db: repository.insert_budget(db, UID, _cid(db), 5000),
+    "budgets_with_spend": lambda db: repository.budgets_with_spend(db, UID, TODAY.year * 100 + TODAY.month),
+    "update_budget": lambda db: repository.update_budget(db, UID, 1, {"monthly_limit_cents": 6000}),
+    "delete_budget": lambda db: repository.delete_budget(db, UID, 1),
+    # goals
+    "insert_goal": lambda db: repository.insert_goal(db, UID, "trip", None, 100000, None),
+    "open_goals": lambda db: repository.open_goals(db, UID),
+    "update_goal": lambda db: repository.update_goal(db, UID, _goal(db), {"status": "achieved"}),
+    "delete_goal": lambda db: repository.delete_goal(db, UID, _goal(db)),
+    "add_to_goal": lambda db: repository.add_to_goal(db, UID, _goal(db), 500),
+    "insert_contribution": lambda db: repository.insert_contribution(db, UID, _goal(db), 500, None),
+    "contributions": lambda db: repository.contributions(db, UID, _goal(db)),
+    # reads outside the repository
+    "categories.load": lambda db: categories._load(db, UID),
+    "categories.intern": lambda db: categories.intern(db, UID, "Brand new"),
+    "archive.source": lambda db: archive.source(db, LO),
+    "rollups.rebuild_all": lambda db: rollups.rebuild_all(db, UID),
+    "rollups.totals_by_type": lambda db: rollups.totals_by_type(db, UID),
+    "rollups.totals_by_category": lambda db: rollups.totals_by_category(db, UID),
+    "rollups.time_series[day]": lambda db: rollups.time_series(db, UID, TODAY - timedelta(days=29), TODAY),
+    "rollups.time_series[month]": lambda db: rollups.time_series(
+        db, UID, TODAY - timedelta(days=400), TODAY, "month"),
+}
+OWN_TRANSACTION = {"maintenance.purge"}  # open their own write transaction
+
+
+INSERT_TARGET = re.compile(r"^\s*INSERT\s+(?:OR\s+\w+\s+)?INTO\s+(\w+)", re.I)
+PLAN_TABLE = re.compile(r"^(?:SCAN|SEARCH) (\w+)")
+
+
+def problems(sql, plan) -> list:
+    target = INSERT_TARGET.match(sql)
+    if target:  # see the module docstring: parent-side FK checks
+        plan = [d for d in plan if (PLAN_TABLE.match(d) or target).group(1) == target.group(1)]
+    return [f"{why}: {detail}" for detail in plan for rx, why in BAD if rx.search(detail)]
+
+
+def unregistered() -> list:
+    """Public repository functions without a QUERIES entry."""
+    names = {n for n, f in vars(repository).items()
+             if callable(f) and not n.startswith("_") and getattr(f, "__module__", None) == repository.__name__}
+    covered = {n.split("[")[0] for n in QUERIES}
+    return sorted(names - covered)
+
+
+def check(verbose=False, out=sys.stdout) -> int:
+    """Run every registered query against a seeded database; -> number of failures."""
+    db = seed()
+    categories.clear_cache()
+    failures = 0
+    for name in unregistered():
+        failures += 1
+        print(f"FAIL {name}: repository function has no QUERIES entry", file=out)
+    for name, fn in QUERIES.items():
+        ex = Explainer(db)
+        own = name in OWN_TRANSACTION
+        if not own:
+            db.execute("BEGIN")
+        try:
+            fn(ex)
+        finally:
+            if not own:
+                db.execute("ROLLBACK")
+        found = [(sql, plan, problems(sql, plan)) for sql, plan in ex.plans]
+        bad = [p for _, _, ps in found for p in ps]
+        status = "ok" if not bad else ("allowed" if name in ALLOW else "FAIL")
+        failures += status == "FAIL"
+        if verbose or status != "ok":
+            print(f"{status:7} {name}" + (f"  ({ALLOW[name]})" if status == "allowed" else ""), file=out)
+            for sql, plan, ps in found:
+                if verbose or ps:
+                    print("        " + " ".join(sql.split())[:160], file=out)
+                    for detail in plan:
+                        print(f"          {'!' if detail in ' '.join(ps) else ' '} {detail}", file=out)
+    print(f"[DB] Query plans: {len(QUERIES)} queries checked, {failures} failure(s)", file=out)
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Fail on full scans or sorts in registered query plans.")
+    ap.add_argument("-v", "--verbose", action="store_true", help="print every plan, not just failures")
+    sys.exit(1 if check(ap.parse_args().verbose) else 0)
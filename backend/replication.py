@@ -0,0 +1,534 @@
+# backend/replication.py
+"""
+Read replicas fed by shipped page diffs.
+
+A primary with DB_REPLICA_DIR set ships every database file it owns (the
+global file, shard files and their archives) into that directory, which
+replica nodes must be able to read - a shared volume, or just another
+directory on the same machine:
+
+    <file>.manifest        JSON: newest seq, and a heartbeat counter bumped every pass
+    <file>.<seq>.pages     zlib'd pages that changed since seq - 1
+    <file>.<seq>.full      every page (the first segment, then every FULL_EVERY)
+
+For a WAL database the changed pages are the frames committed to its -wal
+since the last pass, read from the file itself; the shipper does the
+checkpointing so it can follow the -wal across resets (see Shipper).
+
+A replica measures its lag on its own clock, from when it saw the
+heartbeat move while caught up, so clock skew between nodes doesn't count.
+
+A node started with DB_ROLE=replica applies the segments in order to local
+copies in DB_REPLICA_LOCAL_DIR and serves GET/HEAD requests from them;
+writes still go to DB_PATH, so the primary's files must be reachable from
+the node. While a copy is more than DB_REPLICA_MAX_LAG_MS behind (or has
+nothing applied yet) its reads go to the primary instead.
+
+On each node one process does the shipping/applying, elected with an
+flock; the others follow its state files. Also runnable standalone:
+
+    python -m backend.replication ship|apply [--once]
+    python -m backend.replication status
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from . import archive, database
+from .database import _connect, _env_int, shard_paths
+
+log = logging.getLogger(__name__)
+
+ROLE = os.getenv("DB_ROLE", "primary").lower()
+REPLICA_DIR = os.getenv("DB_REPLICA_DIR", "")              # where the primary ships segments
+LOCAL_DIR = os.getenv("DB_REPLICA_LOCAL_DIR", "")          # a replica's copies (default: <db dir>/replica)
+INTERVAL_MS = _env_int("DB_REPLICA_INTERVAL_MS", 1000)     # ship / apply cadence
+MAX_LAG_MS = _env_int("DB_REPLICA_MAX_LAG_MS", 10000)      # staler copies fall back to the primary (0 = never)
+FULL_EVERY = _env_int("DB_REPLICA_FULL_EVERY", 256)        # segments between full images
+
+SEGMENT = struct.Struct(">QIII")  # seq, page_size, page_count, pages in segment
+PGNO = struct.Struct(">I")
+WAL_HEADER = struct.Struct(">8I")  # magic, version, page size, checkpoint seq, salt-1, salt-2, checksum
+WAL_FRAME = struct.Struct(">6I")   # pgno, db size after a commit (else 0), salt-1, salt-2, checksum
+
+
+def enabled() -> bool:
+    return bool(REPLICA_DIR) and ROLE in ("primary", "replica") and not database.MEMORY
+
+
+def local_dir() -> Path:
+    return Path(LOCAL_DIR or Path(database.DB_PATH).parent / "replica")
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _segments(folder: Path, name: str) -> dict:
+    """{seq: (path, full)} for one shipped file."""
+    out = {}
+    for p in folder.glob(f"{name}.*"):
+        _, _, rest = p.name.partition(f"{name}.")
+        seq, _, kind = rest.partition(".")
+        if seq.isdigit() and kind in ("pages", "full"):
+            out[int(seq)] = (p, kind == "full")
+    return out
+
+
+# ---------- primary ----------
+class Shipper:
+    """
+    Ships one database file's new pages into REPLICA_DIR.
+
+    A WAL file is tailed: each call pins a read snapshot, runs a PASSIVE
+    checkpoint and ships the frames committed since the last call, read
+    straight from the -wal (whose header is read before and after, so a
+    reset in between is noticed and the call retried later).
+
+    The shipper is the only checkpointer on a shipping primary (see
+    database.SHIPS_WAL), so after its own checkpoint drains the -wal only
+    it writes the main file. A -wal that starts over is followed from its
+    first frame if the main file's size and mtime are still what they were
+    after that checkpoint; anything else - the first call, a checkpoint
+    from elsewhere (a CLI or sqlite3 shell without DB_REPLICA_DIR), an
+    unreadable frame - ships a full image instead.
+
+    Other files (an archive in rollback-journal mode) are rarely written:
+    they are imaged and diffed against the last image's page digests, and
+    only when PRAGMA data_version says something committed.
+    """
+
+    def __init__(self, path, out_dir):
+        self.path = Path(path)
+        self.out = Path(out_dir)
+        self.name = self.path.name
+        self.reader = None   # pins the snapshot each call ships from
+        self.ckpt = None     # runs the checkpoints; never writes
+        self.wal = None      # (checkpoint seq, salt-1, salt-2) of the -wal being tailed
+        self.frames = 0      # frames of it shipped so far
+        self.drained = None  # main file (size, mtime) after a checkpoint that backfilled every frame
+        self.version = None
+        self.hashes = None   # page digests of the last image (non-WAL files)
+        manifest = _read_json(self.out / f"{self.name}.manifest")
+        self.seq = manifest.get("seq", 0)
+        self.beat = manifest.get("beat", 0)
+        self.last_full = None
+        self.bytes = 0
+        self.fulls = 0
+
+    def ship(self):
+        """Ship what changed since the last call; -> the new segment's seq, or None."""
+        if self.reader is None:
+            self.reader = _connect(self.path, readonly=True)
+            self.reader.isolation_level = None
+            self.ckpt = sqlite3.connect(self.path, timeout=database.BUSY_TIMEOUT_MS / 1000,
+                                        isolation_level=None, check_same_thread=False)
+            self.ckpt.execute("PRAGMA wal_autocheckpoint=0")
+        if self.ckpt.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            seq = self._ship_wal()
+        else:
+            seq = self._ship_image()
+        # also a heartbeat: replicas time their lag by when they see it move
+        self.beat += 1
+        _write_atomic(self.out / f"{self.name}.manifest",
+                      json.dumps({"seq": self.seq, "beat": self.beat}).encode())
+        return seq
+
+    def _ship_wal(self):
+        self.reader.execute("BEGIN")
+        try:
+            self.reader.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()  # pins the snapshot
+            header = self._wal_header()
+            stamp = self._main_stamp()  # before our checkpoint writes to it
+            _, frames, done = self.ckpt.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            if frames < 0:
+                return None  # someone else is checkpointing; next call
+            page_size = self.reader.execute("PRAGMA page_size").fetchone()[0]
+            pages, count = self._read_frames(header, page_size, frames)
+            if self._wal_header() != header:
+                return None  # the -wal started over while we read it; next call
+            wal = header and header[3:6]
+            continues = pages is not None and (wal == self.wal or (
+                self.wal is not None and wal is not None and self.frames > 0 and wal[0] == self.wal[0] + 1
+                and self.drained is not None and self.drained == stamp
+            ))  # same -wal, or it started over after our drained checkpoint and nothing else backfilled since
+            start = self.frames if wal == self.wal else 0
+            if not continues or frames < start or self.last_full is None or (frames > start and self._full_due()):
+                image = self.reader.serialize()
+                view = memoryview(image)
+                # the snapshot already holds most of these frames: replaying them over it is harmless
+                seq = self._segment(page_size, count or len(image) // page_size,
+                                    [(i + 1, view[i * page_size:(i + 1) * page_size])
+                                     for i in range(len(image) // page_size)] + (pages or []),
+                                    full=True)
+            elif frames > start:
+                seq = self._segment(page_size, count, pages[start:], full=False)
+            else:
+                seq = None
+            # unreadable frames weren't shipped: the next call images again
+            self.wal = wal if pages is not None else None
+            # our snapshot holds off other checkpoints until COMMIT, so this stamp is ours
+            self.frames, self.drained = frames, self._main_stamp() if frames == done else None
+            self.hashes = None
+            return seq
+        finally:
+            self.reader.execute("COMMIT")
+
+    def _main_stamp(self):
+        st = os.stat(self.path)
+        return st.st_size, st.st_mtime_ns
+
+    def _wal_header(self):
+        try:
+            with open(f"{self.path}-wal", "rb") as f:
+                header = f.read(WAL_HEADER.size)
+        except FileNotFoundError:
+            return None
+        return WAL_HEADER.unpack(header) if len(header) == WAL_HEADER.size else None
+
+    def _read_frames(self, header, page_size, frames):
+        """-> ([(pgno, page)] for frames 1..`frames`, db size after them); pages None if they can't be read."""
+        if frames == 0:
+            return [], 0
+        if header is None or header[0] & ~1 != 0x377F0682 or header[2] != page_size:
+            return None, 0
+        size = WAL_FRAME.size + page_size
+        with open(f"{self.path}-wal", "rb") as f:
+            f.seek(WAL_HEADER.size)
+            data = memoryview(f.read(frames * size))
+        if len(data) < frames * size:
+            return None, 0
+        pages, count = [], 0
+        for off in range(0, frames * size, size):
+            pgno, commit, salt1, salt2, _, _ = WAL_FRAME.unpack_from(data, off)
+            if (salt1, salt2) != header[4:6]:
+                return None, 0
+            pages.append((pgno, data[off + WAL_FRAME.size:off + size]))
+            count = commit or count
+        return pages, count
+
+    def _ship_image(self):
+        version = self.reader.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.version and self.hashes is not None:
+            return None
+        self.version = version
+        self.wal = None
+        page_size = self.reader.execute("PRAGMA page_size").fetchone()[0]
+        image = self.reader.serialize()
+        view = memoryview(image)
+        count = len(image) // page_size
+        hashes = [hashlib.blake2b(view[i * page_size:(i + 1) * page_size], digest_size=16).digest()
+                  for i in range(count)]
+        full = self.hashes is None or self._full_due()
+        changed = [i for i, h in enumerate(hashes) if full or i >= len(self.hashes) or self.hashes[i] != h]
+        unchanged = not full and not changed and count == len(self.hashes)
+        self.hashes = hashes
+        if unchanged:
+            return None
+        return self._segment(page_size, count, [(i + 1, view[i * page_size:(i + 1) * page_size]) for i in changed],
+                             full=full)
+
+    def _full_due(self) -> bool:
+        return self.last_full is None or self.seq + 1 - self.last_full >= FULL_EVERY
+
+    def _segment(self, page_size, count, pages, full):
+        self.seq += 1
+        body = bytearray(SEGMENT.pack(self.seq, page_size, count, len(pages)))
+        for pgno, page in pages:
+            body += PGNO.pack(pgno)
+            body += page
+        data = zlib.compress(bytes(body), 1)
+        _write_atomic(self.out / f"{self.name}.{self.seq:012d}.{'full' if full else 'pages'}", data)
+        self.bytes += len(data)
+        if full:
+            self.fulls += 1
+            # keep the previous full image onwards, so lagging replicas can still catch up
+            for seq, (p, _) in _segments(self.out, self.name).items():
+                if self.last_full is not None and seq < self.last_full:
+                    p.unlink(missing_ok=True)
+            self.last_full = self.seq
+        return self.seq
+
+    def stats(self) -> dict:
+        return {"seq": self.seq, "beat": self.beat, "bytes_shipped": self.bytes, "full_images": self.fulls,
+                "wal_frames": self.frames}
+
+
+def shipped_files() -> list:
+    """Every file the primary ships; an archive goes before its main file."""
+    files = []
+    for p in shard_paths():
+        if archive.archive_file(p).exists():
+            files.append(archive.archive_file(p))
+        files.append(p)
+    return files
+
+
+# ---------- replica ----------
+class Applier:
+    """
+    Keeps the local copy of one shipped file current. Pages are written in
+    place while holding SQLite's EXCLUSIVE lock on the copy, so readers never
+    see a half-applied segment, and the copy is stamped as a rollback-journal
+    file with a fresh change counter, which makes every reader drop its page
+    cache.
+    """
+
+    def __init__(self, name, src_dir, dst_dir):
+        self.name = name
+        self.src = Path(src_dir)
+        self.target = Path(dst_dir) / name
+        self.state_file = Path(dst_dir) / f"{name}.applied"
+        self.fd = None  # kept open: closing any fd on a file drops this process's locks on it
+        self.conn = None
+        self.beat = None          # the primary's heartbeat, as last read from the manifest
+        self.beat_seen_at = None  # when it was first seen to change, by this node's clock
+
+    def catch_up(self) -> int:
+        """Apply every segment the manifest announces; -> segments applied."""
+        manifest = _read_json(self.src / f"{self.name}.manifest")
+        if not manifest:
+            return 0
+        state = _read_json(self.state_file) if self.target.exists() else {}
+        seq, applied = state.get("seq", 0), 0
+        if seq != manifest["seq"]:
+            segs = _segments(self.src, self.name)
+            if seq > manifest["seq"] or seq + 1 not in segs:
+                # first sync, pruned history, or the primary started over: reseed
+                fulls = [s for s, (_, full) in segs.items() if full and s <= manifest["seq"]]
+                if not fulls:
+                    return 0
+                seq = max(fulls) - 1
+            while seq < manifest["seq"] and seq + 1 in segs:
+                seq = self._apply(segs[seq + 1][0].read_bytes())
+                applied += 1
+            state = {"seq": seq, "fresh_as_of": state.get("fresh_as_of")}
+        # timed on this node's clock: when the primary's heartbeat was first seen to move
+        now = time.time()
+        if manifest.get("beat") != self.beat:
+            if self.beat is not None:
+                self.beat_seen_at = now
+            self.beat = manifest.get("beat")
+        if seq == manifest["seq"] and self.beat_seen_at is not None:
+            state["fresh_as_of"] = self.beat_seen_at
+        state["beat"] = self.beat
+        state["applied_at"] = now
+        _write_atomic(self.state_file, json.dumps(state).encode())
+        return applied
+
+    def _open(self):
+        self.target.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(self.target, os.O_RDWR | os.O_CREAT, 0o644)
+        self.conn = sqlite3.connect(self.target, timeout=database.BUSY_TIMEOUT_MS / 1000,
+                                    isolation_level=None, check_same_thread=False)
+
+    def _apply(self, data: bytes) -> int:
+        body = memoryview(zlib.decompress(data))
+        seq, page_size, count, n = SEGMENT.unpack_from(body)
+        if self.fd is None:
+            self._open()
+        # a brand-new copy has no readers yet; and SQLite would initialize an
+        # empty file on COMMIT, over the pages written here
+        locked = os.fstat(self.fd).st_size > 0
+        if locked:
+            self.conn.execute("BEGIN EXCLUSIVE")  # waits out readers, holds off new ones
+        try:
+            counter = int.from_bytes(os.pread(self.fd, 4, 24).rjust(4, b"\0"), "big")
+            off = SEGMENT.size
+            for _ in range(n):
+                (pgno,) = PGNO.unpack_from(body, off)
+                os.pwrite(self.fd, body[off + PGNO.size:off + PGNO.size + page_size], (pgno - 1) * page_size)
+                off += PGNO.size + page_size
+            os.ftruncate(self.fd, count * page_size)
+
+            header = bytearray(os.pread(self.fd, 100, 0))
+            header[18] = header[19] = 1  # legacy journal: readers must not look for a -wal
+            stamp = ((counter + 1) & 0xFFFFFFFF).to_bytes(4, "big")
+            header[24:28] = stamp                         # file change counter
+            header[28:32] = count.to_bytes(4, "big")      # size in pages ...
+            header[92:96] = stamp                         # ... valid for this counter
+            os.pwrite(self.fd, bytes(header), 0)
+            os.fsync(self.fd)
+        finally:
+            if locked:
+                self.conn.execute("COMMIT")  # nothing went through SQLite: just unlocks
+        return seq
+
+
+# ---------- per-process runner ----------
+_lock = threading.Lock()
+_thread = None
+_pid = None
+_leader_fd = None
+_shippers = {}  # name -> Shipper (shipping leader only)
+_appliers = {}  # name -> Applier (applying leader only)
+_followed = {}  # name -> replica state, as last read from the state files
+_stats = {"ticks": 0, "errors": 0, "tick_total": 0.0, "last_error": None}
+
+
+def _is_leader(lock_path: Path) -> bool:
+    """flock-based election: the first process to lock the file does the work, for good."""
+    global _leader_fd
+    if _leader_fd is None:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        _leader_fd = fd
+    return True
+
+
+def ship_once() -> dict:
+    """One shipping pass over every file; -> {name: new seq} for files that changed."""
+    out = Path(REPLICA_DIR)
+    out.mkdir(parents=True, exist_ok=True)
+    shipped = {}
+    for path in shipped_files():
+        shipper = _shippers.get(path.name)
+        if shipper is None:
+            shipper = _shippers[path.name] = Shipper(path, out)
+        seq = shipper.ship()
+        if seq is not None:
+            shipped[path.name] = seq
+    return shipped
+
+
+def apply_once(leader=True) -> dict:
+    """One applying pass (if leader), then reload every copy's state; -> {name: segments applied}."""
+    src, dst = Path(REPLICA_DIR), local_dir()
+    names = sorted(p.name[:-len(".manifest")] for p in src.glob("*.manifest"))
+    applied = {}
+    for name in names:
+        if leader:
+            applier = _appliers.get(name)
+            if applier is None:
+                applier = _appliers[name] = Applier(name, src, dst)
+            applied[name] = applier.catch_up()
+        _followed[name] = _read_json(dst / f"{name}.applied")
+    return applied
+
+
+def _tick():
+    if ROLE == "replica":
+        apply_once(leader=_is_leader(local_dir() / ".apply.lock"))
+    elif _is_leader(Path(database.DB_PATH).with_name(".replica-ship.lock")):
+        ship_once()
+
+
+def _run():
+    while True:
+        started = time.monotonic()
+        try:
+            _tick()
+        except Exception as e:  # keep replicating; the next tick retries
+            log.exception("replication tick failed")
+            with _lock:
+                _stats["errors"] += 1
+                _stats["last_error"] = repr(e)
+        elapsed = time.monotonic() - started
+        with _lock:
+            _stats["ticks"] += 1
+            _stats["tick_total"] += elapsed
+        time.sleep(max(0.0, INTERVAL_MS / 1000 - elapsed))
+
+
+def ensure_running():
+    """Start this process's replication thread (threads don't survive fork)."""
+    global _thread, _pid
+    if not enabled():
+        return
+    with _lock:
+        if _pid != os.getpid() or not _thread.is_alive():
+            _pid = os.getpid()
+            _thread = threading.Thread(target=_run, name="db-replication", daemon=True)
+            _thread.start()
+
+
+def lag_ms(name):
+    """How far behind the primary the local copy of `name` may be; None if it has nothing yet."""
+    st = _followed.get(name) or {}
+    if not st.get("fresh_as_of"):
+        return None
+    return max(0.0, (time.time() - st["fresh_as_of"]) * 1000)
+
+
+def _usable(name) -> bool:
+    lag = lag_ms(name)
+    return lag is not None and (not MAX_LAG_MS or lag <= MAX_LAG_MS)
+
+
+def read_path(path) -> Path:
+    """Where a replica node reads `path`: its local copy while fresh enough, else the primary."""
+    path = Path(path)
+    companion = archive.archive_file(path).name
+    if _usable(path.name) and (companion not in _followed or _usable(companion)):
+        return local_dir() / path.name
+    return path
+
+
+def stats() -> dict:
+    with _lock:
+        s = dict(_stats)
+    ticks = s["ticks"] or 1
+    out = {
+        "role": ROLE,
+        "enabled": enabled(),
+        "leader": _leader_fd is not None,
+        "ticks": s["ticks"],
+        "tick_ms_avg": round(1000 * s["tick_total"] / ticks, 3),
+        "errors": s["errors"],
+        "last_error": s["last_error"],
+    }
+    if ROLE == "replica":
+        files = {name: {"seq": st.get("seq"), "lag_ms": None if lag_ms(name) is None else round(lag_ms(name), 1)}
+                 for name, st in list(_followed.items())}
+        lags = [f["lag_ms"] for f in files.values()]
+        out["files"] = files
+        out["max_lag_ms"] = None if not lags or None in lags else max(lags)
+    else:
+        out["files"] = {name: w.stats() for name, w in list(_shippers.items())}
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="MoneyMate read replication.")
+    ap.add_argument("cmd", choices=("ship", "apply", "status"))
+    ap.add_argument("--once", action="store_true", help="one pass instead of running forever")
+    args = ap.parse_args()
+    if not REPLICA_DIR:
+        ap.error("set DB_REPLICA_DIR")
+
+    if args.cmd == "status":
+        apply_once(leader=False)
+        ROLE = "replica"
+        print(json.dumps(stats(), indent=2))
+    elif args.once:
+        print(f"[DB] {args.cmd}: {ship_once() if args.cmd == 'ship' else apply_once()}")
+    else:
+        ROLE = "primary" if args.cmd == "ship" else "replica"
+        _run()
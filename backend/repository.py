@@ -0,0 +1,348 @@
+# backend/repository.py
+"""
+Every query the blueprints run, one function each.
+
+Handlers validate input and shape responses; the SQL lives here, so a
+query path is tuned in one place. Each function takes the connection to run
+on as `db` - get_db() for reads, the connection run_write() hands its
+callback for writes (functions that write expect to be called there) - and
+returns rows, one row, a count or a flag. Money stays integer cents and
+categories stay ids (see categories.py); handlers convert at the edge.
+
+Which storage is behind `db` is a config switch, not a code path:
+DB_ENGINE=sqlite (the files on disk) or DB_ENGINE=memory (in-memory
+databases, for tests and benchmarks), see database.py. Both run this same
+SQL against the same schema and triggers, so the rollups and archive tiers
+behave identically on either.
+"""
+import heapq
+
+from . import archive
+from .database import returning
+
+# a transaction as the API returns it (ts/month are internal)
+TX_FIELDS = "id, type, amount_cents, category_id, description, created_at"
+TX_COLS = ", ".join(f"t.{col}" for col in TX_FIELDS.split(", "))
+
+
+def _set_clause(changes: dict) -> tuple:
+    """{column: value} -> ("a=?, b=?", [values]). Columns come from the handlers, never from input."""
+    return ", ".join(f"{col}=?" for col in changes), list(changes.values())
+
+
+# ---------- users / password resets (global file) ----------
+def insert_user(db, name, email, password_hash):
+    """-> row(id); raises sqlite3.IntegrityError if the email is taken."""
+    return returning(db, "INSERT INTO users(name,email,password_hash) VALUES(?,?,?) RETURNING id",
+                     (name, email, password_hash))
+
+
+def user_by_email(db, email):
+    return db.execute("SELECT id, name, email, password_hash FROM users WHERE email=?", (email,)).fetchone()
+
+
+def user_by_id(db, user_id):
+    return db.execute("SELECT id, name, email FROM users WHERE id=?", (user_id,)).fetchone()
+
+
+def all_users(db) -> list:
+    return db.execute("SELECT id, name, email FROM users").fetchall()
+
+
+def password_hash(db, user_id):
+    row = db.execute("SELECT password_hash FROM users WHERE id=?", (user_id,)).fetchone()
+    return row["password_hash"] if row else None
+
+
+def set_password_hash(db, user_id, pw_hash) -> int:
+    return db.execute("UPDATE users SET password_hash=? WHERE id=?", (pw_hash, user_id)).rowcount
+
+
+def insert_password_reset(db, email, token, expires_at):
+    """-> row(user_id, name) of the account with that email, or None if there is none (nothing inserted)."""
+    return returning(db, """
+        INSERT INTO password_resets(user_id, token, expires_at)
+        SELECT id, ?, ? FROM users WHERE email=?
+        RETURNING user_id, (SELECT name FROM users WHERE users.id = password_resets.user_id) AS name
+    """, (token, expires_at, email))
+
+
+def password_reset(db, token):
+    return db.execute(
+        "SELECT id, user_id, expires_at, used FROM password_resets WHERE token=?", (token,)
+    ).fetchone()
+
+
+def claim_password_reset(db, reset_id):
+    """Mark the reset used; -> row(user_id), or None if it already was (so a token works once)."""
+    return returning(db, "UPDATE password_resets SET used=1 WHERE id=? AND used=0 RETURNING user_id", (reset_id,))
+
+
+# ---------- data version ----------
+def data_version(db, user_id) -> int:
+    """Bumped by triggers on every write to the user's rows (migration 13); 0 = never written."""
+    row = db.execute("SELECT version FROM data_versions WHERE user_id=?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+# ---------- settings ----------
+def get_settings(db, user_id):
+    return db.execute("SELECT * FROM user_settings WHERE user_id=?", (user_id,)).fetchone()
+
+
+# user_settings column defaults (migration 1), for users who never saved settings
+DEFAULT_SETTINGS = {"currency_symbol": "$", "warn_threshold": 0.8, "critical_threshold": 1.0, "week_starts_monday": 0}
+
+
+def settings_or_defaults(db, user_id) -> dict:
+    """The user's settings, or the defaults if they have no row yet (nothing is written)."""
+    row = get_settings(db, user_id)
+    return dict(row) if row else {"user_id": user_id, **DEFAULT_SETTINGS}
+
+
+def save_settings(db, user_id, currency_symbol, warn_threshold, critical_threshold, week_starts_monday):
+    return returning(db, """
+        INSERT INTO user_settings(user_id, currency_symbol, warn_threshold, critical_threshold, week_starts_monday)
+        VALUES(?,?,?,?,?)
+        ON CONFLICT(user_id) DO UPDATE SET
+          currency_symbol=excluded.currency_symbol,
+          warn_threshold=excluded.warn_threshold,
+          critical_threshold=excluded.critical_threshold,
+          week_starts_monday=excluded.week_starts_monday
+        RETURNING *
+    """, (user_id, currency_symbol, warn_threshold, critical_threshold, week_starts_monday))
+
+
+# ---------- transactions ----------
+def insert_transaction(db, user_id, tx_type, amount_cents, category_id, description, created_at, ts, month):
+    return returning(db, f"""
+        INSERT INTO transactions (user_id, type, amount_cents, category_id, description, created_at, ts, month)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING {TX_FIELDS}
+    """, (user_id, tx_type, amount_cents, category_id, description, created_at, ts, month))
+
+
+def _tx_filters(user_id, tx_type=None, category_id=None, lo=None, hi=None) -> tuple:
+    where, params = ["t.user_id = ?"], [user_id]
+    if tx_type:
+        where.append("t.type = ?"); params.append(tx_type)
+    if category_id is not None:
+        where.append("t.category_id = ?"); params.append(category_id)
+    if lo is not None:
+        where.append("t.ts >= ?"); params.append(lo)
+    if hi is not None:
+        where.append("t.ts < ?"); params.append(hi)
+    return where, params
+
+
+def _merge_tiers(results, key, order, limit=None) -> list:
+    """Merge one already-ordered result per tier (see archive.tiers) into one list."""
+    if len(results) == 1:
+        rows = results[0]
+    else:
+        rows = list(heapq.merge(*results, key=key, reverse=order == "desc"))
+    return rows if limit is None else rows[:limit]
+
+
+def _page_key(r):
+    return r["sort_key"], r["id"]
+
+
+def _category_key(r):
+    return r["sort_name"], r["sort_key"], r["id"]
+
+
+def transactions_page(db, user_id, key, order, limit, after=None, *, tx_type=None, category_id=None, lo=None, hi=None) -> list:
+    """
+    One keyset page ordered by (key, id): `key` is an indexed column (ts or
+    amount_cents), `after` the (key, id) the previous page ended on, lo/hi
+    a [lo, hi) ts range. Rows carry the key as sort_key. Each sort has an
+    index on (user_id, key), so this is one page-sized range scan per tier
+    (see archive.tiers), merged.
+    """
+    where, params = _tx_filters(user_id, tx_type, category_id, lo, hi)
+    if after:
+        # seekable bound on the key, then the id tie-break within equal keys
+        op = "<" if order == "desc" else ">"
+        where.append(f"t.{key} {op}= ? AND (t.{key} {op} ? OR t.id {op} ?)")
+        params.extend([after[0], after[0], after[1]])
+    return _merge_tiers([db.execute(f"""
+        SELECT {TX_COLS}, t.{key} AS sort_key
+        FROM {tier} t
+        WHERE {' AND '.join(where)}
+        ORDER BY t.{key} {order}, t.id {order}
+        LIMIT ?
+    """, (*params, limit)).fetchall() for tier in archive.tiers(db, lo)], _page_key, order, limit)
+
+
+def transactions_page_by_category(db, user_id, order, limit, after=None, after_name=None, *,
+                                  tx_type=None, category_id=None, lo=None, hi=None) -> list:
+    """
+    One keyset page ordered by (category name, ts, id); `after` is
+    ((category_id, ts), id) and after_name that category's name. The
+    cursor's category is finished with a seek on idx_tx_user_cat_ts; later
+    categories come from a categories -> transactions nested loop walking
+    the (user_id, name) unique index, so neither query sorts. Both run once
+    per tier (see archive.tiers) and are merged; rows carry sort_name too.
+    """
+    tiers = archive.tiers(db, lo)
+    where, params = _tx_filters(user_id, tx_type, category_id, lo, hi)
+    op = "<" if order == "desc" else ">"
+    rows, name_bound = [], ""
+    if after:
+        (cid, ts), last_id = after
+        rows = _merge_tiers([db.execute(f"""
+            SELECT {TX_COLS}, t.ts AS sort_key, ? AS sort_name
+            FROM {tier} t
+            WHERE {' AND '.join(where)} AND t.category_id = ?
+              AND t.ts {op}= ? AND (t.ts {op} ? OR t.id {op} ?)
+            ORDER BY t.ts {order}, t.id {order}
+            LIMIT ?
+        """, (after_name, *params, cid, ts, ts, last_id, limit)).fetchall() for tier in tiers],
+            _category_key, order, limit)
+        if len(rows) >= limit:
+            return rows
+        name_bound, params = f"AND c.name {op} ?", [*params, after_name]
+    return rows + _merge_tiers([db.execute(f"""
+        SELECT {TX_COLS}, t.ts AS sort_key, c.name AS sort_name
+        FROM categories c
+        JOIN {tier} t ON t.user_id = c.user_id AND t.category_id = c.id
+        WHERE {' AND '.join(where)} {name_bound}
+        ORDER BY c.name {order}, t.ts {order}, t.id {order}
+        LIMIT ?
+    """, (*params, limit - len(rows))).fetchall() for tier in tiers], _category_key, order, limit - len(rows))
+
+
+def export_transactions(db, user_id, lo=None, hi=None) -> list:
+    """Every transaction in [lo, hi) (both tiers, merged), newest first; rows carry ts as sort_key."""
+    where, params = _tx_filters(user_id, lo=lo, hi=hi)
+    return _merge_tiers([db.execute(f"""
+        SELECT {TX_COLS}, t.ts AS sort_key
+        FROM {tier} t
+        WHERE {' AND '.join(where)}
+        ORDER BY t.ts DESC, t.id DESC
+    """, params).fetchall() for tier in archive.tiers(db, lo)], _page_key, "desc")
+
+
+def transaction_type(db, user_id, txn_id):
+    row = db.execute("SELECT type FROM transactions WHERE id=? AND user_id=?", (txn_id, user_id)).fetchone()
+    return row["type"] if row else None
+
+
+def update_transaction(db, user_id, txn_id, changes: dict):
+    """Apply {column: value}; -> the updated row, or None if there is no such transaction."""
+    sets, params = _set_clause(changes)
+    return returning(db, f"UPDATE transactions SET {sets} WHERE id=? AND user_id=? RETURNING {TX_FIELDS}",
+                     (*params, txn_id, user_id))
+
+
+def delete_transaction(db, user_id, txn_id) -> int:
+    return db.execute("DELETE FROM transactions WHERE id=? AND user_id=?", (txn_id, user_id)).rowcount
+
+
+def has_duplicate(db, user_id, tx_type, amount_cents, description, ts) -> bool:
+    """Import duplicate guard: same minute + type + amount + description."""
+    minute = ts - ts % 60
+    return db.execute("""
+        SELECT id FROM transactions
+        WHERE user_id=? AND ts >= ? AND ts < ?
+          AND type=? AND amount_cents=?
+          AND IFNULL(description,'')=?
+        LIMIT 1
+    """, (user_id, minute, minute + 60, tx_type, amount_cents, description)).fetchone() is not None
+
+
+def totals_since(db, user_id, since_ts) -> list:
+    """Raw (type, category_id, amount_cents) sums over transactions from since_ts on."""
+    return db.execute("""
+        SELECT type, category_id, SUM(amount_cents) AS amount_cents
+        FROM transactions
+        WHERE user_id=? AND ts >= ?
+        GROUP BY type, category_id
+    """, (user_id, since_ts)).fetchall()
+
+
+# ---------- budgets ----------
+def insert_budget(db, user_id, category_id, limit_cents):
+    return returning(db, "INSERT INTO budgets (user_id, category_id, monthly_limit_cents) VALUES (?,?,?) "
+                         "RETURNING id, category_id, monthly_limit_cents, created_at",
+                     (user_id, category_id, limit_cents))
+
+
+def budgets_with_spend(db, user_id, month) -> list:
+    """Every budget with its category's expense total for `month` (YYYY-MM) from the rollup."""
+    return db.execute("""
+        SELECT
+          b.id, b.category_id, b.monthly_limit_cents, b.created_at,
+          IFNULL(r.total_cents, 0) AS spent_mtd_cents
+        FROM budgets b
+        LEFT JOIN tx_monthly_rollup r
+          ON r.user_id = b.user_id AND r.month = ?
+         AND r.type = 'expense' AND r.category_id = b.category_id
+        WHERE b.user_id = ?
+    """, (month, user_id)).fetchall()
+
+
+def update_budget(db, user_id, budget_id, changes: dict):
+    sets, params = _set_clause(changes)
+    return returning(db, f"UPDATE budgets SET {sets} WHERE id=? AND user_id=? "
+                         "RETURNING id, category_id, monthly_limit_cents, created_at",
+                     (*params, budget_id, user_id))
+
+
+def delete_budget(db, user_id, budget_id) -> int:
+    return db.execute("DELETE FROM budgets WHERE id=? AND user_id=?", (budget_id, user_id)).rowcount
+
+
+# ---------- goals ----------
+def insert_goal(db, user_id, name, category_id, target_cents, target_date):
+    return returning(db, """
+        INSERT INTO goals (user_id, name, category_id, target_amount_cents, target_date)
+        VALUES (?,?,?,?,?)
+        RETURNING *
+    """, (user_id, name, category_id, target_cents, target_date))
+
+
+def open_goals(db, user_id) -> list:
+    """Goals not archived, active ones first, newest first."""
+    return db.execute(
+        "SELECT * FROM goals WHERE user_id=? AND status!='archived' ORDER BY status DESC, created_at DESC",
+        (user_id,)
+    ).fetchall()
+
+
+def update_goal(db, user_id, goal_id, changes: dict):
+    sets, params = _set_clause(changes)
+    return returning(db, f"UPDATE goals SET {sets} WHERE id=? AND user_id=? RETURNING *",
+                     (*params, goal_id, user_id))
+
+
+def delete_goal(db, user_id, goal_id) -> int:
+    # Clean contributions; ON DELETE CASCADE will also handle if enabled
+    db.execute("DELETE FROM goal_contributions WHERE goal_id=? AND user_id=?", (goal_id, user_id))
+    return db.execute("DELETE FROM goals WHERE id=? AND user_id=?", (goal_id, user_id)).rowcount
+
+
+def add_to_goal(db, user_id, goal_id, amount_cents):
+    """Bump saved_amount_cents; -> the updated goal, or None if there is no such goal."""
+    return returning(
+        db,
+        "UPDATE goals SET saved_amount_cents = saved_amount_cents + ? WHERE id=? AND user_id=? RETURNING *",
+        (amount_cents, goal_id, user_id),
+    )
+
+
+def insert_contribution(db, user_id, goal_id, amount_cents, note, created_at=None):
+    db.execute("""
+        INSERT INTO goal_contributions (user_id, goal_id, amount_cents, note, created_at)
+        VALUES (?,?,?,?,COALESCE(?, datetime('now')))
+    """, (user_id, goal_id, amount_cents, note, created_at))
+
+
+def contributions(db, user_id, goal_id) -> list:
+    return db.execute("""
+        SELECT id, amount_cents, note, created_at
+        FROM goal_contributions
+        WHERE user_id=? AND goal_id=?
+        ORDER BY datetime(created_at) DESC
+    """, (user_id, goal_id)).fetchall()
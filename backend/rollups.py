@@ -0,0 +1,189 @@
+# backend/rollups.py
+"""
+Pre-aggregated transaction totals and the time-series engine built on them.
+
+  tx_monthly_rollup  one row per (user, yyyymm month, type, category_id)
+  tx_daily_rollup    one row per (user, UTC day, type); day = ts // 86400
+
+Both are kept current by triggers on `transactions` (migrations 5-8),
+so every write path - create, update, delete, CSV import, goal
+contributions - maintains them without extra code. They also keep counting
+rows moved to the cold archive (see archive.py), so they always cover the
+whole history. If they are ever suspected to drift, rebuild them from raw
+rows (both tiers):
+
+    python -m backend.rollups [--user USER_ID]
+"""
+from datetime import date, timedelta
+
+from . import archive, categories
+from .utils.money import from_cents
+
+GRANULARITIES = ("day", "week", "month")
+EPOCH = date(1970, 1, 1)
+
+
+def rebuild_monthly(db, user_id=None) -> int:
+    """Recompute tx_monthly_rollup (for one user or everyone). Caller commits."""
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id else ("", ())
+    src = archive.source(db)
+    db.execute(f"DELETE FROM tx_monthly_rollup {where}", params)
+    cur = db.execute(f"""
+        INSERT INTO tx_monthly_rollup(user_id, month, type, category_id, total_cents, count)
+        SELECT user_id, month, type, category_id, SUM(amount_cents), COUNT(*)
+        FROM {src} {where}
+        GROUP BY user_id, month, type, category_id
+    """, params)
+    return cur.rowcount
+
+
+def rebuild_daily(db, user_id=None) -> int:
+    """Recompute tx_daily_rollup (for one user or everyone). Caller commits."""
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id else ("", ())
+    src = archive.source(db)
+    db.execute(f"DELETE FROM tx_daily_rollup {where}", params)
+    cur = db.execute(f"""
+        INSERT INTO tx_daily_rollup(user_id, day, type, total_cents, count)
+        SELECT user_id, ts / 86400, type, SUM(amount_cents), COUNT(*)
+        FROM {src} {where}
+        GROUP BY user_id, ts / 86400, type
+    """, params)
+    return cur.rowcount
+
+
+def rebuild_all(db, user_id=None) -> dict:
+    return {
+        "tx_monthly_rollup": rebuild_monthly(db, user_id),
+        "tx_daily_rollup": rebuild_daily(db, user_id),
+    }
+
+
+# ---------- time series ----------
+def _day_num(d: date) -> int:
+    return (d - EPOCH).days
+
+
+def _month_key(d: date) -> int:
+    return d.year * 100 + d.month
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def bucket_start(d: date, granularity: str, week_starts_monday=False) -> date:
+    if granularity == "month":
+        return d.replace(day=1)
+    if granularity == "week":
+        offset = d.weekday() if week_starts_monday else (d.weekday() + 1) % 7
+        return d - timedelta(days=offset)
+    return d
+
+
+def bucket_count(start: date, end: date, granularity: str, week_starts_monday=False) -> int:
+    first = bucket_start(start, granularity, week_starts_monday)
+    if granularity == "month":
+        return (end.year - first.year) * 12 + end.month - first.month + 1
+    step = 7 if granularity == "week" else 1
+    return (end - first).days // step + 1
+
+
+def time_series(db, user_id, start: date, end: date, granularity="day", week_starts_monday=False) -> list:
+    """
+    Income/expense/net per bucket for the inclusive [start, end] UTC date
+    range, answered from rollups. Work is proportional to the number of
+    buckets: whole months come from tx_monthly_rollup, everything else
+    (days, weeks, partial edge months) from tx_daily_rollup. Buckets are
+    labelled by their natural start date; edge buckets only count days
+    inside the range. Weeks start on Sunday unless week_starts_monday.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    buckets = {}
+    d = bucket_start(start, granularity, week_starts_monday)
+    while d <= end:
+        buckets[d] = {"income": 0, "expense": 0}  # cents
+        if granularity == "month":
+            d = _next_month(d)
+        else:
+            d += timedelta(days=7 if granularity == "week" else 1)
+
+    def add(day: date, tx_type: str, cents: int):
+        buckets[bucket_start(day, granularity, week_starts_monday)][tx_type] += cents
+
+    daily_ranges = [(start, end)]
+    if granularity == "month":
+        # whole months inside the range come straight from the monthly rollup
+        first_full = start if start.day == 1 else _next_month(start)
+        last_full_end = _next_month(end) - timedelta(days=1)
+        if end != last_full_end:
+            last_full_end = end.replace(day=1) - timedelta(days=1)
+        if first_full <= last_full_end:
+            for r in db.execute("""
+                SELECT month, type, SUM(total_cents) AS total_cents
+                FROM tx_monthly_rollup
+                WHERE user_id=? AND month >= ? AND month <= ?
+                GROUP BY month, type
+            """, (user_id, _month_key(first_full), _month_key(last_full_end))).fetchall():
+                add(date(r["month"] // 100, r["month"] % 100, 1), r["type"], r["total_cents"])
+            daily_ranges = [(start, first_full - timedelta(days=1)),
+                            (last_full_end + timedelta(days=1), end)]
+
+    for lo, hi in daily_ranges:
+        if lo > hi:
+            continue
+        for r in db.execute("""
+            SELECT day, type, total_cents
+            FROM tx_daily_rollup
+            WHERE user_id=? AND day >= ? AND day <= ?
+        """, (user_id, _day_num(lo), _day_num(hi))).fetchall():
+            add(EPOCH + timedelta(days=r["day"]), r["type"], r["total_cents"])
+
+    out = []
+    for d, b in buckets.items():
+        out.append({"date": d.isoformat(), "income": from_cents(b["income"]),
+                    "expense": from_cents(b["expense"]),
+                    "net": from_cents(b["income"] - b["expense"])})
+    return out
+
+
+def totals_by_type(db, user_id) -> dict:
+    rows = db.execute("""
+        SELECT type, SUM(total_cents) AS total_cents
+        FROM tx_monthly_rollup
+        WHERE user_id=?
+        GROUP BY type
+    """, (user_id,)).fetchall()
+    return {r["type"]: from_cents(r["total_cents"]) for r in rows}
+
+
+def totals_by_category(db, user_id) -> list:
+    rows = db.execute("""
+        SELECT category_id, SUM(total_cents) AS total_cents
+        FROM tx_monthly_rollup
+        WHERE user_id=?
+        GROUP BY category_id
+        ORDER BY total_cents DESC
+    """, (user_id,)).fetchall()
+    names = categories.names(db, user_id, [r["category_id"] for r in rows])
+    return [{"category": names.get(r["category_id"]), "total": from_cents(r["total_cents"])} for r in rows]
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import migrate_all, _connect, shard_paths, user_db_path
+
+    ap = argparse.ArgumentParser(description="Rebuild MoneyMate rollup tables from raw transactions.")
+    ap.add_argument("--user", type=int, default=None, help="only this user_id")
+    args = ap.parse_args()
+
+    migrate_all()
+    for path in ([user_db_path(args.user)] if args.user else shard_paths()):
+        db = _connect(path)
+        try:
+            counts = rebuild_all(db, args.user)
+            db.commit()
+        finally:
+            db.close()
+        print(f"[DB] Rollups rebuilt in {path.name}: {counts}")
@@ -0,0 +1,38 @@
+# backend/routes/admin.py
+from flask import Blueprint, jsonify, request
+from ..database import pool_stats, coordinator_stats, lock_metrics, get_global_db
+from .. import backup, cache, maintenance, replication
+from ..utils.authz import require_admin_key
+
+# Ops endpoints under /api/admin/* (guarded by ADMIN_API_KEY)
+admin_bp = Blueprint("admin", __name__, url_prefix="/api/admin")
+
+@admin_bp.get("/metrics")
+@require_admin_key
+def metrics():
+    return jsonify(
+        ok=True,
+        db_pools=pool_stats(),
+        group_commit=coordinator_stats(),
+        db_locks=lock_metrics.snapshot(),
+        replication=replication.stats(),
+        maintenance=maintenance.history(get_global_db()),
+        response_cache=cache.stats(),
+    )
+
+@admin_bp.post("/backup")
+@require_admin_key
+def start_backup():
+    """Start an online backup of every database file into DB_BACKUP_DIR."""
+    data = request.get_json(silent=True) or {}
+    compress = str(data.get("compress", request.args.get("compress", ""))).lower() in ("1", "true", "yes")
+    job = backup.start(compress=compress)
+    if job is None:
+        return jsonify(ok=False, error="A backup is already running", backup=backup.status()), 409
+    return jsonify(ok=True, backup=job), 202
+
+@admin_bp.get("/backup")
+@require_admin_key
+def backup_status():
+    """Progress/result of the latest backup started by this worker."""
+    return jsonify(ok=True, backup=backup.status())
@@ -3,9 +3,10 @@ from flask import Blueprint, request, jsonify, session, g, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 from functools import wraps
-import re, secrets, jwt, os
+import re, secrets, sqlite3, jwt, os
 
-from ..database import get_db
+from ..database import get_global_db, run_write, shard_path
+from .. import repository, shards
 from ..utils.mailer import send_email, build_reset_email
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/api/auth")
@@ -112,19 +113,15 @@ def register():
     if confirm and password != confirm:
         return jsonify(ok=False, success=False, message="Passwords do not match"), 400
 
-    db = get_db()
-    exists = db.execute("SELECT 1 FROM users WHERE email=?", (email,)).fetchone()
-    if exists:
+    # users.email is UNIQUE: the insert itself is the duplicate check
+    try:
+        pw_hash = generate_password_hash(password)
+        user_id = run_write(lambda db: repository.insert_user(db, name, email, pw_hash), path=shard_path(0))["id"]
+    except sqlite3.IntegrityError:
         return jsonify(ok=False, success=False, message="Email already registered"), 409
-
-    db.execute(
-        "INSERT INTO users(name,email,password_hash) VALUES(?,?,?)",
-        (name, email, generate_password_hash(password)),
-    )
-    db.commit()
+    shards.ensure_user(user_id)
 
     # Issue token right away (auto-login)
-    user_id = db.execute("SELECT id FROM users WHERE email=?", (email,)).fetchone()["id"]
     token = generate_jwt(user_id, email)
     return jsonify(
         ok=True, success=True,
@@ -143,12 +140,12 @@ def login():
     if not EMAIL_RE.match(email) or not password:
         return jsonify(ok=False, success=False, message="Invalid email or password"), 400
 
-    row = get_db().execute(
-        "SELECT id, name, email, password_hash FROM users WHERE email=?", (email,)
-    ).fetchone()
+    row = repository.user_by_email(get_global_db(), email)
     if not row or not check_password_hash(row["password_hash"], password):
         return jsonify(ok=False, success=False, message="Invalid email or password"), 401
 
+    shards.ensure_user(row["id"])  # e.g. after DB_SHARDS was raised without a rebalance
+
     # Optional session for same-site deployments
     session["user_id"] = row["id"]
     session.permanent = True
@@ -173,7 +170,7 @@ def me():
     uid = get_current_user_id()
     if not uid:
         return jsonify(ok=False, success=False), 401
-    r = get_db().execute("SELECT id, name, email FROM users WHERE id=?", (uid,)).fetchone()
+    r = repository.user_by_id(get_global_db(), uid)
     return jsonify(ok=True, success=True, data=(dict(r) if r else None))
 
 # ─────────────────── Token verify / refresh ───────────────────
@@ -184,9 +181,7 @@ def token_verify():
     uid, email = _decode_bearer_token()
     if not uid:
         return jsonify(success=False, ok=False, message="Invalid token"), 401
-    row = get_db().execute(
-        "SELECT id, name, email FROM users WHERE id=?", (uid,)
-    ).fetchone()
+    row = repository.user_by_id(get_global_db(), uid)
     user = dict(row) if row else {"id": uid, "name": None, "email": email}
     return jsonify(success=True, ok=True, user=user)
 
@@ -218,13 +213,13 @@ def change_password():
     if confirm and new != confirm:
         return jsonify(ok=False, success=False, message="Passwords do not match"), 400
 
-    db = get_db()
-    row = db.execute("SELECT password_hash FROM users WHERE id=?", (uid,)).fetchone()
-    if not row or not check_password_hash(row["password_hash"], cur):
+    db = get_global_db()
+    pw_hash = repository.password_hash(db, uid)
+    if not pw_hash or not check_password_hash(pw_hash, cur):
         return jsonify(ok=False, success=False, message="Current password is incorrect"), 400
 
-    db.execute("UPDATE users SET password_hash=? WHERE id=?", (generate_password_hash(new), uid))
-    db.commit()
+    new_hash = generate_password_hash(new)
+    run_write(lambda wdb: repository.set_password_hash(wdb, uid, new_hash), path=shard_path(0))
     return jsonify(ok=True, success=True, message="Password changed")
 
 # ─────────────────── Forgot password ───────────────────
@@ -239,18 +234,12 @@ def forgot_start():
     if not EMAIL_RE.match(email):
         return jsonify(ok=True, success=True)
 
-    db = get_db()
-    u = db.execute("SELECT id, name FROM users WHERE email=?", (email,)).fetchone()
-    if not u:
-        return jsonify(ok=True, success=True)
-
+    # one INSERT ... SELECT ... RETURNING: no row back means no such account
     token = secrets.token_urlsafe(32)
     expires = (datetime.utcnow() + timedelta(hours=2)).isoformat()
-    db.execute(
-        "INSERT INTO password_resets(user_id, token, expires_at) VALUES(?,?,?)",
-        (u["id"], token, expires),
-    )
-    db.commit()
+    u = run_write(lambda db: repository.insert_password_reset(db, email, token, expires), path=shard_path(0))
+    if not u:
+        return jsonify(ok=True, success=True)
 
     front = os.getenv("FRONTEND_URL", "https://web262.github.io/MoneyMate")
     link = f"{front}/reset.html?token={token}"
@@ -275,11 +264,8 @@ def forgot_complete():
     if confirm and new != confirm:
         return jsonify(ok=False, success=False, message="Passwords do not match"), 400
 
-    db = get_db()
-    row = db.execute("""
-        SELECT pr.id, pr.user_id, pr.expires_at, pr.used
-        FROM password_resets pr WHERE pr.token=?
-    """, (token,)).fetchone()
+    db = get_global_db()
+    row = repository.password_reset(db, token)
     if not row:
         return jsonify(ok=False, success=False, message="Invalid token"), 400
     if row["used"]:
@@ -293,10 +279,16 @@ def forgot_complete():
     if datetime.utcnow() > exp:
         return jsonify(ok=False, success=False, message="Token expired"), 400
 
-    db.execute(
-        "UPDATE users SET password_hash=? WHERE id=?",
-        (generate_password_hash(new), row["user_id"])
-    )
-    db.execute("UPDATE password_resets SET used=1 WHERE id=?", (row["id"],))
-    db.commit()
+    new_hash = generate_password_hash(new)
+
+    def complete(wdb):
+        # claiming the token and setting the password commit together; a
+        # concurrent request with the same token gets None here
+        claimed = repository.claim_password_reset(wdb, row["id"])
+        if claimed:
+            repository.set_password_hash(wdb, claimed["user_id"], new_hash)
+        return claimed
+
+    if not run_write(complete, path=shard_path(0)):
+        return jsonify(ok=False, success=False, message="Token already used"), 400
     return jsonify(ok=True, success=True, message="Password reset successful")
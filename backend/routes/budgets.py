@@ -1,30 +1,21 @@
 # backend/routes/budgets.py
 from flask import Blueprint, request, jsonify, g
-from ..database import get_db
+from ..database import get_db, run_write
+from .. import cache, categories, repository
+from ..utils.dates import current_month
+from ..utils.money import to_cents, from_cents
 from .auth import login_required
 
 # All routes live under /api/budgets/*
 budgets_bp = Blueprint("budgets", __name__, url_prefix="/api/budgets")
 
-# ---------- schema ----------
-def ensure_schema():
-    db = get_db()
-    db.execute("""
-        CREATE TABLE IF NOT EXISTS budgets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            category TEXT NOT NULL,
-            monthly_limit REAL NOT NULL,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            UNIQUE(user_id, category) ON CONFLICT REPLACE,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        );
-    """)
-    db.commit()
-
-@budgets_bp.before_app_request
-def _ensure():
-    ensure_schema()
+def budget_row_to_dict(r, names) -> dict:
+    return {
+        "id": r["id"],
+        "category": names.get(r["category_id"]),
+        "monthly_limit": from_cents(r["monthly_limit_cents"]),
+        "created_at": r["created_at"],
+    }
 
 # ---------- create (POST /api/budgets/ or /api/budgets/add) ----------
 @budgets_bp.post("/")
@@ -36,56 +27,37 @@ def create_budget():
     data = request.get_json(silent=True) or {}
     category = (data.get("category") or "").strip()
     try:
-        limit = float(data.get("monthly_limit"))
+        limit = to_cents(data.get("monthly_limit"))
     except Exception:
         limit = -1
 
     if not category or limit <= 0:
         return jsonify(success=False, message="Provide category and positive monthly_limit"), 400
 
-    db = get_db()
-    cur = db.execute(
-        "INSERT INTO budgets (user_id, category, monthly_limit) VALUES (?,?,?)",
-        (uid, category, limit),
-    )
-    db.commit()
-    bid = cur.lastrowid
-    row = db.execute(
-        "SELECT id, category, monthly_limit, created_at FROM budgets WHERE id=?",
-        (bid,)
-    ).fetchone()
-    return jsonify(success=True, budget=dict(row)), 201
+    row = run_write(lambda db: repository.insert_budget(db, uid, categories.intern(db, uid, category), limit))
+    return jsonify(success=True, budget=budget_row_to_dict(row, {row["category_id"]: category})), 201
 
 # ---------- list with MTD usage (GET /api/budgets/all) ----------
 @budgets_bp.get("/all")
 @login_required
+@cache.conditional
+@cache.cached
 def list_budgets():
     uid = g.user_id
 
     db = get_db()
-    rows = db.execute("""
-        SELECT
-          b.id, b.category, b.monthly_limit, b.created_at,
-          IFNULL((
-            SELECT SUM(t.amount) FROM transactions t
-            WHERE t.user_id = b.user_id
-              AND t.type = 'expense'
-              AND t.category = b.category
-              AND strftime('%Y-%m', t.created_at) = strftime('%Y-%m','now')
-          ), 0) AS spent_mtd
-        FROM budgets b
-        WHERE b.user_id = ?
-        ORDER BY lower(b.category)
-    """, (uid,)).fetchall()
+    rows = repository.budgets_with_spend(db, uid, current_month())
+    names = categories.names(db, uid, [r["category_id"] for r in rows])
+    rows = sorted(rows, key=lambda r: (names.get(r["category_id"]) or "").lower())
 
     items = []
     for r in rows:
-        limit = float(r["monthly_limit"])
-        spent = float(r["spent_mtd"])
+        limit = from_cents(r["monthly_limit_cents"])
+        spent = from_cents(r["spent_mtd_cents"])
         used_ratio = (spent / limit) if limit > 0 else 0.0
         items.append({
             "id": r["id"],
-            "category": r["category"],
+            "category": names.get(r["category_id"]),
             "monthly_limit": limit,
             "spent_mtd": spent,
             "used_ratio": round(used_ratio, 4),
@@ -100,55 +72,50 @@ def update_budget(bid: int):
     uid = g.user_id
 
     data = request.get_json(silent=True) or {}
-    fields, params = [], []
+    changes = {}
+    cat = None  # interned inside the write
 
     if "category" in data:
         cat = (data.get("category") or "").strip()
         if not cat:
             return jsonify(success=False, message="Category cannot be empty"), 400
-        fields.append("category=?"); params.append(cat)
 
     if "monthly_limit" in data:
         try:
-            lim = float(data.get("monthly_limit")); assert lim > 0
+            lim = to_cents(data.get("monthly_limit")); assert lim > 0
         except Exception:
             return jsonify(success=False, message="monthly_limit must be > 0"), 400
-        fields.append("monthly_limit=?"); params.append(lim)
+        changes["monthly_limit_cents"] = lim
 
-    if not fields:
+    if not changes and cat is None:
         return jsonify(success=False, message="No changes"), 400
 
-    params.extend([bid, uid])
-    db = get_db()
-    db.execute(
-        f"UPDATE budgets SET {', '.join(fields)} WHERE id=? AND user_id=?",
-        tuple(params)
-    )
-    db.commit()
-
-    row = db.execute(
-        "SELECT id, category, monthly_limit, created_at FROM budgets WHERE id=? AND user_id=?",
-        (bid, uid)
-    ).fetchone()
+    def write(db):
+        c = dict(changes)
+        if cat is not None:
+            c["category_id"] = categories.intern(db, uid, cat)
+        return repository.update_budget(db, uid, bid, c)
+
+    row = run_write(write)
     if not row:
         return jsonify(success=False, message="Not found"), 404
-    return jsonify(success=True, budget=dict(row))
+    names = categories.names(get_db(), uid, [row["category_id"]])
+    return jsonify(success=True, budget=budget_row_to_dict(row, names))
 
 # ---------- delete (DELETE /api/budgets/<id>) ----------
 @budgets_bp.delete("/<int:bid>")
 @login_required
 def delete_budget(bid: int):
     uid = g.user_id
-    db = get_db()
-    cur = db.execute("DELETE FROM budgets WHERE id=? AND user_id=?", (bid, uid))
-    db.commit()
-    if cur.rowcount == 0:
+    deleted = run_write(lambda db: repository.delete_budget(db, uid, bid))
+    if deleted == 0:
         return jsonify(success=False, message="Not found"), 404
     return jsonify(success=True)
 
 # ---------- progress (GET /api/budgets/progress) ----------
 @budgets_bp.get("/progress")
 @login_required
+@cache.cached
 def get_progress():
     """
     Returns: { success, progress: [{category, monthly_limit, spent_mtd, pct}] }
@@ -156,29 +123,17 @@ def get_progress():
     """
     uid = g.user_id
     db = get_db()
-    rows = db.execute("""
-        SELECT
-          b.category,
-          b.monthly_limit,
-          IFNULL((
-            SELECT SUM(t.amount) FROM transactions t
-            WHERE t.user_id = b.user_id
-              AND t.type = 'expense'
-              AND t.category = b.category
-              AND strftime('%Y-%m', t.created_at) = strftime('%Y-%m','now')
-          ), 0) AS spent_mtd
-        FROM budgets b
-        WHERE b.user_id = ?
-        ORDER BY lower(b.category)
-    """, (uid,)).fetchall()
+    rows = repository.budgets_with_spend(db, uid, current_month())
+    names = categories.names(db, uid, [r["category_id"] for r in rows])
+    rows = sorted(rows, key=lambda r: (names.get(r["category_id"]) or "").lower())
 
     out = []
     for r in rows:
-        limit = float(r["monthly_limit"])
-        spent = float(r["spent_mtd"])
+        limit = from_cents(r["monthly_limit_cents"])
+        spent = from_cents(r["spent_mtd_cents"])
         pct = (spent / limit) if limit > 0 else 0.0
         out.append({
-            "category": r["category"],
+            "category": names.get(r["category_id"]),
             "monthly_limit": limit,
             "spent_mtd": spent,
             "pct": round(pct, 4),
@@ -188,6 +143,7 @@ def get_progress():
 # ---------- alerts (GET /api/budgets/alerts) ----------
 @budgets_bp.get("/alerts")
 @login_required
+@cache.cached
 def get_alerts():
     """
     Simple alerts when a category crosses 80% or 100% of monthly limit (MTD).
@@ -196,41 +152,30 @@ def get_alerts():
     """
     uid = g.user_id
     db = get_db()
-    rows = db.execute("""
-        SELECT
-          b.category,
-          b.monthly_limit,
-          IFNULL((
-            SELECT SUM(t.amount) FROM transactions t
-            WHERE t.user_id = b.user_id
-              AND t.type = 'expense'
-              AND t.category = b.category
-              AND strftime('%Y-%m', t.created_at) = strftime('%Y-%m','now')
-          ), 0) AS spent_mtd
-        FROM budgets b
-        WHERE b.user_id = ?
-    """, (uid,)).fetchall()
+    rows = repository.budgets_with_spend(db, uid, current_month())
+    names = categories.names(db, uid, [r["category_id"] for r in rows])
 
     alerts = []
     for r in rows:
-        limit = float(r["monthly_limit"])
-        spent = float(r["spent_mtd"])
+        category = names.get(r["category_id"])
+        limit = from_cents(r["monthly_limit_cents"])
+        spent = from_cents(r["spent_mtd_cents"])
         pct = (spent / limit) if limit > 0 else 0.0
         if limit <= 0:
             continue
         if pct >= 1.0:
             alerts.append({
-                "category": r["category"],
+                "category": category,
                 "pct": round(pct, 4),
                 "level": "danger",
-                "message": f"You exceeded your {r['category']} budget (spent ${spent:.0f} / ${limit:.0f})."
+                "message": f"You exceeded your {category} budget (spent ${spent:.0f} / ${limit:.0f})."
             })
         elif pct >= 0.8:
             alerts.append({
-                "category": r["category"],
+                "category": category,
                 "pct": round(pct, 4),
                 "level": "warning",
-                "message": f"You're at {pct*100:.0f}% of your {r['category']} budget (${spent:.0f} / ${limit:.0f})."
+                "message": f"You're at {pct*100:.0f}% of your {category} budget (${spent:.0f} / ${limit:.0f})."
             })
 
     return jsonify(success=True, alerts=alerts)
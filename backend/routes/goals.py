@@ -1,71 +1,16 @@
 # backend/routes/goals.py
 from flask import Blueprint, request, jsonify, g
-from datetime import datetime, date
-from ..database import get_db
+from datetime import datetime
+from ..database import get_db, run_write
+from .. import cache, categories, repository
+from ..utils.dates import tx_time_fields, today_utc
+from ..utils.money import to_cents, from_cents
+from ..utils import jsonfmt
 from .auth import login_required
 
 # All endpoints under /api/goals/*
 goals_bp = Blueprint("goals", __name__, url_prefix="/api/goals")
 
-def ensure_schema():
-    """
-    Create tables (if needed) and migrate old goals tables to the current schema.
-    """
-    db = get_db()
-    # 1) Create tables if they don't exist
-    db.execute("""
-        CREATE TABLE IF NOT EXISTS goals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            category TEXT,
-            target_amount REAL NOT NULL,
-            saved_amount REAL NOT NULL DEFAULT 0,
-            target_date TEXT,
-            status TEXT NOT NULL DEFAULT 'active',
-            created_at TEXT NOT NULL DEFAULT (datetime('now'))
-        )
-    """)
-    db.execute("""
-        CREATE TABLE IF NOT EXISTS goal_contributions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            goal_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            note TEXT,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY(goal_id) REFERENCES goals(id) ON DELETE CASCADE
-        )
-    """)
-
-    # 2) MIGRATE existing `goals` table columns if missing
-    cols = {r["name"] for r in db.execute("PRAGMA table_info(goals)").fetchall()}
-    def add(col_sql: str):
-        db.execute(f"ALTER TABLE goals ADD COLUMN {col_sql}")
-
-    if "category" not in cols:
-        add("category TEXT")
-    if "saved_amount" not in cols:
-        add("saved_amount REAL NOT NULL DEFAULT 0")
-    if "target_date" not in cols:
-        add("target_date TEXT")
-    if "status" not in cols:
-        add("status TEXT NOT NULL DEFAULT 'active'")
-    if "created_at" not in cols:
-        # SQLite ALTER ADD can't set function default; add then backfill.
-        add("created_at TEXT")
-        db.execute("""
-            UPDATE goals
-            SET created_at = COALESCE(created_at, datetime('now'))
-            WHERE created_at IS NULL OR created_at = ''
-        """)
-
-    db.commit()
-
-@goals_bp.before_app_request
-def before_any():
-    ensure_schema()
-
 def iso_to_date(s):
     if not s: return None
     try:
@@ -76,13 +21,13 @@ def iso_to_date(s):
         except Exception:
             return None
 
-def goal_row_to_dict(r):
+def goal_row_to_dict(r, names):
     return {
         "id": r["id"],
         "name": r["name"],
-        "category": r["category"],
-        "target_amount": float(r["target_amount"]),
-        "saved_amount": float(r["saved_amount"]),
+        "category": names.get(r["category_id"]),
+        "target_amount": from_cents(r["target_amount_cents"]),
+        "saved_amount": from_cents(r["saved_amount_cents"]),
         "target_date": r["target_date"],
         "status": r["status"],
         "created_at": r["created_at"],
@@ -92,7 +37,7 @@ def enrich_goal(g):
     target = float(g["target_amount"] or 0)
     saved = float(g["saved_amount"] or 0)
     pct = (saved / target) if target > 0 else 0.0
-    today = date.today()
+    today = today_utc()
     tgt = iso_to_date(g["target_date"])
     days_left = (tgt - today).days if tgt else None
     remain = max(0.0, target - saved)
@@ -118,7 +63,7 @@ def create_goal():
     name = (data.get("name") or "").strip()
     category = (data.get("category") or "").strip() or None
     try:
-        target_amount = float(data.get("target_amount") or 0)
+        target_amount = to_cents(data.get("target_amount") or 0)
     except Exception:
         target_amount = 0
     target_date = data.get("target_date")
@@ -127,27 +72,24 @@ def create_goal():
     if not name or target_amount <= 0:
         return jsonify(success=False, message="Invalid goal payload"), 400
 
-    db = get_db()
-    cur = db.execute("""
-        INSERT INTO goals (user_id, name, category, target_amount, target_date)
-        VALUES (?,?,?,?,?)
-    """, (uid, name, category, target_amount, target_date))
-    db.commit()
-    gid = cur.lastrowid
-    row = db.execute("SELECT * FROM goals WHERE id=? AND user_id=?", (gid, uid)).fetchone()
-    return jsonify(success=True, goal=enrich_goal(goal_row_to_dict(row))), 201
+    def write(db):
+        cid = categories.intern(db, uid, category) if category else None
+        return repository.insert_goal(db, uid, name, cid, target_amount, target_date)
+
+    row = run_write(write)
+    return jsonify(success=True, goal=enrich_goal(goal_row_to_dict(row, {row["category_id"]: category}))), 201
 
 # -------- List goals --------
 @goals_bp.get("/")
 @goals_bp.get("/all")
 @login_required
+@cache.conditional
 def list_goals():
     uid = g.user_id
-    rows = get_db().execute(
-        "SELECT * FROM goals WHERE user_id=? AND status!='archived' ORDER BY status DESC, created_at DESC",
-        (uid,)
-    ).fetchall()
-    return jsonify(success=True, goals=[enrich_goal(goal_row_to_dict(r)) for r in rows])
+    db = get_db()
+    rows = repository.open_goals(db, uid)
+    names = categories.names(db, uid, [r["category_id"] for r in rows])
+    return jsonify(success=True, goals=[enrich_goal(goal_row_to_dict(r, names)) for r in rows])
 
 # -------- Update goal --------
 @goals_bp.patch("/<int:goal_id>")
@@ -155,53 +97,51 @@ def list_goals():
 def update_goal(goal_id: int):
     uid = g.user_id
     data = request.get_json(silent=True) or {}
-    fields, params = [], []
+    changes = {}
+    cat = (data.get("category") or "").strip()  # interned inside the write; blank clears it
 
     if "name" in data:
-        fields.append("name=?"); params.append((data.get("name") or "").strip())
-    if "category" in data:
-        fields.append("category=?"); params.append(((data.get("category") or "").strip() or None))
+        changes["name"] = (data.get("name") or "").strip()
     if "target_amount" in data:
         try:
-            ta = float(data.get("target_amount"))
+            ta = to_cents(data.get("target_amount"))
             assert ta > 0
         except Exception:
             return jsonify(success=False, message="Invalid target_amount"), 400
-        fields.append("target_amount=?"); params.append(ta)
+        changes["target_amount_cents"] = ta
     if "target_date" in data:
         td = data.get("target_date")
         if td and iso_to_date(td) is None:
             return jsonify(success=False, message="Invalid target_date"), 400
-        fields.append("target_date=?"); params.append(td)
+        changes["target_date"] = td
     if "status" in data:
         st = (data.get("status") or "").strip().lower()
         if st not in ("active","achieved","archived"):
             return jsonify(success=False, message="Invalid status"), 400
-        fields.append("status=?"); params.append(st)
+        changes["status"] = st
 
-    if not fields:
+    if not changes and "category" not in data:
         return jsonify(success=False, message="No changes"), 400
 
-    params.extend([goal_id, uid])
-    db = get_db()
-    db.execute(f"UPDATE goals SET {', '.join(fields)} WHERE id=? AND user_id=?", tuple(params))
-    db.commit()
-    row = db.execute("SELECT * FROM goals WHERE id=? AND user_id=?", (goal_id, uid)).fetchone()
+    def write(db):
+        c = dict(changes)
+        if "category" in data:
+            c["category_id"] = categories.intern(db, uid, cat) if cat else None
+        return repository.update_goal(db, uid, goal_id, c)
+
+    row = run_write(write)
     if not row:
         return jsonify(success=False, message="Not found"), 404
-    return jsonify(success=True, goal=enrich_goal(goal_row_to_dict(row)))
+    names = categories.names(get_db(), uid, [row["category_id"]])
+    return jsonify(success=True, goal=enrich_goal(goal_row_to_dict(row, names)))
 
 # -------- Delete goal --------
 @goals_bp.delete("/<int:goal_id>")
 @login_required
 def delete_goal(goal_id: int):
     uid = g.user_id
-    db = get_db()
-    # Clean contributions; ON DELETE CASCADE will also handle if enabled
-    db.execute("DELETE FROM goal_contributions WHERE goal_id=? AND user_id=?", (goal_id, uid))
-    cur = db.execute("DELETE FROM goals WHERE id=? AND user_id=?", (goal_id, uid))
-    db.commit()
-    if cur.rowcount == 0:
+
+    if run_write(lambda db: repository.delete_goal(db, uid, goal_id)) == 0:
         return jsonify(success=False, message="Not found"), 404
     return jsonify(success=True)
 
@@ -229,7 +169,7 @@ def _contribute_common(goal_id: int):
     uid = g.user_id
     data = request.get_json(silent=True) or {}
     try:
-        amount = float(data.get("amount") or 0)
+        amount = to_cents(data.get("amount") or 0)
     except Exception:
         amount = 0
     if amount <= 0:
@@ -245,37 +185,40 @@ def _contribute_common(goal_id: int):
         except Exception:
             created_at = None
 
-    db = get_db()
-    grow = db.execute("SELECT * FROM goals WHERE id=? AND user_id=?", (goal_id, uid)).fetchone()
-    if not grow:
-        return jsonify(success=False, message="Goal not found"), 404
+    def write(db):
+        # the UPDATE doubles as the existence check and returns the new totals
+        row = repository.add_to_goal(db, uid, goal_id, amount)
+        if not row:
+            return None
 
-    db.execute("UPDATE goals SET saved_amount = saved_amount + ? WHERE id=? AND user_id=?", (amount, goal_id, uid))
-    db.execute("""
-        INSERT INTO goal_contributions (user_id, goal_id, amount, note, created_at)
-        VALUES (?,?,?,?,COALESCE(?, datetime('now')))
-    """, (uid, goal_id, amount, note, created_at))
+        repository.insert_contribution(db, uid, goal_id, amount, note, created_at)
 
-    if record_tx:
-        desc = f"Contribution to Goal: {grow['name']}"
-        db.execute("""
-            INSERT INTO transactions (user_id, type, amount, category, description, created_at)
-            VALUES (?,?,?,?,?,COALESCE(?, datetime('now')))
-        """, (uid, "expense", amount, "Savings", desc, created_at))
+        if record_tx:
+            desc = f"Contribution to Goal: {row['name']}"
+            tx_created_at, ts, month = tx_time_fields(created_at)
+            repository.insert_transaction(db, uid, "expense", amount, categories.intern(db, uid, "Savings"),
+                                          desc, tx_created_at, ts, month)
+        return row
 
-    db.commit()
-    row = db.execute("SELECT * FROM goals WHERE id=? AND user_id=?", (goal_id, uid)).fetchone()
-    return jsonify(success=True, goal=enrich_goal(goal_row_to_dict(row)))
+    row = run_write(write)
+    if not row:
+        return jsonify(success=False, message="Goal not found"), 404
+    names = categories.names(get_db(), uid, [row["category_id"]])
+    return jsonify(success=True, goal=enrich_goal(goal_row_to_dict(row, names)))
 
 # -------- Contributions history --------
 @goals_bp.get("/<int:goal_id>/history")
 @login_required
 def history(goal_id: int):
     uid = g.user_id
-    rows = get_db().execute("""
-        SELECT id, amount, note, created_at
-        FROM goal_contributions
-        WHERE user_id=? AND goal_id=?
-        ORDER BY datetime(created_at) DESC
-    """, (uid, goal_id)).fetchall()
-    return jsonify(success=True, contributions=[dict(r) for r in rows])
+    rows = repository.contributions(get_db(), uid, goal_id)
+    if jsonfmt.columnar_requested():
+        return jsonfmt.columnar_response(rows, [
+            ("id", "id", None), ("amount", "amount_cents", from_cents),
+            ("note", "note", None), ("created_at", "created_at", None),
+        ])
+    return jsonify(success=True, contributions=[
+        {"id": r["id"], "amount": from_cents(r["amount_cents"]),
+         "note": r["note"], "created_at": r["created_at"]}
+        for r in rows
+    ])
@@ -1,6 +1,8 @@
 # backend/routes/insights.py
 from flask import Blueprint, jsonify, g
 from ..database import get_db
+from .. import cache, categories, repository
+from ..utils.dates import days_ago_ts
 from .auth import login_required
 
 # All endpoints under /api/insights/*
@@ -9,14 +11,11 @@ insights_bp = Blueprint("insights", __name__, url_prefix="/api/insights")
 @insights_bp.get("/")
 @insights_bp.get("/advice")
 @login_required
+@cache.cached
 def get_insights():
     uid = g.user_id
     db = get_db()
-    rows = db.execute("""
-        SELECT type, amount, IFNULL(category,'Uncategorized') AS category
-        FROM transactions
-        WHERE user_id=? AND date(created_at) >= date('now','-30 day')
-    """, (uid,)).fetchall()
+    rows = repository.totals_since(db, uid, days_ago_ts(30))
 
     if not rows:
         return jsonify(success=True, advice=[{
@@ -24,14 +23,11 @@ def get_insights():
             "text": "Start by logging income and a few expenses. We’ll analyze and tailor advice automatically."
         }])
 
-    income = sum(float(r["amount"]) for r in rows if r["type"] == "income")
-    expense = sum(float(r["amount"]) for r in rows if r["type"] == "expense")
+    # integer cents throughout; only ratios leave this function
+    income = sum(r["amount_cents"] for r in rows if r["type"] == "income")
+    expense = sum(r["amount_cents"] for r in rows if r["type"] == "expense")
 
-    by_cat = {}
-    for r in rows:
-        if r["type"] == "expense":
-            cat = r["category"] or "Uncategorized"
-            by_cat[cat] = by_cat.get(cat, 0.0) + float(r["amount"])
+    by_cat = {r["category_id"]: r["amount_cents"] for r in rows if r["type"] == "expense"}
 
     tips = []
 
@@ -42,8 +38,9 @@ def get_insights():
         })
 
     if by_cat and expense > 0:
-        top_cat = max(by_cat, key=by_cat.get)
-        share = (by_cat[top_cat] / expense) * 100
+        top_id = max(by_cat, key=by_cat.get)
+        share = (by_cat[top_id] / expense) * 100
+        top_cat = categories.names(db, uid, [top_id]).get(top_id)
         tips.append({
             "title": f"High spend in {top_cat}",
             "text": f"{top_cat} accounts for ~{share:.0f}% of your expenses. Set a monthly limit and track it."
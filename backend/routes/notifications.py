@@ -1,49 +1,41 @@
 # backend/routes/notifications.py
 from flask import Blueprint, jsonify, request, g
-from datetime import date, datetime
-from ..database import get_db
+from datetime import datetime
+from ..database import get_db, get_global_db, user_db_path
+from .. import cache, categories, repository
+from ..utils.dates import current_month, today_utc
+from ..utils.money import from_cents
 from .auth import login_required
 from ..utils.mailer import send_email
-import os
+from ..utils.authz import admin_key_ok
 
 # Real prefix so URLs are /api/notifications/...
 notifications_bp = Blueprint("notifications", __name__, url_prefix="/api/notifications")
 
 def _budget_alerts(uid, db):
-    rows = db.execute("""
-        SELECT b.category, b.monthly_limit,
-               IFNULL((
-                 SELECT SUM(amount) FROM transactions t
-                 WHERE t.user_id=b.user_id
-                   AND t.type='expense'
-                   AND t.category=b.category
-                   AND strftime('%Y-%m', t.created_at)=strftime('%Y-%m','now')
-               ), 0) AS spent_mtd
-        FROM budgets b WHERE b.user_id=?
-    """, (uid,)).fetchall()
+    rows = repository.budgets_with_spend(db, uid, current_month())
+    names = categories.names(db, uid, [r["category_id"] for r in rows])
     out = []
     for r in rows:
-        limit = float(r["monthly_limit"] or 0)
-        spent = float(r["spent_mtd"] or 0)
+        category = names.get(r["category_id"])
+        limit = from_cents(r["monthly_limit_cents"])
+        spent = from_cents(r["spent_mtd_cents"])
         pct = spent / limit if limit > 0 else 0.0
         if pct >= 1.0:
-            out.append(f"⚠️ Budget exceeded for {r['category']}: {spent:.2f}/{limit:.2f}.")
+            out.append(f"⚠️ Budget exceeded for {category}: {spent:.2f}/{limit:.2f}.")
         elif pct >= 0.8:
-            out.append(f"🔔 Approaching budget for {r['category']}: {pct*100:.0f}% used.")
+            out.append(f"🔔 Approaching budget for {category}: {pct*100:.0f}% used.")
     return out
 
 def _goal_alerts(uid, db):
-    rows = db.execute(
-        "SELECT id,name,target_amount,saved_amount,target_date,created_at,status "
-        "FROM goals WHERE user_id=? AND status!='archived'", (uid,)
-    ).fetchall()
+    rows = repository.open_goals(db, uid)
     alerts = []
-    today = date.today()
+    today = today_utc()
     for g in rows:
         if g["status"] == "achieved":
             continue
-        target = float(g["target_amount"] or 0)
-        saved  = float(g["saved_amount"] or 0)
+        target = from_cents(g["target_amount_cents"])
+        saved  = from_cents(g["saved_amount_cents"])
         tgt = g["target_date"]
 
         if tgt:
@@ -83,6 +75,7 @@ def _digest_for_user(uid, db):
 # ---- PREVIEW / CHECK ----
 @notifications_bp.get("/preview")
 @login_required
+@cache.cached
 def preview():
     db = get_db()
     alerts = _digest_for_user(g.user_id, db)
@@ -102,7 +95,7 @@ def send_to_me():
     alerts = _digest_for_user(g.user_id, db)
     if not alerts:
         return jsonify(success=True, sent=False, message="No alerts.")
-    user = db.execute("SELECT name,email FROM users WHERE id=?", (g.user_id,)).fetchone()
+    user = repository.user_by_id(get_global_db(), g.user_id)
     html = "<h3>Your MoneyMate alerts</h3><ul>" + "".join(f"<li>{a}</li>" for a in alerts) + "</ul>"
     ok = send_email(user["email"], "Your MoneyMate alerts", html)
     return jsonify(success=ok, sent=ok, count=len(alerts))
@@ -110,14 +103,12 @@ def send_to_me():
 # Optional: admin cron (no auth; guarded by API key)
 @notifications_bp.route("/run-all", methods=["POST"])
 def run_all():
-    key = request.args.get("key") or request.headers.get("X-API-Key")
-    if key != os.getenv("ADMIN_API_KEY", "dev-key"):
+    if not admin_key_ok():
         return jsonify(success=False), 403
-    db = get_db()
-    users = db.execute("SELECT id,name,email FROM users").fetchall()
+    users = repository.all_users(get_global_db())
     delivered = 0
     for u in users:
-        alerts = _digest_for_user(u["id"], db)
+        alerts = _digest_for_user(u["id"], get_db(user_db_path(u["id"])))
         if not alerts:
             continue
         html = "<h3>Your MoneyMate alerts</h3><ul>" + "".join(f"<li>{a}</li>" for a in alerts) + "</ul>"
@@ -147,7 +138,7 @@ def notify_dispatch():
     alerts = _digest_for_user(g.user_id, db)
     if not alerts:
         return jsonify(success=True, sent=False, message="No alerts.")
-    user = db.execute("SELECT name,email FROM users WHERE id=?", (g.user_id,)).fetchone()
+    user = repository.user_by_id(get_global_db(), g.user_id)
     html = "<h3>Your MoneyMate alerts</h3><ul>" + "".join(f"<li>{a}</li>" for a in alerts) + "</ul>"
     ok = send_email(user["email"], "Your MoneyMate alerts", html)
     return jsonify(success=ok, sent=ok, count=len(alerts))
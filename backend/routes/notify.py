@@ -1,69 +1,44 @@
 # backend/routes/notify.py
 from flask import Blueprint, request, jsonify, session, current_app
-from ..database import get_db
+from ..database import get_db, get_global_db
+from .. import categories, repository
+from ..utils.dates import current_month, today_utc
+from ..utils.money import from_cents
 from .auth import login_required
-from .budgets import ensure_schema as ensure_budgets_schema
-from .goals import ensure_schema as ensure_goals_schema
 from ..utils.mailer import send_email
 import os
 
 notify_bp = Blueprint("notify", __name__)
 
-@notify_bp.before_app_request
-def _ensure():
-    # make sure budgets/goals tables exist
-    ensure_budgets_schema()
-    ensure_goals_schema()
-
 def _budget_alerts(uid):
     db = get_db()
-    rows = db.execute("""
-        SELECT b.category, b.monthly_limit,
-               IFNULL((
-                 SELECT SUM(amount) FROM transactions t
-                 WHERE t.user_id=b.user_id AND t.type='expense'
-                   AND t.category=b.category
-                   AND strftime('%Y-%m', t.created_at)=strftime('%Y-%m', 'now')
-               ), 0) AS spent_mtd
-        FROM budgets b WHERE b.user_id=?
-    """, (uid,)).fetchall()
+    rows = repository.budgets_with_spend(db, uid, current_month())
 
     # thresholds (use Settings if present)
-    st = db.execute("""
-        CREATE TABLE IF NOT EXISTS user_settings(
-            user_id INTEGER PRIMARY KEY,
-            currency_symbol TEXT DEFAULT '$',
-            warn_threshold REAL DEFAULT 0.8,
-            critical_threshold REAL DEFAULT 1.0
-        )
-    """)
-    db.commit()
-    s = get_db().execute("SELECT warn_threshold, critical_threshold FROM user_settings WHERE user_id=?",
-                         (uid,)).fetchone()
+    s = repository.get_settings(db, uid)
     warn = s["warn_threshold"] if s else 0.8
     crit = s["critical_threshold"] if s else 1.0
 
+    names = categories.names(db, uid, [r["category_id"] for r in rows])
     alerts = []
     for r in rows:
-        pct = (r["spent_mtd"]/r["monthly_limit"]) if r["monthly_limit"] else 0
+        category = names.get(r["category_id"])
+        limit, spent = from_cents(r["monthly_limit_cents"]), from_cents(r["spent_mtd_cents"])
+        pct = (spent/limit) if limit else 0
         if pct >= crit:
-            alerts.append(f"Budget exceeded for {r['category']} (spent {r['spent_mtd']:.2f} / {r['monthly_limit']:.2f}).")
+            alerts.append(f"Budget exceeded for {category} (spent {spent:.2f} / {limit:.2f}).")
         elif pct >= warn:
-            alerts.append(f"Approaching budget for {r['category']} ({pct*100:.0f}% used).")
+            alerts.append(f"Approaching budget for {category} ({pct*100:.0f}% used).")
     return alerts
 
 def _goal_reminders(uid):
     # 'behind schedule' — still not hit target and past today or <10 days left
-    rows = get_db().execute("""
-        SELECT name, target_amount, saved_amount,
-               target_date
-        FROM goals WHERE user_id=? AND status='active'
-    """, (uid,)).fetchall()
-    from datetime import date, datetime
+    rows = [r for r in repository.open_goals(get_db(), uid) if r["status"] == "active"]
+    from datetime import datetime
     notes = []
     for r in rows:
-        target = float(r["target_amount"] or 0)
-        saved  = float(r["saved_amount"] or 0)
+        target = from_cents(r["target_amount_cents"])
+        saved  = from_cents(r["saved_amount_cents"])
         left = max(0.0, target - saved)
         tgt = r["target_date"]
         if not tgt:
@@ -72,7 +47,7 @@ def _goal_reminders(uid):
             d = datetime.fromisoformat(tgt).date()
         except Exception:
             continue
-        days_left = (d - date.today()).days
+        days_left = (d - today_utc()).days
         if target > 0 and days_left <= 10 and left > 0:
             per_day = left / max(1, days_left)
             notes.append(f"Goal '{r['name']}' is {days_left} day(s) away. You need ~{per_day:.2f}/day to hit {target:.2f}.")
@@ -93,7 +68,7 @@ def check():
 def dispatch():
     # Send email with current alerts/goals
     uid = session["user_id"]
-    u = get_db().execute("SELECT email, name FROM users WHERE id=?", (uid,)).fetchone()
+    u = repository.user_by_id(get_global_db(), uid)
     if not u: 
         return jsonify(success=False, message="User not found"), 404
 
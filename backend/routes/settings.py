@@ -1,43 +1,26 @@
 # backend/routes/settings.py
 from flask import Blueprint, request, jsonify, session
-from ..database import get_db
+from ..database import get_db, run_write
+from .. import repository
 from .auth import login_required
 
 # All endpoints under /api/settings/*
 settings_bp = Blueprint("settings", __name__, url_prefix="/api/settings")
 
-def ensure_schema():
-    db = get_db()
-    db.execute("""
-        CREATE TABLE IF NOT EXISTS user_settings (
-            user_id INTEGER PRIMARY KEY,
-            currency_symbol TEXT NOT NULL DEFAULT '$',
-            warn_threshold REAL NOT NULL DEFAULT 0.8,
-            critical_threshold REAL NOT NULL DEFAULT 1.0,
-            week_starts_monday INTEGER NOT NULL DEFAULT 0
-        )
-    """)
-    db.commit()
-
-@settings_bp.before_app_request
-def before_any():
-    ensure_schema()
-
-def get_or_create(uid: int):
-    db = get_db()
-    row = db.execute("SELECT * FROM user_settings WHERE user_id=?", (uid,)).fetchone()
-    if not row:
-        db.execute("INSERT INTO user_settings(user_id) VALUES(?)", (uid,))
-        db.commit()
-        row = db.execute("SELECT * FROM user_settings WHERE user_id=?", (uid,)).fetchone()
-    return row
+def settings_row_to_dict(r) -> dict:
+    d = dict(r)
+    # RETURNING reports REAL columns before affinity is applied (1.0 comes back as 1)
+    for k in ("warn_threshold", "critical_threshold"):
+        d[k] = float(d[k])
+    return d
 
 # GET /api/settings/
 @settings_bp.get("/")
 @login_required
 def read_settings():
-    row = get_or_create(session["user_id"])
-    return jsonify(success=True, settings=dict(row))
+    # read-only: users who never saved get the defaults; the row is created on first POST
+    row = repository.settings_or_defaults(get_db(), session["user_id"])
+    return jsonify(success=True, settings=settings_row_to_dict(row))
 
 # POST /api/settings/
 @settings_bp.post("/")
@@ -59,16 +42,6 @@ def update_settings():
     warn = max(0.5, min(warn, 1.5))
     crit = max(0.6, min(crit, 2.0))
 
-    db = get_db()
-    db.execute("""
-        INSERT INTO user_settings(user_id, currency_symbol, warn_threshold, critical_threshold, week_starts_monday)
-        VALUES(?,?,?,?,?)
-        ON CONFLICT(user_id) DO UPDATE SET
-          currency_symbol=excluded.currency_symbol,
-          warn_threshold=excluded.warn_threshold,
-          critical_threshold=excluded.critical_threshold,
-          week_starts_monday=excluded.week_starts_monday
-    """, (session["user_id"], sym, warn, crit, week))
-    db.commit()
-    row = db.execute("SELECT * FROM user_settings WHERE user_id=?", (session["user_id"],)).fetchone()
-    return jsonify(success=True, settings=dict(row))
+    uid = session["user_id"]
+    row = run_write(lambda db: repository.save_settings(db, uid, sym, warn, crit, week))
+    return jsonify(success=True, settings=settings_row_to_dict(row))
@@ -1,45 +1,44 @@
 # backend/routes/transactions.py
 from flask import Blueprint, request, jsonify, Response, g
-from datetime import datetime
-from ..database import get_db
+from datetime import datetime, timedelta
+import base64, json
+from contextlib import closing
+from ..database import get_db, run_write, query_budget
+from .. import archive, cache, categories, repository
+from ..rollups import (
+    GRANULARITIES, time_series, bucket_count, totals_by_type, totals_by_category,
+)
+from ..utils.money import to_cents, from_cents, format_cents
+from ..utils.dates import tx_time_fields, day_start_ts, parse_date, today_utc, DAY
+from ..utils import jsonfmt
 from .auth import login_required, get_current_user_id  # uses same JWT/session helper
 
 # All routes live under /api/transactions
 tx_bp = Blueprint("transactions", __name__, url_prefix="/api/transactions")
 
-# ---------- DB bootstrap ----------
-def ensure_schema():
-    db = get_db()
-    db.executescript("""
-        PRAGMA foreign_keys = ON;
-
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT CHECK(type IN ('income','expense')) NOT NULL,
-            amount REAL NOT NULL,
-            category TEXT,
-            description TEXT,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-        );
-
-        -- helpful indexes for speed
-        CREATE INDEX IF NOT EXISTS idx_tx_user ON transactions(user_id);
-        CREATE INDEX IF NOT EXISTS idx_tx_user_date ON transactions(user_id, datetime(created_at));
-        CREATE INDEX IF NOT EXISTS idx_tx_user_type ON transactions(user_id, type);
-        CREATE INDEX IF NOT EXISTS idx_tx_user_cat ON transactions(user_id, category);
-    """)
-    db.commit()
-
-@tx_bp.before_app_request
-def _ensure():
-    ensure_schema()
-
 # Utility: current user id (from JWT or session)
 def _uid():
     return getattr(g, "user_id", None) or get_current_user_id()
 
+MAX_BUCKETS = 1000  # per /timeseries response
+
+def tx_columns(names) -> list:
+    """jsonfmt.columnar spec matching tx_row_to_dict."""
+    return [
+        ("id", "id", None), ("type", "type", None), ("amount", "amount_cents", from_cents),
+        ("category", "category_id", names.get), ("description", "description", None),
+        ("created_at", "created_at", None),
+    ]
+
+def tx_row_to_dict(r, names) -> dict:
+    """Row -> API dict; money leaves the API as float units, category_id as its name."""
+    d = dict(r)
+    if "amount_cents" in d:
+        d["amount"] = from_cents(d.pop("amount_cents"))
+    if "category_id" in d:
+        d["category"] = names.get(d.pop("category_id"))
+    return d
+
 # ---------- auto-categorization ----------
 KEYWORDS = {
     "groceries": ["grocery","supermarket","whole foods","aldi","lidl","shoprite","big c","vinmart","lotte"],
@@ -77,11 +76,10 @@ def create_txn():
     data = request.get_json(silent=True) or {}
 
     tx_type = (data.get("type") or "").lower().strip()
-    raw_amount = str(data.get("amount") or "").replace(",", "").strip()
     try:
-        amount = float(raw_amount)
-    except Exception:
-        amount = 0.0
+        amount = to_cents(data.get("amount") or "")
+    except ValueError:
+        amount = 0
 
     description = (data.get("description") or "").strip()
     created_at = (data.get("created_at") or "").strip()
@@ -90,33 +88,66 @@ def create_txn():
     if tx_type not in ("income", "expense") or amount <= 0:
         return jsonify(ok=False, success=False, message="Invalid transaction payload"), 400
 
-    if created_at:
-        try:
-            # tolerate trailing Z
-            datetime.fromisoformat(created_at.replace("Z", ""))
-        except Exception:
-            created_at = None  # fallback to DB default
+    # missing/invalid created_at falls back to now
+    created_at, ts, month = tx_time_fields(created_at)
 
-    db = get_db()
-    cur = db.execute(
-        """
-        INSERT INTO transactions (user_id, type, amount, category, description, created_at)
-        VALUES (?, ?, ?, ?, ?, COALESCE(?, datetime('now')))
-        """,
-        (uid, tx_type, amount, category or None, description or None, created_at),
-    )
-    db.commit()
-    tid = cur.lastrowid
-    row = db.execute("SELECT * FROM transactions WHERE id=? AND user_id=?", (tid, uid)).fetchone()
-    return jsonify(ok=True, success=True, transaction=dict(row)), 201
+    row = run_write(lambda db: repository.insert_transaction(
+        db, uid, tx_type, amount, categories.intern(db, uid, category), description or None, created_at, ts, month
+    ))
+    return jsonify(ok=True, success=True, transaction=tx_row_to_dict(row, {row["category_id"]: category})), 201
+
+def _ts_range(start, end):
+    """Inclusive start/end dates (YYYY-MM-DD) -> sargable [lo, hi) ts bounds (None = open)."""
+    lo = hi = None
+    if start:
+        lo = day_start_ts(start)
+        if lo is None:
+            raise ValueError("start_date must be YYYY-MM-DD")
+    if end:
+        hi = day_start_ts(end)
+        if hi is None:
+            raise ValueError("end_date must be YYYY-MM-DD")
+        hi += DAY
+    return lo, hi
 
 # ---------- list ----------
+# Keyset pagination: each sort has an index on (user_id, <key>) and the rowid
+# breaks ties, so every page is one index range scan of page_size rows.
+SORTS = {
+    # name: (key column, default order)
+    "date": ("ts", "desc"),
+    "amount": ("amount_cents", "desc"),
+    "category": ("ts", "asc"),  # category name first, see repository.transactions_page_by_category
+}
+
+def _encode_cursor(sort, order, key, last_id) -> str:
+    raw = json.dumps([sort, order, key, last_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor, sort, order):
+    """-> (key, last_id); raises ValueError if malformed or for another sort."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        c_sort, c_order, key, last_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if (c_sort, c_order) != (sort, order) or not isinstance(last_id, int):
+        raise ValueError("Cursor does not match sort/order")
+    return key, last_id
+
 # Provide both "" and "/all" to avoid breaking older UI calls
 @tx_bp.get("")
 @tx_bp.get("/")
 @tx_bp.get("/all")
 @login_required
+@cache.conditional
 def list_txns():
+    """
+    Query params: start_date, end_date, type, category, page_size (<=1000),
+    sort=date|amount|category, order=asc|desc, cursor=<next_cursor>.
+    Returns next_cursor (null on the last page).
+    ?format=columnar returns {columns, rows} instead of transactions (see utils/jsonfmt.py).
+    """
     uid = _uid()
     if not uid:
         return jsonify(ok=False, success=False, message="Unauthorized"), 401
@@ -134,27 +165,58 @@ def list_txns():
     except Exception:
         page_size = 100
 
-    where, params = ["user_id = ?"], [uid]
-    if ftype in ("income","expense"):
-        where.append("type = ?"); params.append(ftype)
-    if cat:
-        where.append("category = ?"); params.append(cat)
-    if start:
-        where.append("date(created_at) >= date(?)"); params.append(start)
-    if end:
-        where.append("date(created_at) <= date(?)"); params.append(end)
-
-    sql = f"""
-        SELECT id, type, amount, category, description, created_at
-        FROM transactions
-        WHERE {' AND '.join(where)}
-        ORDER BY datetime(created_at) DESC
-        LIMIT ?
-    """
-    params.append(page_size)
+    sort = (request.args.get("sort") or "date").lower()
+    if sort not in SORTS:
+        return jsonify(ok=False, success=False, message="sort must be date, amount or category"), 400
+    key, order = SORTS[sort]
+    order = (request.args.get("order") or order).lower()
+    if order not in ("asc", "desc"):
+        return jsonify(ok=False, success=False, message="order must be asc or desc"), 400
 
-    rows = get_db().execute(sql, tuple(params)).fetchall()
-    return jsonify(ok=True, success=True, transactions=[dict(r) for r in rows])
+    db = get_db()
+    filters = {"tx_type": ftype if ftype in ("income", "expense") else None}
+    if cat:
+        filters["category_id"] = categories.lookup(db, uid, cat)
+        if filters["category_id"] is None:
+            if jsonfmt.columnar_requested():
+                return jsonfmt.columnar_response([], tx_columns({}), next_cursor=None)
+            return jsonify(ok=True, success=True, transactions=[], next_cursor=None)
+    limit = page_size + 1  # one extra row tells us if there's a next page
+    try:
+        filters["lo"], filters["hi"] = _ts_range(start, end)
+        cursor = request.args.get("cursor")
+        after = _decode_cursor(cursor, sort, order) if cursor else None
+        if sort == "category":
+            after_name = None
+            if after:
+                try:
+                    (cid, _ts), _id = after
+                    after_name = categories.names(db, uid, [cid])[cid]
+                except (TypeError, ValueError, KeyError):
+                    raise ValueError("Invalid cursor")
+            rows = repository.transactions_page_by_category(db, uid, order, limit, after, after_name, **filters)
+        else:
+            rows = repository.transactions_page(db, uid, key, order, limit, after, **filters)
+    except ValueError as e:
+        return jsonify(ok=False, success=False, message=str(e)), 400
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        key = [last["category_id"], last["sort_key"]] if sort == "category" else last["sort_key"]
+        next_cursor = _encode_cursor(sort, order, key, last["id"])
+
+    names = categories.names(db, uid, [r["category_id"] for r in rows])
+    if jsonfmt.columnar_requested():
+        return jsonfmt.columnar_response(rows, tx_columns(names), next_cursor=next_cursor)
+    items = []
+    for r in rows:
+        item = tx_row_to_dict(r, names)
+        item.pop("sort_key")
+        item.pop("sort_name", None)
+        items.append(item)
+    return jsonify(ok=True, success=True, transactions=items, next_cursor=next_cursor)
 
 # ---------- update ----------
 @tx_bp.patch("/<int:txn_id>")
@@ -165,43 +227,34 @@ def update_txn(txn_id: int):
         return jsonify(ok=False, success=False, message="Unauthorized"), 401
 
     data = request.get_json(silent=True) or {}
-    fields, params = [], []
+    changes = {}
+    cat_name = None   # interned inside the write
+    auto_desc = None  # description to auto-categorize from, once the row's type is known
 
     if "type" in data:
         t = (data.get("type") or "").lower().strip()
         if t not in ("income","expense"):
             return jsonify(ok=False, success=False, message="Invalid type"), 400
-        fields.append("type=?"); params.append(t)
+        changes["type"] = t
 
     if "amount" in data:
         try:
-            amt = float(str(data.get("amount")).replace(",", "").strip())
+            amt = to_cents(data.get("amount"))
             assert amt > 0
         except Exception:
             return jsonify(ok=False, success=False, message="Invalid amount"), 400
-        fields.append("amount=?"); params.append(amt)
+        changes["amount_cents"] = amt
 
     if "description" in data:
         desc = (data.get("description") or "").strip()
-        fields.append("description=?"); params.append(desc)
+        changes["description"] = desc
         # If client didn't send category but did send/has type, auto-update category from desc
         if "category" not in data:
-            # prefer new type if provided in this patch, else keep existing
-            new_type = None
-            for i, f in enumerate(fields):
-                if f == "type=?":
-                    new_type = params[i]
-                    break
-            if not new_type:
-                # get existing type
-                cur = get_db().execute("SELECT type FROM transactions WHERE id=? AND user_id=?", (txn_id, uid)).fetchone()
-                new_type = (cur["type"] if cur else "").lower()
-            if new_type in ("income","expense"):
-                fields.append("category=?"); params.append(auto_category(new_type, desc))
+            auto_desc = desc
 
     if "category" in data:
-        cat = (data.get("category") or "").strip() or None
-        fields.append("category=?"); params.append(cat)
+        # blank -> Uncategorized, the bucket NULL categories were always reported under
+        cat_name = data.get("category") or ""
 
     if "created_at" in data and data["created_at"]:
         # accept ISO or fallback
@@ -209,26 +262,29 @@ def update_txn(txn_id: int):
             datetime.fromisoformat(str(data["created_at"]).replace("Z",""))
         except Exception:
             return jsonify(ok=False, success=False, message="created_at must be ISO 8601"), 400
-        fields.append("created_at=?"); params.append(data["created_at"])
+        created_at, ts, month = tx_time_fields(data["created_at"])
+        changes.update(created_at=created_at, ts=ts, month=month)
 
-    if not fields:
+    if not changes and cat_name is None:
         return jsonify(ok=False, success=False, message="No changes"), 400
 
-    params.extend([txn_id, uid])
-    db = get_db()
-    db.execute(
-        f"UPDATE transactions SET {', '.join(fields)} WHERE id=? AND user_id=?",
-        tuple(params),
-    )
-    db.commit()
+    def write(wdb):
+        archive.restore(wdb, uid, txn_id)  # archived rows are edited in the hot table
+        c, name = dict(changes), cat_name
+        if auto_desc is not None:
+            # prefer new type if provided in this patch, else keep existing
+            new_type = c.get("type") or (repository.transaction_type(wdb, uid, txn_id) or "").lower()
+            if new_type in ("income","expense"):
+                name = auto_category(new_type, auto_desc)
+        if name is not None:
+            c["category_id"] = categories.intern(wdb, uid, name)
+        return repository.update_transaction(wdb, uid, txn_id, c)
 
-    row = db.execute(
-        "SELECT * FROM transactions WHERE id=? AND user_id=?",
-        (txn_id, uid)
-    ).fetchone()
+    row = run_write(write)
     if not row:
         return jsonify(ok=False, success=False, message="Not found"), 404
-    return jsonify(ok=True, success=True, transaction=dict(row))
+    names = categories.names(get_db(), uid, [row["category_id"]])
+    return jsonify(ok=True, success=True, transaction=tx_row_to_dict(row, names))
 
 # ---------- delete ----------
 @tx_bp.delete("/<int:txn_id>")
@@ -237,20 +293,28 @@ def delete_txn(txn_id: int):
     uid = _uid()
     if not uid:
         return jsonify(ok=False, success=False, message="Unauthorized"), 401
-    db = get_db()
-    cur = db.execute("DELETE FROM transactions WHERE id=? AND user_id=?", (txn_id, uid))
-    db.commit()
-    if cur.rowcount == 0:
+
+    def delete(db):
+        restored = archive.restore(db, uid, txn_id)  # archived rows are deleted from the hot table
+        deleted = repository.delete_transaction(db, uid, txn_id)
+        if restored and deleted:
+            archive.forget(db, txn_id)
+        return deleted
+
+    deleted = run_write(delete)
+    if deleted == 0:
         return jsonify(ok=False, success=False, message="Not found"), 404
     return jsonify(ok=True, success=True)
 
 # ---------- CSV export ----------
 @tx_bp.get("/export")
 @login_required
+@query_budget(30000)
 def export_csv():
     """
     Export user's transactions within optional date range as CSV.
     Query params: start_date=YYYY-MM-DD, end_date=YYYY-MM-DD
+    ?format=columnar returns the same rows as columnar JSON (see utils/jsonfmt.py).
     """
     import csv, io
     uid = _uid()
@@ -260,18 +324,18 @@ def export_csv():
     start = request.args.get("start_date")
     end   = request.args.get("end_date")
 
-    sql = """
-        SELECT id, type, amount, category, description, created_at
-        FROM transactions WHERE user_id=?
-    """
-    params = [uid]
-    if start:
-        sql += " AND date(created_at) >= date(?)"; params.append(start)
-    if end:
-        sql += " AND date(created_at) <= date(?)"; params.append(end)
-    sql += " ORDER BY datetime(created_at) DESC"
+    try:
+        lo, hi = _ts_range(start, end)
+    except ValueError as e:
+        return jsonify(ok=False, success=False, message=str(e)), 400
 
-    rows = get_db().execute(sql, tuple(params)).fetchall()
+    db = get_db()
+    rows = repository.export_transactions(db, uid, lo, hi)
+    names = categories.names(db, uid, {r["category_id"] for r in rows})
+    if jsonfmt.columnar_requested():
+        resp = jsonfmt.columnar_response(rows, tx_columns(names))
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
 
     output = io.StringIO()
     writer = csv.writer(output)
@@ -280,8 +344,8 @@ def export_csv():
         writer.writerow([
             (r["created_at"] or "")[:19].replace("T"," "),
             r["type"],
-            f'{float(r["amount"]):.2f}',
-            r["category"] or "",
+            format_cents(r["amount_cents"]),
+            names.get(r["category_id"]) or "",
             r["description"] or "",
         ])
     csv_data = output.getvalue()
@@ -298,6 +362,7 @@ def export_csv():
 # ---------- CSV import ----------
 @tx_bp.post("/import")
 @login_required
+@query_budget(30000)
 def import_csv():
     """
     Import CSV of transactions. Accepts:
@@ -335,9 +400,8 @@ def import_csv():
                 return row[n]
         return ""
 
-    created = skipped = 0
-    db = get_db()
-
+    skipped = 0
+    parsed = []
     for row in reader:
         r = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
 
@@ -348,88 +412,107 @@ def import_csv():
         desc     = pick(r, ["description","memo","note"])
 
         try:
-            amount = float(str(amount_s).replace(",", ""))
-        except Exception:
+            amount = to_cents(amount_s)
+        except ValueError:
             skipped += 1; continue
         if tx_type not in ("income","expense"):
             skipped += 1; continue
 
         cat = category or auto_category(tx_type, desc)
-
-        # duplicate guard: same minute + type + amount + description
-        dup = db.execute("""
-            SELECT id FROM transactions
-            WHERE user_id=? AND type=? AND ABS(amount-?)<0.0001
-              AND IFNULL(description,'')=?
-              AND substr(created_at,1,16)=substr(?,1,16)
-            LIMIT 1
-        """, (uid, tx_type, amount, desc, date_str)).fetchone()
-
-        if dup:
-            skipped += 1
-            continue
-
-        db.execute("""
-            INSERT INTO transactions (user_id, type, amount, category, description, created_at)
-            VALUES (?, ?, ?, ?, ?, COALESCE(?, datetime('now')))
-        """, (uid, tx_type, amount, cat, desc, date_str))
-        created += 1
-
-    db.commit()
-    return jsonify(ok=True, success=True, created=created, skipped=skipped)
+        created_at, ts, month = tx_time_fields(date_str)
+        parsed.append((tx_type, amount, cat, desc, created_at, ts, month))
+
+    # rows old enough to collide with archived ones are checked against the archive up front
+    archived_dups = 0
+    wm = archive.archived_before(get_db())
+    if wm and any(p[5] - p[5] % 60 < wm for p in parsed):
+        cold = archive.cold(get_db())
+        if cold is not None:
+            with closing(cold):
+                fresh = [p for p in parsed if not (
+                    p[5] - p[5] % 60 < wm and repository.has_duplicate(cold, uid, p[0], p[1], p[3], p[5])
+                )]
+            archived_dups, parsed = len(parsed) - len(fresh), fresh
+
+    def write(db):
+        created, dups = 0, archived_dups
+        cat_ids = {}  # name -> id for this upload
+        for tx_type, amount, cat, desc, created_at, ts, month in parsed:
+            if repository.has_duplicate(db, uid, tx_type, amount, desc, ts):
+                dups += 1
+                continue
+
+            if cat not in cat_ids:
+                cat_ids[cat] = categories.intern(db, uid, cat)
+            repository.insert_transaction(db, uid, tx_type, amount, cat_ids[cat], desc, created_at, ts, month)
+            created += 1
+        return created, dups
+
+    created, dups = run_write(write)
+    return jsonify(ok=True, success=True, created=created, skipped=skipped + dups)
 
 # ---------- summary ----------
 @tx_bp.get("/summary")
 @login_required
+@cache.conditional
+@cache.cached
+@query_budget(5000)
 def summary():
     """
     Returns totals by type, totals by category, and last 14 days daily breakdown.
+    All three are answered from the rollup tables.
     """
     uid = _uid()
     if not uid:
         return jsonify(ok=False, success=False, message="Unauthorized"), 401
 
     db = get_db()
-    # totals by type
-    totals = db.execute("""
-        SELECT type, ROUND(SUM(amount),2) as total
-        FROM transactions
-        WHERE user_id=?
-        GROUP BY type
-    """, (uid,)).fetchall()
-
-    # totals by category
-    cats = db.execute("""
-        SELECT COALESCE(category,'Uncategorized') as category, ROUND(SUM(amount),2) as total
-        FROM transactions
-        WHERE user_id=?
-        GROUP BY COALESCE(category,'Uncategorized')
-        ORDER BY total DESC
-    """, (uid,)).fetchall()
-
-    # last 14 days daily net (income - expense)
-    daily = db.execute("""
-        WITH days AS (
-            SELECT date('now', '-' || n || ' day') AS d
-            FROM (SELECT 0 n UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4
-                  UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8
-                  UNION ALL SELECT 9 UNION ALL SELECT 10 UNION ALL SELECT 11 UNION ALL SELECT 12
-                  UNION ALL SELECT 13)
-        )
-        SELECT d as date,
-               ROUND(COALESCE(SUM(CASE WHEN t.type='income' THEN t.amount END),0),2) as income,
-               ROUND(COALESCE(SUM(CASE WHEN t.type='expense' THEN t.amount END),0),2) as expense,
-               ROUND(COALESCE(SUM(CASE WHEN t.type='income' THEN t.amount
-                                       WHEN t.type='expense' THEN -t.amount END),0),2) as net
-        FROM days
-        LEFT JOIN transactions t ON date(t.created_at)=d AND t.user_id=?
-        GROUP BY d
-        ORDER BY d ASC
-    """, (uid,)).fetchall()
+    today = today_utc()
+    return jsonify(
+        ok=True, success=True,
+        totals=totals_by_type(db, uid),
+        by_category=totals_by_category(db, uid),
+        daily=time_series(db, uid, today - timedelta(days=13), today, "day"),
+    )
+
+# ---------- time series ----------
+@tx_bp.get("/timeseries")
+@login_required
+def timeseries():
+    """
+    Income/expense/net per bucket.
+    Query params: start_date, end_date (YYYY-MM-DD, inclusive; default last 30 days),
+                  granularity=day|week|month (weeks follow settings.week_starts_monday)
+    """
+    uid = _uid()
+    if not uid:
+        return jsonify(ok=False, success=False, message="Unauthorized"), 401
+
+    granularity = (request.args.get("granularity") or "day").lower()
+    if granularity not in GRANULARITIES:
+        return jsonify(ok=False, success=False, message="granularity must be day, week or month"), 400
+
+    raw_start, raw_end = request.args.get("start_date"), request.args.get("end_date")
+    start, end = parse_date(raw_start), parse_date(raw_end)
+    if (raw_start and start is None) or (raw_end and end is None):
+        return jsonify(ok=False, success=False, message="Dates must be YYYY-MM-DD"), 400
+    end = end or today_utc()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        return jsonify(ok=False, success=False, message="start_date must be on or before end_date"), 400
+
+    db = get_db()
+    st = repository.get_settings(db, uid)
+    monday = bool(st["week_starts_monday"]) if st else False
+    if bucket_count(start, end, granularity, monday) > MAX_BUCKETS:
+        return jsonify(ok=False, success=False,
+                       message=f"Range too large: at most {MAX_BUCKETS} {granularity} buckets"), 400
 
     return jsonify(
         ok=True, success=True,
-        totals={r["type"]: r["total"] for r in totals},
-        by_category=[dict(r) for r in cats],
-        daily=[dict(r) for r in daily],
+        granularity=granularity,
+        start_date=start.isoformat(),
+        end_date=end.isoformat(),
+        week_starts_monday=monday,
+        series=time_series(db, uid, start, end, granularity, monday),
     )
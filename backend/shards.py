@@ -0,0 +1,189 @@
+# backend/shards.py
+"""
+Hash-sharded per-user data.
+
+With DB_SHARDS=N, each user's transactions, categories, budgets, goals,
+goal contributions, settings and rollups live in one of N SQLite files
+picked by database.shard_of(user_id); users and password resets stay in
+the global DB_PATH, which is also shard 0. Every file has the full schema,
+so each shard keeps a stub `users` row per resident user for the per-user
+tables' foreign keys. Auth only ever reads the global row.
+
+Changing N moves users between files. With the app stopped:
+
+    python -m backend.shards rebalance --to 4 [--from 2]
+    DB_SHARDS=4  (then start the app)
+
+Shards can only be added: jump hashing then moves users onto the new
+files only, and each shard's id range (database.SHARD_ID_SPAN) sits above
+the ranges of every shard users arrive from, so moved rows keep their ids.
+"""
+from contextlib import closing
+
+from . import archive
+from .database import SHARDS, _connect, get_db, migrate_all, run_write, shard_of, shard_path
+
+STUB_USER = "INSERT OR IGNORE INTO users(id, name, email, password_hash) VALUES (?, '', ?, '')"
+
+# parents before children (foreign keys); deletes run in reverse
+USER_TABLES = ("categories", "transactions", "budgets", "goals", "goal_contributions", "user_settings")
+ROLLUP_TABLES = ("tx_monthly_rollup", "tx_daily_rollup")
+
+
+def _stub_email(user_id) -> str:
+    return f"user-{user_id}@shard.invalid"  # users.email is UNIQUE NOT NULL
+
+
+def ensure_user(user_id):
+    """Give user_id a stub users row in their shard (no-op on the global file)."""
+    shard = shard_of(user_id)
+    if shard == 0:
+        return
+    path = shard_path(shard)
+    if get_db(path).execute("SELECT 1 FROM users WHERE id=?", (user_id,)).fetchone():
+        return
+    run_write(lambda db: db.execute(STUB_USER, (user_id, _stub_email(user_id))), path)
+
+
+def _clear_user(db, user_id, schema="main"):
+    for table in (*reversed(USER_TABLES), *ROLLUP_TABLES):
+        db.execute(f"DELETE FROM {schema}.{table} WHERE user_id=?", (user_id,))
+
+
+def _attach_archives(db, src_path) -> bool:
+    """Attach the source shard's archive and this shard's (created if needed); False if src has none."""
+    src_archive = archive.archive_file(src_path)
+    if not src_archive.exists():
+        return False
+    db.execute("ATTACH DATABASE ? AS src_archive", (str(src_archive),))
+    db.execute(f"ATTACH DATABASE ? AS {archive.SCHEMA}", (str(archive.archive_path(db)),))
+    for stmt in archive.ARCHIVE_DDL.split(";"):
+        if stmt.strip():
+            db.execute(stmt)
+    return True
+
+
+def copy_user(user_id, src_path, dst_path):
+    """
+    Copy every per-user row of user_id from src into dst in one dst
+    transaction, replacing whatever an interrupted earlier copy left there.
+    Rollups are copied verbatim (they also count archived rows), and dst's
+    archive watermark is raised to cover the copied archive rows.
+    """
+    with closing(_connect(dst_path)) as db:
+        db.isolation_level = None
+        db.execute("ATTACH DATABASE ? AS src", (str(src_path),))
+        has_archive = _attach_archives(db, src_path)
+        db.execute("BEGIN")  # deferred: only the dst files get write-locked
+        try:
+            _clear_user(db, user_id)
+            db.execute(STUB_USER, (user_id, _stub_email(user_id)))
+            for table in USER_TABLES:
+                db.execute(f"INSERT INTO main.{table} SELECT * FROM src.{table} WHERE user_id=?", (user_id,))
+            for table in ROLLUP_TABLES:  # replace what the insert triggers just built
+                db.execute(f"DELETE FROM main.{table} WHERE user_id=?", (user_id,))
+                db.execute(f"INSERT INTO main.{table} SELECT * FROM src.{table} WHERE user_id=?", (user_id,))
+            if has_archive:
+                db.execute(f"DELETE FROM {archive.SCHEMA}.transactions WHERE user_id=?", (user_id,))
+                db.execute(f"""
+                    INSERT INTO {archive.SCHEMA}.transactions
+                    SELECT * FROM src_archive.transactions
+                    WHERE user_id=? AND ts < (SELECT archived_before FROM src.archive_state)
+                      AND id NOT IN (SELECT id FROM src.archive_deleted)
+                """, (user_id,))
+                db.execute("""
+                    UPDATE main.archive_state
+                    SET archived_before = MAX(archived_before, (SELECT archived_before FROM src.archive_state))
+                """)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+
+def purge_user(user_id, path, keep_user=False):
+    """Delete user_id's per-user rows (and archived rows) from one shard."""
+    with closing(_connect(path)) as db:
+        db.isolation_level = None
+        own_archive = archive.archive_path(db)
+        if own_archive.exists():
+            db.execute(f"ATTACH DATABASE ? AS {archive.SCHEMA}", (str(own_archive),))
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            _clear_user(db, user_id)
+            if own_archive.exists():
+                db.execute(f"""
+                    DELETE FROM archive_deleted
+                    WHERE id IN (SELECT id FROM {archive.SCHEMA}.transactions WHERE user_id=?)
+                """, (user_id,))
+                db.execute(f"DELETE FROM {archive.SCHEMA}.transactions WHERE user_id=?", (user_id,))
+            if not keep_user:
+                db.execute("DELETE FROM users WHERE id=?", (user_id,))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+
+def rebalance(to_shards: int, from_shards: int = SHARDS, log=print) -> dict:
+    """
+    Move every user whose shard changes from `from_shards` to `to_shards`
+    files. Each move is copy (dst commit), then purge (src commit), journaled
+    in shard_moves so a rerun after a crash resumes where it stopped: a crash
+    mid-move leaves the user's data intact in src.
+    """
+    if to_shards < from_shards:
+        raise ValueError("shards can only be added (jump hashing moves users onto new files only)")
+    migrate_all(to_shards)
+    moved = 0
+    with closing(_connect(shard_path(0))) as gdb:
+        gdb.isolation_level = None
+        journal = {r["user_id"]: r for r in gdb.execute("SELECT * FROM shard_moves").fetchall()}
+        for (user_id,) in gdb.execute("SELECT id FROM users ORDER BY id").fetchall():
+            src, dst = shard_of(user_id, from_shards), shard_of(user_id, to_shards)
+            if src == dst:
+                continue
+            j = journal.get(user_id)
+            state = j["state"] if j and (j["from_shards"], j["to_shards"]) == (from_shards, to_shards) else None
+            if state == "done":
+                continue
+            if state != "copied":
+                copy_user(user_id, shard_path(src), shard_path(dst))
+                gdb.execute("""
+                    INSERT INTO shard_moves(user_id, from_shards, to_shards, state) VALUES (?, ?, ?, 'copied')
+                    ON CONFLICT(user_id) DO UPDATE SET from_shards=excluded.from_shards,
+                        to_shards=excluded.to_shards, state='copied', updated_at=datetime('now')
+                """, (user_id, from_shards, to_shards))
+            purge_user(user_id, shard_path(src), keep_user=(src == 0))
+            gdb.execute("UPDATE shard_moves SET state='done', updated_at=datetime('now') WHERE user_id=?",
+                        (user_id,))
+            moved += 1
+            log(f"[DB] user {user_id}: shard {src} -> {dst}")
+    return {"from_shards": from_shards, "to_shards": to_shards, "moved": moved}
+
+
+def distribution(shards: int = SHARDS) -> dict:
+    """Users per shard for a given shard count (from the global users table)."""
+    counts = {i: 0 for i in range(shards)}
+    with closing(_connect(shard_path(0))) as gdb:
+        for (user_id,) in gdb.execute("SELECT id FROM users").fetchall():
+            counts[shard_of(user_id, shards)] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="MoneyMate shard tools.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rb = sub.add_parser("rebalance", help="move users after changing the shard count (app stopped)")
+    rb.add_argument("--to", type=int, required=True, dest="to_shards")
+    rb.add_argument("--from", type=int, default=SHARDS, dest="from_shards")
+    st = sub.add_parser("status", help="users per shard")
+    st.add_argument("--shards", type=int, default=SHARDS)
+    args = ap.parse_args()
+
+    if args.cmd == "rebalance":
+        print(f"[DB] Rebalanced: {rebalance(args.to_shards, args.from_shards)}")
+    else:
+        print(f"[DB] Users per shard: {distribution(args.shards)}")
@@ -1,4 +1,6 @@
 # backend/utils/authz.py
+import hmac
+import os
 import jwt
 from functools import wraps
 from flask import request, jsonify, current_app, g
@@ -17,3 +19,23 @@ def require_jwt(f):
             return jsonify({"ok": False, "error": "Invalid or expired token"}), 401
         return f(*args, **kwargs)
     return wrapper
+
+def admin_key_ok() -> bool:
+    """True if the request carries ADMIN_API_KEY. Always False while it is unset."""
+    expected = os.getenv("ADMIN_API_KEY", "")
+    key = request.args.get("key") or request.headers.get("X-API-Key") or ""
+    return bool(expected) and hmac.compare_digest(key.encode(), expected.encode())
+
+def require_admin_key(f):
+    """
+    Guard ops endpoints with ADMIN_API_KEY (?key=... or X-API-Key header).
+    There is no default key: with ADMIN_API_KEY unset these endpoints are off.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not os.getenv("ADMIN_API_KEY"):
+            return jsonify({"ok": False, "error": "Admin API disabled: ADMIN_API_KEY is not set"}), 403
+        if not admin_key_ok():
+            return jsonify({"ok": False, "error": "Forbidden"}), 403
+        return f(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,67 @@
+# backend/utils/dates.py
+"""
+Canonical transaction timestamps.
+
+`transactions.created_at` keeps whatever ISO string the client sent; the
+indexed `ts` (UTC epoch seconds) and `month` (yyyymm) columns are derived
+from it on every write so date filters can be plain range predicates on
+(user_id, ts). Naive timestamps are treated as UTC, like SQLite's date().
+"""
+from datetime import datetime, date, timedelta, timezone
+
+DAY = 86400
+
+
+def parse_datetime(value):
+    """ISO 8601 string (tolerates trailing Z) -> aware UTC datetime, or None."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def parse_date(value):
+    """'YYYY-MM-DD' (or any ISO datetime) -> UTC date, or None."""
+    dt = parse_datetime(value)
+    return dt.date() if dt else None
+
+
+def tx_time_fields(created_at=None):
+    """
+    -> (created_at, ts, month) for a transaction write.
+    Missing or unparseable input falls back to "now", like the DB default.
+    """
+    dt = parse_datetime(created_at)
+    if dt is None:
+        dt = datetime.now(timezone.utc).replace(microsecond=0)
+        created_at = dt.strftime("%Y-%m-%d %H:%M:%S")
+    return created_at, int(dt.timestamp()), dt.year * 100 + dt.month
+
+
+def day_start_ts(value):
+    """'YYYY-MM-DD' (or any ISO datetime) -> epoch of that UTC day's 00:00, or None."""
+    dt = parse_datetime(value)
+    if dt is None:
+        return None
+    return int(datetime(dt.year, dt.month, dt.day, tzinfo=timezone.utc).timestamp())
+
+
+def today_utc() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def days_ago_ts(n: int) -> int:
+    """Epoch of UTC midnight `n` days ago (same as date('now','-n day'))."""
+    d = today_utc() - timedelta(days=n)
+    return int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp())
+
+
+def current_month() -> int:
+    """yyyymm key of the current UTC month (matches transactions.month)."""
+    d = today_utc()
+    return d.year * 100 + d.month
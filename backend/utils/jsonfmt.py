@@ -0,0 +1,61 @@
+# backend/utils/jsonfmt.py
+"""
+Compact columnar JSON for the big list reads.
+
+A client opts in with ?format=columnar or `Accept: application/vnd.moneymate.columnar+json`
+and gets {"ok": true, "columns": [...], "rows": [[...], ...]} instead of a
+list of objects: each key is sent once, and rows are built straight from
+the sqlite3.Row tuples instead of going through dicts.
+
+These responses are encoded with orjson when it is installed, stdlib json
+otherwise; JSON_ENCODER=json|orjson forces one.
+"""
+import json
+import os
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+COLUMNAR_MIMETYPE = "application/vnd.moneymate.columnar+json"
+
+
+def _stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+ENCODERS = {"json": _stdlib_dumps}
+if orjson:
+    ENCODERS["orjson"] = orjson.dumps
+
+dumps = ENCODERS.get(os.getenv("JSON_ENCODER", "").lower()) or ENCODERS.get("orjson", _stdlib_dumps)
+
+
+def columnar_requested() -> bool:
+    if request.args.get("format") == "columnar":
+        return True
+    return request.accept_mimetypes.best == COLUMNAR_MIMETYPE
+
+
+def columnar(rows, spec):
+    """
+    spec: [(output name, source column, fn or None)] -> (names, row lists).
+    Source columns are looked up once by position; fn converts the value.
+    """
+    names = [name for name, _, _ in spec]
+    if not rows:
+        return names, []
+    keys = rows[0].keys()
+    plan = [(keys.index(col), fn) for _, col, fn in spec]
+    return names, [[fn(r[i]) if fn else r[i] for i, fn in plan] for r in rows]
+
+
+def columnar_response(rows, spec, status=200, **extra) -> Response:
+    columns, data = columnar(rows, spec)
+    resp = Response(dumps({"ok": True, **extra, "columns": columns, "rows": data}),
+                    status=status, mimetype=COLUMNAR_MIMETYPE)
+    resp.vary.add("Accept")
+    return resp
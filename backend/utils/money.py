@@ -0,0 +1,40 @@
+# backend/utils/money.py
+"""
+Money is stored as integer cents (`*_cents` columns) and converted only at
+the API boundary, so sums, rollups and duplicate checks are exact integer
+operations. Parsing goes through Decimal to avoid float artefacts
+(e.g. "10.15" -> 1015, not 1014).
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Largest amount accepted, in cents (100 billion units). Keeps every stored
+# value - and SUM()s over many of them - well inside SQLite's 64-bit integers.
+MAX_CENTS = 10**13
+
+
+def to_cents(value) -> int:
+    """
+    '1,234.5' / 12.3 / 7 -> integer cents. Raises ValueError if not a finite
+    number or larger in magnitude than MAX_CENTS.
+    """
+    try:
+        d = Decimal(str(value).replace(",", "").strip())
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not d.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    if abs(d) > Decimal(MAX_CENTS) / 100:
+        raise ValueError(f"Amount out of range: {value!r}")
+    return int((d * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents) -> float:
+    """Integer cents -> float units for JSON responses."""
+    return round((cents or 0) / 100, 2)
+
+
+def format_cents(cents) -> str:
+    """Integer cents -> exact '1234.50' string (CSV export)."""
+    cents = cents or 0
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
@@ -46,7 +46,7 @@ export default function DashboardScreen() {
         const headers = { 'Content-Type': 'application/json' };
         if (token) headers.Authorization = `Bearer ${token}`;
 
-        const res = await fetch('http://192.168.50.229:5000/api/transactions', { headers });
+        const res = await fetch('http://192.168.50.229:5000/api/transactions?page_size=20', { headers });
         const payload = res.ok ? await res.json() : null;
         const data = Array.isArray(payload?.transactions)
           ? payload.transactions
@@ -0,0 +1,107 @@
+# tests/test_cache.py
+"""Response cache and ETag coherence through the API: every write path must retire what was served before it (see backend/cache.py)."""
+import pytest
+
+from backend import archive, cache, categories, database, maintenance, repository
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "mm.db")
+    monkeypatch.setattr(maintenance, "ENABLED", False)
+    cache.clear()  # entries are keyed by user id, which every test's fresh file reuses
+    categories.clear_cache()
+    from backend.app import create_app
+
+    app = create_app()
+    c = app.test_client()
+    r = c.post("/api/auth/register", json={"name": "A", "email": "a@x.io", "password": "secret1"})
+    assert r.status_code == 201, r.get_json()
+    assert c.post("/api/auth/login", json={"email": "a@x.io", "password": "secret1"}).status_code == 200
+    c.uid = r.get_json()["user"]["id"]
+    yield c
+    cache.clear()
+    categories.clear_cache()
+
+
+def add(c, amount, created_at=None, **extra):
+    body = {"type": "expense", "amount": amount, "category": "Food", "description": "lunch", **extra}
+    if created_at:
+        body["created_at"] = created_at
+    r = c.post("/api/transactions", json=body)
+    assert r.status_code == 201, r.get_json()
+    return r.get_json()["transaction"]["id"]
+
+
+def version(c):
+    with c.application.app_context():
+        return repository.data_version(database.get_db(), c.uid)
+
+
+def spent(c):
+    r = c.get("/api/transactions/summary")
+    assert r.status_code == 200
+    return r.get_json()["totals"]
+
+
+def misses():
+    return cache.stats()["misses"]
+
+
+def test_api_write_invalidates_cached_response(client):
+    add(client, 5)
+    first = spent(client)
+    before = misses()
+    assert spent(client) == first and misses() == before  # served from the cache
+    add(client, 7)
+    assert spent(client) != first and misses() == before + 1
+
+
+def test_run_write_invalidates_cached_response(client):
+    add(client, 5)
+    first, v = spent(client), version(client)
+    with client.application.app_context():
+        database.run_write(lambda db: db.execute("UPDATE transactions SET amount_cents = 900 WHERE user_id = ?",
+                                                 (client.uid,)), path=database.DB_PATH)
+    assert version(client) > v
+    assert spent(client) != first
+
+
+def test_write_changes_etag(client):
+    add(client, 5)
+    r = client.get("/api/transactions")
+    tag = r.headers["ETag"]
+    assert client.get("/api/transactions", headers={"If-None-Match": tag}).status_code == 304
+    add(client, 7)
+    r = client.get("/api/transactions", headers={"If-None-Match": tag})
+    assert r.status_code == 200 and r.headers["ETag"] != tag
+    assert len(r.get_json()["transactions"]) == 2
+
+
+def test_archive_restore_and_forget_invalidate(client):
+    old = [add(client, 10 + i, created_at=f"2023-0{1 + i}-10T08:00:00") for i in range(3)]
+    add(client, 1)
+    archive.archive_old(database.DB_PATH, days=100)
+
+    for write in (lambda: client.patch(f"/api/transactions/{old[0]}", json={"amount": 99}),  # restore
+                  lambda: client.delete(f"/api/transactions/{old[1]}")):                   # restore + forget
+        first, tag, v = spent(client), client.get("/api/transactions").headers["ETag"], version(client)
+        assert write().status_code == 200
+        assert version(client) > v
+        assert spent(client) != first
+        r = client.get("/api/transactions", headers={"If-None-Match": tag})
+        assert r.status_code == 200 and r.headers["ETag"] != tag
+
+    ids = [t["id"] for t in client.get("/api/transactions").get_json()["transactions"]]
+    assert old[1] not in ids and sorted(ids) == sorted(set(ids))
+
+
+def test_not_modified_keeps_the_clients_coding_tag(client):
+    for i in range(40):  # past COMPRESS_MIN_SIZE
+        add(client, 5 + i, description=f"lunch {i}")
+    r = client.get("/api/transactions", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    tag = r.headers["ETag"]
+    assert tag.endswith('-gzip"')
+    r = client.get("/api/transactions", headers={"Accept-Encoding": "gzip", "If-None-Match": tag})
+    assert r.status_code == 304 and r.headers["ETag"] == tag
@@ -0,0 +1,116 @@
+# tests/test_group_commit.py
+"""Group commit (DB_GROUP_COMMIT=1) on the memory engine: what each caller in a shared batch sees (see database.WriteCoordinator)."""
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pytest
+
+from backend import database
+
+WINDOW_MS = 300  # long enough for every thread in a test to land in one batch
+
+
+@pytest.fixture
+def coord(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "ENGINE", "memory")
+    monkeypatch.setattr(database, "MEMORY", True)
+    monkeypatch.setattr(database, "GROUP_COMMIT", True)
+    path = tmp_path / "gc.db"
+    with closing(database._connect(path)) as db:
+        db.executescript("""
+            CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT NOT NULL);
+            CREATE TABLE parent (id INTEGER PRIMARY KEY);
+            CREATE TABLE child (id INTEGER PRIMARY KEY, parent_id INTEGER NOT NULL REFERENCES parent(id));
+        """)
+    coord = database.WriteCoordinator(path, window_ms=WINDOW_MS)
+    monkeypatch.setattr(database, "_coordinators", {path: coord})  # run_write(fn, path) batches here
+    return coord
+
+
+def rows(coord, sql="SELECT v FROM t"):
+    with closing(database._connect(coord.path)) as db:
+        return sorted(r[0] for r in db.execute(sql))
+
+
+def insert(v):
+    return lambda db: db.execute("INSERT INTO t (v) VALUES (?) RETURNING v", (v,)).fetchone()[0]
+
+
+def together(coord, calls):
+    """Submit every (fn, deadline) from its own thread at once; -> [result or raised exception]."""
+    out = [None] * len(calls)
+    barrier = threading.Barrier(len(calls))
+
+    def run(i, fn, deadline):
+        barrier.wait()
+        try:
+            out[i] = database.run_write(fn, coord.path) if deadline is None else coord.submit(fn, deadline)
+        except Exception as e:
+            out[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, *call)) for i, call in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert coord.stats()["batches"] == 1, coord.stats()
+    return out
+
+
+def test_raising_write_rolls_back_only_its_own_rows(coord):
+    def bad(db):
+        db.execute("INSERT INTO t (v) VALUES ('bad')")
+        raise ValueError("nope")
+
+    out = together(coord, [(insert("a"), None), (bad, None), (insert("b"), None)])
+    assert out[0] == "a" and out[2] == "b"
+    assert isinstance(out[1], ValueError)
+    assert rows(coord) == ["a", "b"]
+
+
+def test_interrupted_write_is_evicted_and_the_rest_commit(coord):
+    def slow(db):
+        db.execute("INSERT INTO t (v) VALUES ('slow')")
+        db.execute("""
+            INSERT INTO t (v)
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 10000000)
+            SELECT 'spin' FROM n
+        """)
+
+    out = together(coord, [(insert("a"), None), (slow, time.monotonic() - 1), (insert("b"), None)])
+    assert out[0] == "a" and out[2] == "b"
+    assert isinstance(out[1], sqlite3.OperationalError) and database.is_query_timeout(out[1])
+    assert rows(coord) == ["a", "b"]  # replayed once without it, not twice
+    assert coord.stats()["failed"] == 1
+
+
+def test_failed_commit_fails_every_caller(coord):
+    def orphan(db):
+        db.execute("PRAGMA defer_foreign_keys=ON")  # the violation surfaces at COMMIT
+        db.execute("INSERT INTO child (parent_id) VALUES (42)")
+
+    out = together(coord, [(insert("a"), None), (orphan, None)])
+    assert all(isinstance(e, sqlite3.IntegrityError) for e in out), out
+    assert rows(coord) == [] and rows(coord, "SELECT id FROM child") == []
+
+
+def test_busy_lock_retries_then_raises(coord, monkeypatch):
+    monkeypatch.setattr(database, "BUSY_TIMEOUT_MS", 10)
+    monkeypatch.setattr(database, "WRITE_RETRIES", 2)
+    monkeypatch.setattr(database, "WRITE_RETRY_BACKOFF_MS", 1.0)
+    assert database.run_write(insert("a"), coord.path) == "a"  # coordinator up, its connection open
+    before = database.lock_metrics.snapshot()
+    with closing(database._connect(coord.path)) as holder:
+        holder.isolation_level = None
+        holder.execute("BEGIN IMMEDIATE")
+        with pytest.raises(database.DatabaseBusy):
+            database.run_write(insert("b"), coord.path)
+        holder.execute("ROLLBACK")
+    after = database.lock_metrics.snapshot()
+    assert after["busy_errors"] - before["busy_errors"] == 3  # first try + WRITE_RETRIES
+    assert after["retries"] - before["retries"] == 2
+    assert after["gave_up"] - before["gave_up"] == 1
+    assert database.run_write(insert("c"), coord.path) == "c"  # lock released: the next batch commits
+    assert rows(coord) == ["a", "c"]
@@ -0,0 +1,11 @@
+# tests/test_query_plans.py
+"""Query-plan regressions (full scans, temp B-tree sorts) fail the build; see backend/plancheck.py."""
+import io
+
+from backend import plancheck
+
+
+def test_query_plans():
+    out = io.StringIO()
+    failures = plancheck.check(out=out)
+    assert failures == 0, "query plan regressions:\n" + out.getvalue()
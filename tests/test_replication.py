@@ -0,0 +1,108 @@
+# tests/test_replication.py
+"""Read replication on one machine: a primary directory shipped into a replica directory (see backend/replication.py)."""
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+from backend import database, replication
+
+
+@pytest.fixture
+def primary(tmp_path, monkeypatch):
+    """A WAL primary at <tmp>/primary/mm.db shipping to <tmp>/ship, applied into <tmp>/replica."""
+    (tmp_path / "primary").mkdir()
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "primary" / "mm.db")
+    monkeypatch.setattr(replication, "REPLICA_DIR", str(tmp_path / "ship"))
+    monkeypatch.setattr(replication, "LOCAL_DIR", str(tmp_path / "replica"))
+    for name in ("_shippers", "_appliers", "_followed"):
+        monkeypatch.setattr(replication, name, {})
+    db = sqlite3.connect(database.DB_PATH, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA wal_autocheckpoint=0")  # as on a shipping primary (database.SHIPS_WAL)
+    db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT NOT NULL)")
+    yield db
+    db.close()
+
+
+def insert(db, n):
+    db.execute("BEGIN")
+    db.executemany("INSERT INTO t (v) VALUES (?)", [("x" * (i % 700),) for i in range(n)])
+    db.execute("COMMIT")
+
+
+def sync():
+    """One ship + apply pass; the replica copy must then match the primary."""
+    replication.ship_once()
+    replication.apply_once()
+    expected = sqlite3.connect(database.DB_PATH).execute("SELECT * FROM t ORDER BY id").fetchall()
+    copy = sqlite3.connect(f"file:{replication.local_dir() / 'mm.db'}?mode=ro", uri=True)
+    try:
+        assert copy.execute("PRAGMA integrity_check").fetchall() == [("ok",)]
+        assert copy.execute("SELECT * FROM t ORDER BY id").fetchall() == expected
+    finally:
+        copy.close()
+
+
+def shipper():
+    return replication._shippers["mm.db"]
+
+
+def test_small_deltas_ship_as_pages(primary):
+    insert(primary, 200)
+    sync()
+    assert shipper().fulls == 1
+    for _ in range(5):
+        insert(primary, 3)
+        primary.execute("UPDATE t SET v = v || 'y' WHERE id % 50 = 0")
+        sync()
+    assert shipper().fulls == 1
+    segments = replication._segments(Path(replication.REPLICA_DIR), "mm.db")
+    assert [segments[seq][1] for seq in sorted(segments)] == [True] + [False] * 5  # full, then pages
+
+
+def test_wal_restart_is_followed(primary):
+    insert(primary, 50)
+    sync()
+    first = shipper().wal
+    for _ in range(3):
+        insert(primary, 20)  # the shipper drained the -wal last pass, so this write starts it over
+        sync()
+    assert shipper().wal[0] == first[0] + 3
+    assert shipper().fulls == 1
+
+
+def test_forced_full_image(primary, monkeypatch):
+    monkeypatch.setattr(replication, "FULL_EVERY", 3)
+    for _ in range(7):
+        insert(primary, 10)
+        sync()
+    assert shipper().fulls == 3
+
+
+def test_foreign_checkpoint_ships_full_image(primary):
+    insert(primary, 300)
+    sync()
+    insert(primary, 50)
+    with sqlite3.connect(database.DB_PATH) as other:  # e.g. a CLI run without DB_REPLICA_DIR
+        other.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    insert(primary, 30)
+    sync()
+    assert shipper().fulls == 2
+
+
+def test_read_path_falls_back_to_primary(primary, monkeypatch):
+    monkeypatch.setattr(replication, "MAX_LAG_MS", 1000)
+    local = replication.local_dir() / "mm.db"
+    insert(primary, 10)
+    sync()
+    assert replication.lag_ms("mm.db") is None  # the heartbeat hasn't been seen to move yet
+    assert replication.read_path(database.DB_PATH) == database.DB_PATH
+    sync()
+    assert replication.lag_ms("mm.db") is not None
+    assert replication.read_path(database.DB_PATH) == local
+
+    replication._followed["mm.db"]["fresh_as_of"] = time.time() - 5
+    assert replication.lag_ms("mm.db") > replication.MAX_LAG_MS
+    assert replication.read_path(database.DB_PATH) == database.DB_PATH